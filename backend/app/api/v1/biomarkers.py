@@ -5,6 +5,7 @@ This module handles biomarker profiles, analysis, annotations, and compound matc
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from pydantic import BaseModel, Field
@@ -12,6 +13,9 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 import json
 
+import numpy as np
+
+from app.core.config import get_settings
 from app.core.security import get_current_active_user, require_clinician, require_researcher
 from app.db.database import get_db
 from app.db.models import (
@@ -134,6 +138,64 @@ def get_biomarker_profile_by_id(db: Session, profile_id: int) -> Optional[Biomar
     return db.query(BiomarkerProfile).filter(BiomarkerProfile.id == profile_id).first()
 
 
+def get_epigenetic_classifier():
+    """Get the cfDNA cancer classifier and its micro-batcher, loaded once per worker."""
+    from app.ml.epigenetic_analysis.serving import get_model_batcher, get_model_server
+
+    settings = get_settings()
+    try:
+        server = get_model_server(settings.EPIGENETIC_MODEL_DIR, settings.EPIGENETIC_COHORT_DIR)
+    except (OSError, ImportError, ValueError, KeyError) as e:
+        # Missing, incomplete or mismatched artifacts (e.g. a model header
+        # without num_bins, or a cohort of another bin count)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Epigenetic classifier unavailable: {e}"
+        )
+    batcher = get_model_batcher(
+        settings.EPIGENETIC_MODEL_DIR, settings.EPIGENETIC_COHORT_DIR,
+        max_batch_size=settings.EPIGENETIC_BATCH_SIZE,
+        max_delay=settings.EPIGENETIC_BATCH_DELAY_MS / 1000
+    )
+    return server, batcher
+
+
+async def score_epigenetic_samples(biomarker_data: Dict[str, Any]) -> List[tuple]:
+    """
+    Score cfDNA samples with the epigenetic classifier.
+
+    ``biomarker_data`` names cohort samples (``sample`` or ``samples``) or
+    carries fragment-end histograms at the model's bin count (``histogram``
+    or ``histograms``). The samples join the classifier's micro-batcher, so
+    concurrent requests share one vectorized forward pass.
+    """
+    # Loading the model on first use blocks, so it runs off the event loop
+    server, batcher = await run_in_threadpool(get_epigenetic_classifier)
+    try:
+        if "samples" in biomarker_data or "sample" in biomarker_data:
+            items = biomarker_data["samples"] if "samples" in biomarker_data else [biomarker_data["sample"]]
+            server.check_samples(items)
+            names = list(items)
+        elif "histograms" in biomarker_data or "histogram" in biomarker_data:
+            items = biomarker_data["histograms"] if "histograms" in biomarker_data else [biomarker_data["histogram"]]
+            # Convert here, so a malformed histogram is rejected with this
+            # request rather than failing inside a shared batch
+            items = [np.asarray(histogram, dtype=np.float64) for histogram in items]
+            if any(histogram.shape != (server.num_bins,) for histogram in items):
+                raise ValueError(f"histograms must have {server.num_bins} bins")
+            names = [f"histogram_{i}" for i in range(len(items))]
+        else:
+            raise ValueError("biomarker_data needs 'sample', 'samples', 'histogram' or 'histograms'")
+        if not items:
+            raise ValueError("no samples to score")
+    except KeyError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    scores = await batcher.submit_many(items)
+    return [(name, float(score)) for name, score in zip(names, scores)]
+
+
 def verify_patient_exists(db: Session, patient_id: int) -> bool:
     """Verify that a patient exists."""
     return db.query(Patient).filter(Patient.id == patient_id).first() is not None
@@ -426,6 +488,9 @@ async def update_biomarker_annotation(
 
 
 # Analysis endpoints
+EPIGENETIC_ANALYSIS_TYPES = {"cancer_detection", "cfdna_classification"}
+
+
 @router.post("/analyze", response_model=BiomarkerAnalysisResponse)
 async def analyze_biomarker_data(
     analysis_request: BiomarkerAnalysisRequest,
@@ -438,15 +503,38 @@ async def analyze_biomarker_data(
     Required role: researcher, clinician, or admin
     
     - **biomarker_data**: Raw biomarker data for analysis
-    - **analysis_type**: Type of analysis (clustering, classification, pathway, etc.)
+    - **analysis_type**: Type of analysis (clustering, classification, pathway, etc.);
+      ``cancer_detection`` scores cfDNA samples with the epigenetic classifier
     - **parameters**: Analysis-specific parameters
     """
-    # This is a placeholder for actual AI/ML analysis
-    # In a real implementation, this would call machine learning models
     import uuid
     
     analysis_id = str(uuid.uuid4())
     
+    if analysis_request.analysis_type in EPIGENETIC_ANALYSIS_TYPES:
+        scores = await score_epigenetic_samples(analysis_request.biomarker_data)
+        threshold = float((analysis_request.parameters or {}).get("threshold", 0.5))
+        samples = [
+            {
+                "sample": name,
+                "cancer_probability": score,
+                "prediction": "cancer" if score >= threshold else "control"
+            }
+            for name, score in scores
+        ]
+        recommendations = [
+            f"{sample['sample']}: cfDNA fragmentation profile consistent with cancer; confirm with diagnostic work-up"
+            for sample in samples if sample["prediction"] == "cancer"
+        ]
+        return BiomarkerAnalysisResponse(
+            analysis_id=analysis_id,
+            status="completed",
+            results={"model": "cfdna_fragmentation", "threshold": threshold, "samples": samples},
+            confidence_score=sum(max(score, 1 - score) for _, score in scores) / len(scores),
+            recommendations=recommendations
+        )
+    
+    # Other analysis types are still placeholders for actual AI/ML analysis
     # Mock analysis results
     mock_results = {
         "pathway_enrichment": [
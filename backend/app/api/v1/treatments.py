@@ -12,6 +12,7 @@ from datetime import datetime, date
 from typing import Optional, List, Dict, Any
 
 from app.core.security import get_current_active_user, require_clinician, require_researcher
+from app.api.v1.biomarkers import score_epigenetic_samples
 from app.db.database import get_db
 from app.db.models import (
     Patient, Treatment, TreatmentStatus, TreatmentOutcome, 
@@ -461,6 +462,20 @@ async def get_ai_treatment_recommendations(
     if request.consider_previous_treatments:
         previous_treatments = get_patient_treatments(db, request.patient_id)
     
+    # Score the profile's cfDNA sample with the epigenetic classifier; concurrent
+    # requests share a forward pass through its micro-batcher
+    cfdna_cancer_probability = None
+    epigenetic_markers = (biomarker_profile.epigenetic_markers or {}) if biomarker_profile else {}
+    cfdna_data = {
+        key: epigenetic_markers[f"cfdna_{key}"] for key in ("sample", "histogram") if f"cfdna_{key}" in epigenetic_markers
+    }
+    if cfdna_data:
+        try:
+            [(_, cfdna_cancer_probability)] = await score_epigenetic_samples(cfdna_data)
+        except HTTPException:
+            # Recommendations do not depend on the classifier being deployed
+            cfdna_cancer_probability = None
+    
     # Mock AI recommendations (in real implementation, this would call ML models)
     import uuid
     
@@ -508,7 +523,8 @@ async def get_ai_treatment_recommendations(
         "pd_l1_expression": 0.80,
         "tumor_mutation_burden": 15.2,
         "brca_status": "BRCA2_mutated",
-        "microsatellite_status": "MSS"
+        "microsatellite_status": "MSS",
+        "cfdna_cancer_probability": cfdna_cancer_probability
     } if biomarker_profile else None
     
     contraindications = [
@@ -70,6 +70,15 @@ class Settings(BaseSettings):
         default="./data/models/patient_stratification.pkl",
         env="PATIENT_STRATIFICATION_MODEL_PATH"
     )
+    EPIGENETIC_MODEL_DIR: str = Field(
+        default="./data/models/epigenetic_classifier",
+        env="EPIGENETIC_MODEL_DIR"
+    )
+    EPIGENETIC_COHORT_DIR: Optional[str] = Field(default=None, env="EPIGENETIC_COHORT_DIR")
+    # Concurrent classifier requests are scored together in batches of up to
+    # EPIGENETIC_BATCH_SIZE samples, waiting at most EPIGENETIC_BATCH_DELAY_MS
+    EPIGENETIC_BATCH_SIZE: int = Field(default=64, env="EPIGENETIC_BATCH_SIZE")
+    EPIGENETIC_BATCH_DELAY_MS: float = Field(default=5.0, env="EPIGENETIC_BATCH_DELAY_MS")
     
     # External API settings
     PUBCHEM_API_URL: str = "https://pubchem.ncbi.nlm.nih.gov/rest/pug"
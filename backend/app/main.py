@@ -159,6 +159,20 @@ async def startup_event():
     print("🚀 MTET Platform API starting up...")
     print(f"📊 Environment: {settings.ENVIRONMENT}")
     print(f"🔒 Security: {'Enabled' if settings.SECRET_KEY else 'Disabled'}")
+
+    # Load the epigenetic classifier now rather than on the first analysis request
+    if os.path.isdir(settings.EPIGENETIC_MODEL_DIR):
+        from fastapi.concurrency import run_in_threadpool
+        from app.ml.epigenetic_analysis.serving import get_model_server
+
+        try:
+            server = await run_in_threadpool(
+                get_model_server, settings.EPIGENETIC_MODEL_DIR, settings.EPIGENETIC_COHORT_DIR
+            )
+            print(f"🧬 Epigenetic classifier: {server}")
+        except Exception as e:
+            # Serve the rest of the API; classifier requests answer 503
+            print(f"⚠️ Epigenetic classifier not loaded: {e}")
     print("✅ Startup completed successfully")
 
 
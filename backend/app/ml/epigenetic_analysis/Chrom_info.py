@@ -1,28 +1,30 @@
-from pyfaidx import Fasta
+from .genome import GenomeAssembly, PRIMARY_CHROMOSOMES
+
+__all__ = ['chromosome_layout']
 
 # Path to the reference genome FASTA file
 fasta_file = "/home/sam/hg38.fa"
 
-# Create a Fasta object with the reference genome FASTA file
-genome = Fasta(fasta_file)
-chromosomes = []
-# List of chromosome names in the reference genome
-for n in range(1,23):
-    chromosomes.append(f'chr{n}')
-chromosomes.append('chrX')
-chromosomes.append('chrY')
-#find the maximal value:
-chroms_max=[]
-chrom_pos=0
-chrom_posit=[]
-# Iterate over the chromosomes and retrieve the maximum base pair position
-for chromosome in chromosomes:
-    chrom_posit.append(chrom_pos)
-    chrom_length = len(genome[chromosome])
-    print(f"'{chromosome}': {chrom_pos},")
-    chrom_pos=chrom_length+chrom_pos
-    chroms_max.append(chrom_length)
-    
-print(f"final length: {chrom_pos}")
-    
-print(f'The maximal value is: {max(chroms_max)}')
\ No newline at end of file
+
+def chromosome_layout(fasta_file=fasta_file, name='hg38'):
+    # Read the chromosome lengths of the reference genome into a genome assembly;
+    # the built-in layouts in genome.py were generated this way and further
+    # assemblies can be added with genome.register_assembly (pyfaidx is only
+    # imported here)
+    return GenomeAssembly.from_fasta(name, fasta_file, PRIMARY_CHROMOSOMES)
+
+
+def main(fasta_file=fasta_file):
+    assembly = chromosome_layout(fasta_file)
+
+    # Print the offset of every chromosome on the linear genome
+    for chromosome, chrom_pos in assembly.chrom_pos().items():
+        print(f"'{chromosome}': {chrom_pos},")
+
+    print(f"final length: {assembly.total_length}")
+
+    print(f'The maximal value is: {assembly.lengths.max()}')
+
+
+if __name__ == '__main__':
+    main()
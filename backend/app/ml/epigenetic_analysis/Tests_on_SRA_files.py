@@ -6,292 +6,227 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import os
-import re
 import gzip
 import io
-import argparse
-import time
-
-
-# In[2]:
-
-
-# Path to the control data file
-f = '/home/sam/sra_files/control_SRR17006224.bed.gz'
-
-# Open and read the compressed file content
-with gzip.open(f, 'rb') as file:
-    file_content = file.read().decode('utf-8')  # Decode the bytes to string
-    
-    # Process the file content and convert it into a DataFrame
-    # Assuming the file content is in a specific format, modify the code accordingly
-    # For example, if the content is a CSV file, you can use pd.read_csv()
-    # If it's in JSON format, you can use pd.read_json(), etc.
-df = pd.read_csv(io.BytesIO(file_content.encode()), delimiter='\t')  # Use BytesIO to read from bytes
-
-# Define the header for the DataFrame
-header = ['chrom', 'read_start', 'read_end', 'name', 'score', 'strand']
-
-# Set DataFrame columns using the defined header
-df.columns = header[:len(df.columns)]
-
-# Sort the DataFrame by 'name' column
-df = df.sort_values('name')
-
-# Print the first few rows of the DataFrame
-print(df.head())
-
-
-# In[3]:
-
-
-# Modify 'name' column by removing trailing '1' or '2' and appending '1'
-df['name'] = df['name'].str.rstrip('12') + '1'
-
-# Calculate 'frag_length' for each group of rows with the same 'name'
-frag_length = df.groupby('name')['read_end'].transform('max') - df.groupby('name')['read_start'].transform('min')
-df['frag_length'] = frag_length
-
-# Print the first few rows of the modified DataFrame
-print(df.head())
-
-
-# In[4]:
-
-
-# Group the DataFrame by 'name' and aggregate values for each group
-df_unique = df.groupby('name', as_index=False).agg({
-    'chrom': 'first',
-    'read_start': 'min',
-    'read_end': 'max',
-    'name': 'first',
-    'score': 'first',
-    'strand': 'first',
-    'frag_length': 'first'
-})
-
-# Sort the unique DataFrame by 'read_start'
-df_unique = df_unique.sort_values('read_start')
-
-# Remove extra information from 'chrom' values
-df_unique["chrom"] = df_unique["chrom"].str.split("_").str.get(0)
-
-# Create a mask for filtering out "chrUn" chromosomes
-mask = df_unique["chrom"].str.startswith("chrUn")
-
-# Exclude rows with "chrUn" chromosomes
-df_unique = df_unique[~mask]
-
-# Print the first few rows of the modified unique DataFrame
-print(df_unique.head())
-
-
-# In[5]:
-
-
-# Filter the unique DataFrame to include only rows with 'frag_length' less than or equal to 1000
-df_unique = df_unique[df_unique.frag_length <= 1000]
-
-# Print the maximum value of 'frag_length'
-print("Maximum frag_length:", df_unique['frag_length'].max())
-
-# Sort the unique DataFrame by 'chrom'
-df_unique = df_unique.sort_values('chrom')
-
-# Print the first few rows of the modified DataFrame
-print(df_unique.head())
-
-
-# In[6]:
-
-
-# Create a dictionary with chromosome positions
-chrom_pos = {
-    'chr1': 0,
-    'chr2': 248956422,
-    'chr3': 491149951,
-    'chr4': 689445510,
-    'chr5': 879660065,
-    'chr6': 1061198324,
-    'chr7': 1232004303,
-    'chr8': 1391350276,
-    'chr9': 1536488912,
-    'chr10': 1674883629,
-    'chr11': 1808681051,
-    'chr12': 1943767673,
-    'chr13': 2077042982,
-    'chr14': 2191407310,
-    'chr15': 2298451028,
-    'chr16': 2400442217,
-    'chr17': 2490780562,
-    'chr18': 2574038003,
-    'chr19': 2654411288,
-    'chr20': 2713028904,
-    'chr21': 2777473071,
-    'chr22': 2824183054,
-    'chrX': 2875001522,
-    'chrY': 3031042417
-}
-
-# Print the dictionary of chromosome positions
-print(chrom_pos)
-
-# Adjust read start and end positions based on chromosome positions
-for key, value in chrom_pos.items():
-    mask = df_unique['chrom'] == key
-    df_unique.loc[mask, 'read_start'] += value
-    df_unique.loc[mask, 'read_end'] += value
-
-# Print the first few rows of the modified DataFrame with adjusted positions
-print(df_unique.head())
-
 
-# In[7]:
+from .genome import get_assembly
+from .coverage import CoveragePyramid
+from .positions import PositionSet
+from .fragmentomics import FragmentSizeProfile
 
 
-# Print rows in df_unique where 'chrom' column is 'chr3'
-print(df_unique[df_unique['chrom'] == 'chr3'])
+def load_fragments(f):
+    # Read the fragments of one BED file into a DataFrame, one row per
+    # deduplicated fragment with its length
 
-# Import necessary library for plotting
-import matplotlib.pyplot as plt
+    # Open and read the compressed file content
+    with gzip.open(f, 'rb') as file:
+        file_content = file.read().decode('utf-8')  # Decode the bytes to string
 
-# Create a histogram of 'frag_length' with specified settings
-df_unique['frag_length'].hist(bins=65, color='#BDE0BD', edgecolor='black', grid=False)
+        # Process the file content and convert it into a DataFrame
+        # Assuming the file content is in a specific format, modify the code accordingly
+        # For example, if the content is a CSV file, you can use pd.read_csv()
+        # If it's in JSON format, you can use pd.read_json(), etc.
+    df = pd.read_csv(io.BytesIO(file_content.encode()), delimiter='\t')  # Use BytesIO to read from bytes
 
-# Set labels and title for the plot
-plt.xlabel('Fragment Length')
-plt.ylabel('Frequency')
-plt.title('Histogram of Fragment Length Per Patient')
+    # Define the header for the DataFrame
+    header = ['chrom', 'read_start', 'read_end', 'name', 'score', 'strand']
 
-# Show the plot
-plt.show()
+    # Set DataFrame columns using the defined header
+    df.columns = header[:len(df.columns)]
 
+    # Sort the DataFrame by 'name' column
+    df = df.sort_values('name')
 
-# In[8]:
+    # Print the first few rows of the DataFrame
+    print(df.head())
 
+    # Modify 'name' column by removing trailing '1' or '2' and appending '1'
+    df['name'] = df['name'].str.rstrip('12') + '1'
 
-# Get unique values from the 'chrom' column
-chromed = df_unique['chrom'].unique()
+    # Calculate 'frag_length' for each group of rows with the same 'name'
+    frag_length = df.groupby('name')['read_end'].transform('max') - df.groupby('name')['read_start'].transform('min')
+    df['frag_length'] = frag_length
 
-# Define maximum indices for adjusting read positions
-max_index = 3088269832
-max_index_adj = 3088358329
+    # Print the first few rows of the modified DataFrame
+    print(df.head())
 
-# Create an array of zeros to represent reads
-zero_reads = np.zeros(max_index_adj, dtype='uint8')
+    # Group the DataFrame by 'name' and aggregate values for each group
+    df_unique = df.groupby('name', as_index=False).agg({
+        'chrom': 'first',
+        'read_start': 'min',
+        'read_end': 'max',
+        'name': 'first',
+        'score': 'first',
+        'strand': 'first',
+        'frag_length': 'first'
+    })
 
-# Convert read start and end positions to numpy arrays
-read_tonump1 = df_unique['read_start'].tolist()
-read_tonump2 = df_unique['read_end'].tolist()
+    # Sort the unique DataFrame by 'read_start'
+    df_unique = df_unique.sort_values('read_start')
 
-# Set appropriate positions to 1 in the zero_reads array
-zero_reads[read_tonump1] = 1
-zero_reads[read_tonump2] = 1
+    # Remove extra information from 'chrom' values
+    df_unique["chrom"] = df_unique["chrom"].str.split("_").str.get(0)
 
-# Assign df_unique to df and sort it by 'read_start'
-df = df_unique
-df = df.sort_values('read_start')
+    # Create a mask for filtering out "chrUn" chromosomes
+    mask = df_unique["chrom"].str.startswith("chrUn")
 
-# Print the first few rows of the sorted DataFrame
-print(df.head())
+    # Exclude rows with "chrUn" chromosomes
+    df_unique = df_unique[~mask]
 
+    # Print the first few rows of the modified unique DataFrame
+    print(df_unique.head())
 
-# In[9]:
+    # Filter the unique DataFrame to include only rows with 'frag_length' less than or equal to 1000
+    df_unique = df_unique[df_unique.frag_length <= 1000]
 
+    # Print the maximum value of 'frag_length'
+    print("Maximum frag_length:", df_unique['frag_length'].max())
 
-# Instead of assigning to a new variable, modify the original dataframe
-df = df_unique
+    # Sort the unique DataFrame by 'chrom'
+    df_unique = df_unique.sort_values('chrom')
 
-# Specify the number of bins
-num_bins = 20000
+    # Print the first few rows of the modified DataFrame
+    print(df_unique.head())
 
-# Calculate the bin edges
-bin_edges = np.linspace(0, 3088269832, num_bins + 1)
+    return df_unique
 
-# Calculate the histogram
-hist, bins = np.histogram(
-    np.concatenate([df['read_start'].values, df['read_end'].values]),
-    bins=bin_edges
-)
 
-# Calculate the bin indices for the 'read_start' column
-bin_indices = np.searchsorted(bin_edges, df['read_start'], side='right') - 1
+def main(f='/home/sam/sra_files/control_SRR17006224.bed.gz'):
+    import matplotlib.pyplot as plt
 
-# Calculate the counts of fragment lengths in different ranges for each bin
-condition1 = (df['frag_length'] <= 220) & (df['frag_length'] >= 100)
-condition2 = (df['frag_length'] <= 400) & (df['frag_length'] >= 300)
-condition3 = (df['frag_length'] <= 590) & (df['frag_length'] >= 470)
+    df_unique = load_fragments(f)
 
-# Combine the conditions using logical OR (|)
-combined_condition = condition1 | condition2 | condition3
+    # Look up chromosome positions in the shared genome coordinate module
+    assembly = get_assembly('hg38')
 
-# Calculate small_counts using the combined condition
-small_counts = np.bincount(bin_indices, weights=combined_condition, minlength=num_bins)
-medium_counts = np.bincount(bin_indices, weights=(df['frag_length'] <= 160), minlength=num_bins)
+    # Print the dictionary of chromosome positions
+    print(assembly.chrom_pos())
 
-# Calculate large_counts using the condition for large fragments
-large_counts = np.bincount(bin_indices, weights=(df['frag_length'] > 160), minlength=num_bins)
+    # Adjust read start and end positions based on chromosome positions, resolving
+    # each chromosome name to its offset once instead of masking the frame per chromosome
+    offsets = assembly.chrom_offsets(df_unique['chrom'])
+    df_unique['read_start'] += offsets
+    df_unique['read_end'] += offsets
 
-# Calculate the ratio for each bin, avoiding division by zero
-ratio = np.where(small_counts == 0, 0, np.where(large_counts == 0, 1, small_counts / large_counts))
+    # Print the first few rows of the modified DataFrame with adjusted positions
+    print(df_unique.head())
 
-# Calculate the logarithm of hist values, avoiding -inf values
-new_counts = np.log(hist)
-new_counts[new_counts == -np.inf] = 0
+    # Bin read starts and ends once into a coverage pyramid (20M, 2M, 200k, 20k,
+    # 2k and 200 bins); the histograms and plots below read from its levels
+    coverage = CoveragePyramid.from_positions(
+        np.concatenate([df_unique['read_start'].values, df_unique['read_end'].values]),
+        assembly
+    )
+    print(coverage)
 
-# Create a DataFrame with bin indices, counts, ratios, and other information
-df_result = pd.DataFrame({
-    'Bin Indices': np.arange(num_bins),
-    'new_counts': new_counts,
-    'Counts': hist,
-    'true_counts': small_counts,
-    'Small Counts': medium_counts,
-    'Large Counts': large_counts,
-    'Ratio': np.round(ratio * 10)
-})
+    # Print rows in df_unique where 'chrom' column is 'chr3'
+    print(df_unique[df_unique['chrom'] == 'chr3'])
 
-# Calculate the sum of small and large counts
-total_counts = small_counts + large_counts
+    # Create a histogram of 'frag_length' with specified settings
+    df_unique['frag_length'].hist(bins=65, color='#BDE0BD', edgecolor='black', grid=False)
 
-# Expand dimensions for new_counts
-arr = np.expand_dims(new_counts, axis=1)
-arr = np.expand_dims(arr, axis=0)
+    # Set labels and title for the plot
+    plt.xlabel('Fragment Length')
+    plt.ylabel('Frequency')
+    plt.title('Histogram of Fragment Length Per Patient')
 
-# Print the resulting DataFrame
-print(df_result)
+    # Show the plot
+    plt.show()
 
+    # Get unique values from the 'chrom' column
+    chromed = df_unique['chrom'].unique()
 
-# In[10]:
+    # Define maximum indices for adjusting read positions
+    max_index = assembly.total_length
+    max_index_adj = 3088358329
 
+    # Collect the read start and end positions into a compact position set (4 bytes
+    # per distinct position instead of one byte per genome base); use
+    # read_ends.to_bitmap() for a fixed ~386 MB bitset on very deep samples
+    read_ends = PositionSet.from_positions(
+        df_unique['read_start'].values,
+        df_unique['read_end'].values,
+        genome_length=max_index_adj
+    )
+    print(read_ends)
 
-# Create a 1D histogram with 100,000,000 bins using values from both columns
-hist, bins = np.histogram(
-    np.concatenate([df_unique['read_start'].values, df_unique['read_end'].values]),
-    bins=100000000
-)
-print(hist.shape)
+    # Membership, range counts and histograms are binary searches on the set, e.g.
+    # the read ends falling in the first megabase of the linear genome
+    print("Read ends in first Mb:", read_ends.count(0, 1000000))
 
-# Take the logarithm of the histogram values
-hist = np.log(hist)
+    # Assign df_unique to df and sort it by 'read_start'
+    df = df_unique
+    df = df.sort_values('read_start')
 
-# Plot the histogram as a 1D heatmap using a logarithmic scale
-plt.plot(bins[:-1], hist, color='#BDE0BD')
+    # Print the first few rows of the sorted DataFrame
+    print(df.head())
 
-# Set labels and title for the plot
-plt.xlabel('Human Genome (bp)')
-plt.ylabel('Frequency (Log)')
+    # Instead of assigning to a new variable, modify the original dataframe
+    df = df_unique
 
-# Show the plot
-plt.show()
+    # Specify the number of bins
+    num_bins = 20000
 
+    # Read the histogram from the coverage pyramid
+    hist = coverage.at(num_bins)
 
-# In[ ]:
+    # Count fragments per bin (by read start) and size class in a single bincount;
+    # the default classes are the nucleosomal 100-220/300-400/470-590 bp ranges,
+    # <=160 bp and >160 bp
+    profile = FragmentSizeProfile(num_bins, assembly=assembly)
+    class_counts = profile.counts(df['read_start'].values, df['frag_length'].values)
+    small_counts = profile.class_counts(class_counts, 'nucleosomal')
+    medium_counts = profile.class_counts(class_counts, 'short')
+    large_counts = profile.class_counts(class_counts, 'long')
 
+    # Calculate the ratio for each bin, avoiding division by zero
+    ratio = profile.features(class_counts)['ratio']
 
+    # Calculate the logarithm of hist values, avoiding -inf values
+    new_counts = np.log(hist)
+    new_counts[new_counts == -np.inf] = 0
 
+    # Create a DataFrame with bin indices, counts, ratios, and other information
+    df_result = pd.DataFrame({
+        'Bin Indices': np.arange(num_bins),
+        'new_counts': new_counts,
+        'Counts': hist,
+        'true_counts': small_counts,
+        'Small Counts': medium_counts,
+        'Large Counts': large_counts,
+        'Ratio': np.round(ratio * 10)
+    })
+
+    # Calculate the sum of small and large counts
+    total_counts = small_counts + large_counts
+
+    # Expand dimensions for new_counts
+    arr = np.expand_dims(new_counts, axis=1)
+    arr = np.expand_dims(arr, axis=0)
+
+    # Print the resulting DataFrame
+    print(df_result)
+
+    # Read genome-wide coverage at the finest pyramid level that still fits the
+    # plot; pass start/stop to zoom into a region at higher resolution
+    positions, hist = coverage.zoom(max_points=2000000)
+    print(hist.shape)
+
+    # Take the logarithm of the histogram values
+    with np.errstate(divide='ignore'):
+        hist = np.log(hist)
+
+    # Plot the histogram as a 1D heatmap using a logarithmic scale
+    plt.plot(positions, hist, color='#BDE0BD')
 
+    # Set labels and title for the plot
+    plt.xlabel('Human Genome (bp)')
+    plt.ylabel('Frequency (Log)')
+
+    # Show the plot
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,65 @@ Epigenetic Analysis Module for Multi-Targeted Epigenetic Cancer Therapy Platform
 
 This module integrates the epigenetic modeling pipeline for cancer detection
 with the main MTET platform, providing advanced genomic analysis capabilities.
+
+Importing the package does no work: the names below are resolved on first
+access, importing only the submodule that defines them. Heavy optional
+dependencies (TensorFlow, scikit-learn, pyfaidx, matplotlib) are imported
+inside the functions that use them.
 """
 
-from .AI_simple_NN_WRST import *
-from .histogram_creation import *
-from .metadata_treat import *
-from .Chrom_info import *
+import importlib
 
 __version__ = "1.0.0"
 __author__ = "MTET Platform Team"
+
+# Public names of each submodule, resolved lazily by ``__getattr__``
+_EXPORTS = {
+    'genome': ('GenomeAssembly', 'UNKNOWN_CHROM', 'UNPLACED_CHROM', 'get_assembly', 'register_assembly'),
+    'fragments': ('iter_bed_chunks', 'iter_fragments', 'read_name_keys', 'fragment_keys', 'pair_mates',
+                  'linearize_fragments', 'iter_unique_fragment_frames', 'iter_unique_fragments', 'bed_histogram'),
+    'cohort': ('CohortStore', 'collect_samples', 'build_cohort', 'count_digest', 'narrowest_dtype', 'select_bins',
+               'for_column_access', 'load_manifest', 'load_qc', 'merge_staged_rows', 'write_json_atomic'),
+    'ranksum': ('RankSumBlock', 'RankSumResult', 'iter_ranksum_blocks', 'ranksums_matrix'),
+    'feature_selection': ('CORRECTIONS', 'BinSelection', 'TopKSelector', 'adjust_pvalues', 'select_top_bins'),
+    'feature_cache': ('FeatureCache',),
+    'incremental_ranksum': ('RankSumState',),
+    'coverage': ('CoveragePyramid', 'PYRAMID_FACTOR', 'DEFAULT_BASE_BINS'),
+    'positions': ('PositionSet', 'PositionBitmap'),
+    'fragmentomics': ('DEFAULT_SIZE_CLASSES', 'DEFAULT_RATIOS', 'FragmentSizeProfile', 'FragmentProfiles',
+                      'build_fragment_profiles', 'size_ratio', 'write_profiles_header'),
+    'fragment_file': ('FragmentFile', 'FragmentCohort', 'FRAGMENT_SUFFIX', 'write_fragment_file', 'collect_fragments',
+                      'convert_bed', 'convert_beds'),
+    'qc': ('SampleQC', 'coverage_evenness', 'qc_outliers', 'DEFAULT_QC_COLUMNS'),
+    'pipeline': ('STAGES', 'SINK', 'SraSample', 'StageError', 'ToolCommands', 'BedSink', 'HistogramSink',
+                 'CohortSink', 'PipelineRunner'),
+    'serving': ('ModelServer', 'save_model', 'get_model_server', 'get_model_batcher'),
+    'batching': ('MicroBatcher',),
+    'dense_model': ('DenseModel', 'export_model'),
+    'Chrom_info': ('chromosome_layout',),
+    'metadata_treat': ('split_run_table',),
+    'histogram_creation': ('process_bed', 'build_histograms'),
+    'cross_validation': ('Fold', 'stratified_folds', 'holdout_splits', 'keras_fit_predict', 'cross_validate',
+                         'summarize'),
+    'AI_simple_NN_WRST': ('CohortSplit', 'split_cohort', 'select_features', 'feature_matrices', 'build_model',
+                          'train_model'),
+}
+
+_LOCATIONS = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_LOCATIONS)
+
+
+def __getattr__(name):
+    module = _LOCATIONS.get(name)
+    if module is None:
+        if name in _EXPORTS:
+            return importlib.import_module(f'.{name}', __name__)
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,152 @@
+"""
+Micro-batching of concurrent model requests
+
+Each API request scores one or a few samples, and a forward pass over one
+sample costs nearly as much as one over a hundred. ``MicroBatcher`` sits
+between the asyncio endpoints and the model: ``submit`` queues one item and
+awaits its result, while a background task waits up to ``max_delay`` seconds
+for more items (or until ``max_batch_size`` are pending), scores them all
+with a single call of ``process`` on a worker thread, and fans the results
+back out to the waiting requests.
+
+Items arriving while a batch is being scored form the next batch, so under
+load the batches grow on their own and throughput follows the batch size
+rather than the request count; a lone request waits at most ``max_delay``.
+
+If ``process`` raises on a batch, its items are processed again one at a
+time, so a malformed item fails only its own request and the rest of the
+batch still gets its results.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional, Sequence
+
+__all__ = [
+    'MicroBatcher',
+]
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from coroutines and processes them in batches.
+
+    Args:
+        process: Called with a list of items from a worker thread; returns
+            one result per item, in order
+        max_batch_size: Items per call of ``process``
+        max_delay: Seconds the first item of a batch waits for company
+    """
+
+    def __init__(self, process: Callable[[List[Any]], Sequence[Any]], max_batch_size: int = 64,
+                 max_delay: float = 0.005):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}")
+        self.process = process
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batches = 0
+        self.items = 0
+        self._pending: List[tuple] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._arrived: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+
+    def __repr__(self) -> str:
+        mean = self.items / self.batches if self.batches else 0.0
+        return (f"MicroBatcher(max_batch_size={self.max_batch_size}, max_delay={self.max_delay}, "
+                f"{self.batches} batches, {mean:.1f} items per batch)")
+
+    def _start(self) -> None:
+        """Bind to the running event loop and start the batching task."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._pending = []
+            self._arrived = asyncio.Event()
+            self._full = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """Queue ``item`` for the next batch and return its result."""
+        self._start()
+        future = self._loop.create_future()
+        self._pending.append((item, future))
+        self._arrived.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        return await future
+
+    async def submit_many(self, items: Sequence[Any]) -> List[Any]:
+        """Queue several items at once; they may be split over batches."""
+        return list(await asyncio.gather(*(self.submit(item) for item in items)))
+
+    def _take(self) -> List[tuple]:
+        """Remove the next batch from the pending items, skipping cancelled requests."""
+        batch, rest = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        self._pending = rest
+        if len(rest) < self.max_batch_size:
+            self._full.clear()
+        if not rest:
+            self._arrived.clear()
+        return [(item, future) for item, future in batch if not future.cancelled()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._arrived.wait()
+            if not self._full.is_set():
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._take()
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self._process, items)
+            except Exception as e:
+                if len(items) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                    continue
+                # Find the failing items: each one fails only its own request
+                logger.warning("Batch of %d items failed, retrying one at a time: %s", len(items), e)
+                outcomes = await loop.run_in_executor(None, self._process_each, items)
+                for (_, future), (result, error) in zip(batch, outcomes):
+                    if future.done():
+                        continue
+                    if error is None:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(error)
+                self.batches += 1
+                self.items += len(items)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _process(self, items: List[Any]) -> Sequence[Any]:
+        results = self.process(items)
+        if len(results) != len(items):
+            raise ValueError(f"batch of {len(items)} items returned {len(results)} results")
+        return results
+
+    def _process_each(self, items: List[Any]) -> List[tuple]:
+        """Process ``items`` one at a time, returning a ``(result, exception)`` pair per item."""
+        outcomes = []
+        for item in items:
+            try:
+                outcomes.append((self._process([item])[0], None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
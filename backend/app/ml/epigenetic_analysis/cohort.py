@@ -0,0 +1,669 @@
+"""
+Cohort storage and parallel cohort building for the epigenetic analysis pipeline
+
+A cohort is a directory holding one (samples x bins) count matrix plus a
+small JSON header describing it: sample names, group labels, bin layout,
+assembly, storage layout and dtype. The matrix is always opened memory
+mapped, so training, statistics and plotting slice rows or bin ranges
+without reading the whole file.
+
+Two layouts are supported:
+
+* ``dense``: a single ``counts.npy`` in the narrowest unsigned dtype that
+  holds every count (uint8 or uint16 for typical cfDNA depth).
+* ``csr``: the ``data`` / ``indices`` / ``indptr`` arrays of a
+  ``scipy.sparse.csr_matrix`` stored as separate ``.npy`` files, for
+  low-coverage cohorts where most bins are zero.
+
+Cohorts are built by fanning samples out over a process pool; every worker
+writes its finished histogram straight into its own row of the store, and a
+completion manifest records which rows are done so an interrupted build
+only processes the missing samples when rerun. QC metrics gathered in the
+same pass (see ``qc``) are kept in ``qc.json`` next to the matrix.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+from multiprocessing import Pool, cpu_count
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from .fragments import DEFAULT_CHUNK_SIZE, NUM_BINS, bed_histogram
+from .genome import get_assembly
+from .qc import SampleQC, coverage_evenness
+
+__all__ = [
+    'CohortStore',
+    'collect_samples',
+    'build_cohort',
+    'count_digest',
+    'narrowest_dtype',
+    'select_bins',
+    'for_column_access',
+    'load_manifest',
+    'load_qc',
+    'merge_staged_rows',
+    'write_json_atomic',
+]
+
+logger = logging.getLogger(__name__)
+
+MATRIX_FILE = 'counts.npy'
+CSR_FILES = {part: f'counts_{part}.npy' for part in ('data', 'indices', 'indptr')}
+HEADER_FILE = 'header.json'
+MANIFEST_FILE = 'manifest.json'
+QC_FILE = 'qc.json'
+
+# Per-row staging area for csr builds and for dense rows that overflowed the dtype
+PARTS_DIR = 'parts'
+
+LAYOUTS = ('dense', 'csr')
+
+# Bumped whenever the on-disk layout changes
+FORMAT_VERSION = 2
+
+# Unsigned dtypes tried in order when choosing the narrowest safe dtype
+_COUNT_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+# Rows copied at a time when rewriting a dense matrix
+_COPY_ROWS = 16
+
+
+def narrowest_dtype(max_count: int) -> np.dtype:
+    """Return the narrowest unsigned integer dtype able to hold ``max_count``."""
+    for dtype in _COUNT_DTYPES:
+        if max_count <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise OverflowError(f"Count {max_count} does not fit in any supported dtype")
+
+
+def count_digest(hist: np.ndarray) -> str:
+    """
+    Content digest of one sample's histogram.
+
+    Counts are hashed as int64 so the digest does not depend on the storage
+    dtype or layout of the cohort holding them.
+    """
+    counts = np.ascontiguousarray(hist, dtype=np.int64)
+    return hashlib.blake2b(counts.tobytes(), digest_size=16).hexdigest()
+
+
+def select_bins(matrix, bins) -> np.ndarray:
+    """
+    Gather the columns ``bins`` of a dense, memory-mapped or sparse count matrix.
+
+    Only the selected columns are densified, so this is the way to feed a
+    subset of bins into PCA, plots or the classifier.
+    """
+    block = matrix[:, bins]
+    if scipy.sparse.issparse(block):
+        return block.toarray()
+    return np.asarray(block)
+
+
+def for_column_access(matrix):
+    """
+    Return ``matrix`` in a form with cheap per-bin column access.
+
+    CSR matrices are converted to CSC (cost proportional to the non-zero
+    count, nothing is densified); dense arrays are returned unchanged.
+    """
+    if scipy.sparse.issparse(matrix):
+        return matrix.tocsc()
+    return matrix
+
+
+def collect_samples(directory: str, per_group: int = 400, groups: Sequence[str] = ('cancer', 'control')) -> Tuple[List[str], List[str]]:
+    """
+    Pick up to ``per_group`` BED files for each group from ``directory``.
+
+    Files are assigned to the first group whose name occurs in the file
+    name, in sorted order so repeated calls pick the same samples.
+
+    Returns:
+        Tuple of ``(filenames, labels)`` with groups in the order given.
+    """
+    selected = {group: [] for group in groups}
+    for filename in sorted(os.listdir(directory)):
+        for group in groups:
+            if group in filename:
+                if len(selected[group]) < per_group:
+                    selected[group].append(filename)
+                break
+
+    filenames, labels = [], []
+    for group in groups:
+        filenames.extend(selected[group])
+        labels.extend([group] * len(selected[group]))
+    return filenames, labels
+
+
+def write_json_atomic(path: str, payload: dict) -> None:
+    """Write JSON through a temporary file so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class CohortStore:
+    """
+    Memory-mapped (samples x bins) count matrix with its describing header.
+
+    The header carries everything needed to interpret the matrix, so no side
+    files (sample name lists, array order conventions) are required.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.header = json.load(f)
+
+        self.samples: List[str] = self.header['samples']
+        self.labels: List[str] = self.header['labels']
+        self.num_bins: int = self.header['num_bins']
+        self.bin_size: float = self.header['bin_size']
+        self.assembly: str = self.header['assembly']
+        self.layout: str = self.header.get('layout', 'dense')
+        self.dtype = np.dtype(self.header['dtype'])
+        self._counts = None
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __repr__(self) -> str:
+        return (f"CohortStore({self.path!r}, {len(self)} samples x {self.num_bins} bins, "
+                f"{self.layout}, {self.dtype})")
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        samples: Sequence[str],
+        labels: Optional[Sequence[str]] = None,
+        num_bins: int = NUM_BINS,
+        assembly='hg38',
+        dtype='auto',
+        layout: str = 'dense',
+    ) -> 'CohortStore':
+        """
+        Write a header and, for the dense layout, preallocate a zeroed matrix.
+
+        With ``dtype='auto'`` a dense store starts as uint16, which holds
+        the counts of typical cfDNA depth, and is widened when a row
+        overflows it; a csr store picks its dtype when finalized.
+        """
+        samples = list(samples)
+        labels = list(labels) if labels is not None else [''] * len(samples)
+        if len(labels) != len(samples):
+            raise ValueError("labels must have one entry per sample")
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown cohort layout {layout!r}; expected one of {LAYOUTS}")
+
+        dtype = np.dtype(np.uint16 if dtype == 'auto' else dtype)
+        assembly = get_assembly(assembly)
+        os.makedirs(path, exist_ok=True)
+        if layout == 'dense':
+            matrix = np.lib.format.open_memmap(
+                os.path.join(path, MATRIX_FILE), mode='w+', dtype=dtype, shape=(len(samples), num_bins)
+            )
+            del matrix
+
+        write_json_atomic(os.path.join(path, HEADER_FILE), {
+            'format_version': FORMAT_VERSION,
+            'samples': samples,
+            'labels': labels,
+            'num_bins': num_bins,
+            'bin_size': assembly.total_length / num_bins,
+            'genome_length': assembly.total_length,
+            'assembly': assembly.name,
+            'layout': layout,
+            'dtype': dtype.str,
+            'finalized': layout == 'dense',
+        })
+        return cls(path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """Check whether ``path`` holds a cohort store."""
+        return os.path.exists(os.path.join(path, HEADER_FILE))
+
+    @property
+    def matrix_path(self) -> str:
+        return os.path.join(self.path, MATRIX_FILE)
+
+    @property
+    def finalized(self) -> bool:
+        return self.header.get('finalized', True)
+
+    def _part_path(self, row: int) -> str:
+        return os.path.join(self.path, PARTS_DIR, f'row_{row:06d}.npz')
+
+    def _save_part(self, row: int, **arrays) -> None:
+        # Written through a temporary file: the manifest lists a staged row
+        # as completed as soon as this returns
+        path = self._part_path(row)
+        tmp_path = f"{path[:-len('.npz')]}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def _update_header(self, **fields) -> None:
+        self.header.update(fields)
+        write_json_atomic(os.path.join(self.path, HEADER_FILE), self.header)
+        self.dtype = np.dtype(self.header['dtype'])
+        self._counts = None
+
+    @property
+    def counts(self):
+        """
+        Memory-mapped count matrix.
+
+        A read-only ``np.memmap`` for the dense layout, or a
+        ``scipy.sparse.csr_matrix`` over memory-mapped arrays for csr.
+        """
+        if self._counts is None:
+            if self.layout == 'dense':
+                self._counts = np.load(self.matrix_path, mmap_mode='r')
+            else:
+                if not self.finalized:
+                    raise RuntimeError(f"Cohort store {self.path} has not been finalized")
+                parts = [np.load(os.path.join(self.path, CSR_FILES[p]), mmap_mode='r')
+                         for p in ('data', 'indices', 'indptr')]
+                self._counts = scipy.sparse.csr_matrix(tuple(parts), shape=(len(self), self.num_bins), copy=False)
+        return self._counts
+
+    def digests(self, rows: Optional[Sequence[int]] = None) -> List[str]:
+        """
+        Return the content digest (``count_digest``) of each row in ``rows``.
+
+        Digests are recorded in the build manifest as samples complete; rows
+        of stores built without them are hashed on first request and the
+        result is added to the manifest.
+        """
+        rows = range(len(self)) if rows is None else rows
+        path = os.path.join(self.path, MANIFEST_FILE)
+        manifest = {'completed': list(self.samples)}
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+        digests = manifest.setdefault('digests', {})
+
+        missing = [row for row in rows if self.samples[row] not in digests]
+        for row in missing:
+            counts = self.counts[row]
+            counts = counts.toarray().ravel() if scipy.sparse.issparse(counts) else counts
+            digests[self.samples[row]] = count_digest(counts)
+        if missing:
+            write_json_atomic(path, manifest)
+        return [digests[self.samples[row]] for row in rows]
+
+    def qc(self) -> Optional[pd.DataFrame]:
+        """
+        Per-sample QC metrics recorded while the store was built, one row
+        per sample in matrix order, or ``None`` for stores built without them.
+        """
+        path = os.path.join(self.path, QC_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            metrics = json.load(f)
+        return pd.DataFrame.from_dict(metrics, orient='index').reindex(self.samples)
+
+    def row_block(self, rows: Sequence[int]):
+        """
+        Return the count rows ``rows``.
+
+        Contiguous rows of a dense store come back as a view on the memory
+        map, so nothing is read until used.
+        """
+        rows = np.asarray(rows)
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows) and np.all(np.diff(rows) == 1):
+            return self.counts[rows[0]:rows[-1] + 1]
+        return self.counts[rows]
+
+    def rows(self, label: str) -> np.ndarray:
+        """Return the row indices of all samples carrying ``label``."""
+        return np.flatnonzero(np.asarray(self.labels) == label)
+
+    def names(self, label: str) -> List[str]:
+        """Return the sample names carrying ``label``, in row order."""
+        return [self.samples[row] for row in self.rows(label)]
+
+    def group(self, label: str, bins=slice(None)):
+        """
+        Return the count rows of one group, optionally restricted to ``bins``.
+
+        When the group occupies a contiguous block of rows (as written by
+        ``build_cohort``) and ``bins`` is a slice, a dense store returns a
+        view on the memory map and nothing is read until it is used. A csr
+        store returns a ``csr_matrix`` holding only the group's non-zeros.
+        """
+        block = self.row_block(self.rows(label))
+        if isinstance(bins, slice) and bins == slice(None):
+            return block
+        return block[:, bins]
+
+    def write_row(self, row: int, hist: np.ndarray) -> bool:
+        """
+        Store one sample's histogram.
+
+        Dense rows are written in place; a row whose largest count does not
+        fit the current dtype is staged in ``parts/`` instead, in the
+        narrowest dtype holding it, and ``False`` is returned, so the builder
+        can widen the matrix once all workers are done. Csr rows are always
+        staged and merged by ``finalize``.
+        """
+        os.makedirs(os.path.join(self.path, PARTS_DIR), exist_ok=True)
+        if self.layout == 'csr':
+            indices = np.flatnonzero(hist).astype(np.uint32)
+            values = hist[indices]
+            self._save_part(row, indices=indices, data=values.astype(narrowest_dtype(values.max(initial=0))))
+            return True
+
+        peak = int(hist.max(initial=0))
+        if peak > np.iinfo(self.dtype).max:
+            self._save_part(row, hist=hist.astype(narrowest_dtype(peak)))
+            return False
+
+        matrix = np.load(self.matrix_path, mmap_mode='r+')
+        matrix[row] = hist
+        matrix.flush()
+        del matrix
+        return True
+
+    def promote(self, dtype) -> None:
+        """Rewrite a dense matrix with a wider dtype, a block of rows at a time."""
+        dtype = np.dtype(dtype)
+        if dtype.itemsize <= self.dtype.itemsize:
+            return
+
+        tmp_path = f"{self.matrix_path}.tmp"
+        source = np.load(self.matrix_path, mmap_mode='r')
+        target = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=source.shape)
+        for start in range(0, len(source), _COPY_ROWS):
+            target[start:start + _COPY_ROWS] = source[start:start + _COPY_ROWS]
+        target.flush()
+        del source, target
+
+        os.replace(tmp_path, self.matrix_path)
+        self._update_header(dtype=dtype.str)
+        logger.info("Widened cohort matrix in %s to %s", self.path, dtype)
+
+    def merge_overflow(self, rows: Sequence[int], peak: Optional[int] = None) -> None:
+        """
+        Widen a dense matrix as needed and copy in rows staged by ``write_row``.
+
+        ``peak`` is the largest count of the staged rows, if the caller
+        knows it; otherwise it is read from the staged rows.
+        """
+        if peak is None:
+            peak = 0
+            for row in rows:
+                with np.load(self._part_path(row)) as part:
+                    peak = max(peak, int(part['hist'].max()))
+        self.promote(narrowest_dtype(peak))
+
+        matrix = np.load(self.matrix_path, mmap_mode='r+')
+        for row in rows:
+            with np.load(self._part_path(row)) as part:
+                matrix[row] = part['hist']
+        matrix.flush()
+        del matrix
+        for row in rows:
+            os.remove(self._part_path(row))
+
+    def finalize(self) -> None:
+        """Concatenate staged csr rows into the memory-mapped csr arrays."""
+        if self.layout != 'csr' or self.finalized:
+            return
+
+        nnz = np.zeros(len(self) + 1, dtype=np.int64)
+        peak = 0
+        for row in range(len(self)):
+            with np.load(self._part_path(row)) as part:
+                nnz[row + 1] = len(part['indices'])
+                peak = max(peak, int(part['data'].max(initial=0)))
+        indptr = np.cumsum(nnz)
+        total = int(indptr[-1])
+        dtype = narrowest_dtype(peak)
+
+        data = np.lib.format.open_memmap(os.path.join(self.path, CSR_FILES['data']), mode='w+',
+                                         dtype=dtype, shape=(total,))
+        indices = np.lib.format.open_memmap(os.path.join(self.path, CSR_FILES['indices']), mode='w+',
+                                            dtype=np.int32, shape=(total,))
+        for row in range(len(self)):
+            with np.load(self._part_path(row)) as part:
+                data[indptr[row]:indptr[row + 1]] = part['data']
+                indices[indptr[row]:indptr[row + 1]] = part['indices']
+        data.flush()
+        indices.flush()
+        del data, indices
+        np.save(os.path.join(self.path, CSR_FILES['indptr']), indptr)
+
+        self._update_header(dtype=dtype.str, finalized=True)
+        for row in range(len(self)):
+            os.remove(self._part_path(row))
+        logger.info("Finalized csr cohort in %s: %d non-zero counts (%s)", self.path, total, dtype)
+
+
+def load_manifest(store: CohortStore, samples: List[str], num_bins: int, assembly_name: str, layout: str) -> dict:
+    """
+    Load the build manifest of an existing store, checking it describes the same cohort.
+
+    Builders other than ``build_cohort`` (e.g. ``pipeline.CohortSink``) use
+    it to resume a store: the manifest lists completed samples, their
+    digests and the rows staged by ``write_row`` (see ``merge_staged_rows``).
+
+    Raises:
+        ValueError: If the store was created for other samples, bins,
+            assembly or layout
+    """
+    if (store.samples != samples or store.num_bins != num_bins
+            or store.assembly != assembly_name or store.layout != layout):
+        raise ValueError(
+            f"{store.path} holds a cohort with a different sample list or bin layout; "
+            "use a new output directory"
+        )
+
+    path = os.path.join(store.path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'completed': [], 'digests': {}, 'overflow': {}}
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest.setdefault('digests', {})
+    manifest.setdefault('overflow', {})
+    return manifest
+
+
+def load_qc(path: str) -> dict:
+    """Load the per-sample QC metrics of a store directory (empty if none were recorded)."""
+    qc_path = os.path.join(path, QC_FILE)
+    if not os.path.exists(qc_path):
+        return {}
+    with open(qc_path) as f:
+        return json.load(f)
+
+
+def merge_staged_rows(store: CohortStore, manifest: dict, manifest_path: str) -> None:
+    """
+    Copy the rows staged in ``manifest['overflow']`` (sample name to largest
+    count) into the matrix and clear them from the manifest.
+
+    Call it once no worker writes into the store any more.
+    """
+    if not manifest['overflow']:
+        return
+    row_of = {name: row for row, name in enumerate(store.samples)}
+    rows = [row_of[name] for name in manifest['overflow']]
+    store.merge_overflow(rows, max(manifest['overflow'].values()))
+    manifest['overflow'] = {}
+    write_json_atomic(manifest_path, manifest)
+
+
+def _build_row(task) -> Tuple[int, int, int, bool, str, dict]:
+    """Pool worker: bin one sample and write it into its row of the on-disk store."""
+    row, path, store_path, num_bins, chunk_size, assembly, pyramid_dir = task
+    qc = SampleQC()
+    if path.endswith('.frag'):
+        from .fragment_file import FragmentFile
+
+        # Binary fragment file: re-bin the mapped columns, no text to parse;
+        # the ingestion metrics were recorded when the file was written
+        fragments = FragmentFile(path)
+        hist = fragments.histogram(num_bins)
+        metrics = dict(fragments.header.get('qc') or {}, fragment_ends=int(hist.sum()), **coverage_evenness(hist))
+    elif pyramid_dir is None:
+        hist = bed_histogram(path, num_bins=num_bins, chunk_size=chunk_size, assembly=assembly, qc=qc)
+    else:
+        from .coverage import PYRAMID_FACTOR, CoveragePyramid
+
+        # Bin once at ten times the cohort resolution and keep every level
+        pyramid = CoveragePyramid.from_bed(path, assembly, base_bins=num_bins * PYRAMID_FACTOR,
+                                           chunk_size=chunk_size, qc=qc)
+        pyramid.save(os.path.join(pyramid_dir, f"{os.path.basename(path).split('.')[0]}.coverage.npz"))
+        hist = pyramid.at(num_bins)
+    if not path.endswith('.frag'):
+        metrics = qc.metrics(hist)
+    written = CohortStore(store_path).write_row(row, hist)
+    return row, int(hist.sum()), int(hist.max(initial=0)), written, count_digest(hist), metrics
+
+
+def build_cohort(
+    directory: str,
+    samples: Sequence[str],
+    output_dir: str,
+    labels: Optional[Sequence[str]] = None,
+    num_bins: int = NUM_BINS,
+    processes: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    assembly='hg38',
+    layout: str = 'dense',
+    dtype='auto',
+    pyramid_dir: Optional[str] = None,
+    names: Optional[Sequence[str]] = None,
+) -> CohortStore:
+    """
+    Bin every sample into one row of an on-disk cohort store.
+
+    Rows follow the order of ``samples``. Rerunning with the same arguments
+    skips rows already listed as completed in the manifest.
+
+    Args:
+        directory: Directory holding the per-sample ``.bed.gz`` files (or
+            ``.frag`` fragment files, see ``fragment_file``)
+        samples: BED (or fragment) file names, one per matrix row
+        output_dir: Directory receiving the cohort store and its build manifest
+        labels: Optional group label per sample, stored in the header
+        num_bins: Number of histogram bins per sample
+        processes: Worker processes (defaults to ``cpu_count()``)
+        chunk_size: BED records parsed at a time by each worker
+        assembly: Reference assembly name or ``GenomeAssembly``
+        layout: ``'dense'`` or ``'csr'`` (for low-coverage cohorts)
+        dtype: Starting dtype of a dense store; ``'auto'`` starts at
+            uint16, widened automatically on overflow
+        pyramid_dir: Optional directory receiving a ``CoveragePyramid`` per
+            sample, from which other resolutions can be read later
+        names: Sample names recorded in the store, one per file in
+            ``samples`` (defaults to the file names themselves)
+
+    Returns:
+        CohortStore: The completed cohort
+    """
+    files = list(samples)
+    samples = list(names) if names is not None else files
+    if len(samples) != len(files):
+        raise ValueError("names must have one entry per sample file")
+    assembly = get_assembly(assembly)
+
+    # Preallocate the full matrix on disk; workers fill it row by row
+    if CohortStore.exists(output_dir):
+        store = CohortStore(output_dir)
+        manifest = load_manifest(store, samples, num_bins, assembly.name, layout)
+    else:
+        store = CohortStore.create(output_dir, samples, labels, num_bins, assembly, dtype, layout)
+        manifest = {'completed': [], 'digests': {}, 'overflow': {}}
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    write_json_atomic(manifest_path, manifest)
+    qc_path = os.path.join(output_dir, QC_FILE)
+    qc = load_qc(output_dir)
+
+    if pyramid_dir is not None:
+        os.makedirs(pyramid_dir, exist_ok=True)
+
+    completed = set(manifest['completed'])
+    tasks = [
+        (row, os.path.join(directory, filename), output_dir, num_bins, chunk_size, assembly, pyramid_dir)
+        for row, (sample, filename) in enumerate(zip(samples, files))
+        if sample not in completed
+    ]
+    logger.info("Building cohort in %s: %d of %d samples to process", output_dir, len(tasks), len(samples))
+
+    # Rows too large for the current dtype are staged and merged after the pool
+    # has finished, so no worker ever writes into a matrix being widened. A
+    # staged row counts as completed (a rerun merges it rather than
+    # rebuilding it); the manifest's overflow map holds its largest count
+    with Pool(processes or cpu_count()) as pool:
+        for row, total, peak, written, digest, metrics in pool.imap_unordered(_build_row, tasks):
+            manifest['digests'][samples[row]] = digest
+            qc[samples[row]] = metrics
+            write_json_atomic(qc_path, qc)
+            if not written:
+                manifest['overflow'][samples[row]] = peak
+            manifest['completed'].append(samples[row])
+            write_json_atomic(manifest_path, manifest)
+            logger.info("Processed %s (%d/%d, %d fragment ends)", samples[row],
+                        len(manifest['completed']), len(samples), total)
+
+    merge_staged_rows(store, manifest, manifest_path)
+
+    store.finalize()
+    for stale in glob.glob(os.path.join(output_dir, PARTS_DIR, '*.npz')):
+        os.remove(stale)
+    return CohortStore(output_dir)
+
+
+def main(argv=None):
+    """Command line entry point: ``python -m app.ml.epigenetic_analysis.cohort build ...``."""
+    parser = argparse.ArgumentParser(description="Build cfDNA cohort matrices from BED files")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Bin BED files into an on-disk cohort store")
+    build.add_argument('--input-dir', required=True, help="Directory holding cancer_*/control_* BED files")
+    build.add_argument('--output-dir', required=True, help="Directory receiving the cohort store")
+    build.add_argument('--per-group', type=int, default=400, help="Maximum samples per group")
+    build.add_argument('--num-bins', type=int, default=NUM_BINS, help="Histogram bins per sample")
+    build.add_argument('--processes', type=int, default=None, help="Worker processes (default: all cores)")
+    build.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="BED records per chunk")
+    build.add_argument('--assembly', default='hg38', help="Reference assembly")
+    build.add_argument('--layout', choices=LAYOUTS, default='dense', help="Matrix storage layout")
+    build.add_argument('--pyramid-dir', default=None, help="Also save a coverage pyramid per sample here")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'build':
+        samples, labels = collect_samples(args.input_dir, args.per_group)
+        build_cohort(
+            args.input_dir,
+            samples,
+            args.output_dir,
+            labels=labels,
+            num_bins=args.num_bins,
+            processes=args.processes,
+            chunk_size=args.chunk_size,
+            assembly=args.assembly,
+            layout=args.layout,
+            pyramid_dir=args.pyramid_dir,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Multi-resolution fragment coverage for one sample
+
+A ``CoveragePyramid`` bins fragment ends once, at a fine base resolution,
+and stores successively downsampled levels next to it (each level sums
+``factor`` neighbouring bins of the one below). With the defaults the levels
+are 20M, 2M, 200k, 20k, 2k and 200 bins over the linear genome, so the 2M-bin
+model features, the 20k-bin fragment-ratio table and genome-wide plots at
+any zoom are all read from one structure instead of re-binning raw reads.
+
+Bins are assigned with exact integer arithmetic
+(``GenomeAssembly.bin_positions``), so each level is exactly the sum of the
+finer one, and the 2M-bin and coarser levels equal ``np.histogram`` over
+``np.linspace(0, genome_length, num_bins + 1)`` as used throughout the
+pipeline.
+
+Levels may carry trailing channel dimensions (e.g. fragment-length classes
+per bin); downsampling sums along the bin axis only.
+"""
+
+import json
+import logging
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+from .cohort import narrowest_dtype
+from .fragments import DEFAULT_CHUNK_SIZE, iter_unique_fragments
+from .genome import get_assembly
+
+__all__ = [
+    'CoveragePyramid',
+    'PYRAMID_FACTOR',
+    'DEFAULT_BASE_BINS',
+]
+
+logger = logging.getLogger(__name__)
+
+# Ratio between the bin counts of consecutive levels
+PYRAMID_FACTOR = 10
+
+# Base resolution: ~154 bp bins on hg38, ten times the 2M-bin model layout
+DEFAULT_BASE_BINS = 20000000
+
+# Coarsest level kept
+MIN_LEVEL_BINS = 100
+
+
+class CoveragePyramid:
+    """
+    Coverage counts of one sample at several nested resolutions.
+
+    Attributes:
+        levels: Count arrays from finest (``levels[0]``) to coarsest
+        factor: Bin count ratio between consecutive levels
+        assembly: Name of the reference assembly the bins are laid over
+        genome_length: Length of the linear genome axis in bp
+    """
+
+    def __init__(self, base: np.ndarray, assembly='hg38', factor: int = PYRAMID_FACTOR,
+                 min_bins: int = MIN_LEVEL_BINS):
+        assembly = get_assembly(assembly)
+        self.assembly = assembly.name
+        self.genome_length = assembly.total_length
+        self.factor = factor
+
+        self.levels: List[np.ndarray] = [base]
+        while len(self.levels[-1]) % factor == 0 and len(self.levels[-1]) // factor >= min_bins:
+            finer = self.levels[-1]
+            coarser = finer.reshape(len(finer) // factor, factor, *finer.shape[1:]).sum(axis=1)
+            self.levels.append(coarser.astype(narrowest_dtype(int(coarser.max(initial=0)))))
+
+    def __repr__(self) -> str:
+        return f"CoveragePyramid({self.assembly!r}, levels={self.num_bins})"
+
+    @property
+    def num_bins(self) -> List[int]:
+        """Bin count of every level, finest first."""
+        return [len(level) for level in self.levels]
+
+    @classmethod
+    def from_positions(cls, positions, assembly='hg38', base_bins: int = DEFAULT_BASE_BINS,
+                       factor: int = PYRAMID_FACTOR) -> 'CoveragePyramid':
+        """Build a pyramid from an array (or iterable of arrays) of linear-genome positions."""
+        assembly = get_assembly(assembly)
+        if isinstance(positions, np.ndarray):
+            positions = [positions]
+
+        base = np.zeros(base_bins, dtype=np.int64)
+        for chunk in positions:
+            base += assembly.histogram(chunk, base_bins)
+        return cls(base.astype(narrowest_dtype(int(base.max(initial=0)))), assembly, factor)
+
+    @classmethod
+    def from_bed(cls, path: str, assembly='hg38', base_bins: int = DEFAULT_BASE_BINS,
+                 factor: int = PYRAMID_FACTOR, chunk_size: int = DEFAULT_CHUNK_SIZE, qc=None) -> 'CoveragePyramid':
+        """
+        Bin the deduplicated fragment ends of one BED file, like ``bed_histogram``.
+
+        ``pyramid.at(n)`` equals ``bed_histogram(path, num_bins=n)`` for every
+        level ``n``. ``qc`` optionally collects ``qc.SampleQC`` metrics.
+        """
+        assembly = get_assembly(assembly)
+        ends = (np.concatenate([starts, stops])
+                for starts, stops in iter_unique_fragments(path, chunk_size, assembly, qc))
+        return cls.from_positions(ends, assembly, base_bins, factor)
+
+    def at(self, num_bins: int) -> np.ndarray:
+        """
+        Return the counts at ``num_bins`` bins.
+
+        Exact levels are returned as stored; any bin count that evenly
+        divides a stored level is summed from the coarsest such level.
+
+        Raises:
+            ValueError: If ``num_bins`` cannot be derived from any level
+        """
+        for level in reversed(self.levels):
+            if len(level) == num_bins:
+                return level
+            if len(level) > num_bins and len(level) % num_bins == 0:
+                group = len(level) // num_bins
+                return level.reshape(num_bins, group, *level.shape[1:]).sum(axis=1)
+        raise ValueError(f"{num_bins} bins cannot be derived from pyramid levels {self.num_bins}")
+
+    def bin_size(self, num_bins: int) -> float:
+        """Width in bp of one bin at ``num_bins`` bins."""
+        return self.genome_length / num_bins
+
+    def zoom(self, start: int = 0, stop: int = None, max_points: int = 100000) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Coverage of the genome interval ``[start, stop)`` for plotting.
+
+        Picks the finest level that shows the interval with at most
+        ``max_points`` bins.
+
+        Returns:
+            Tuple of ``(positions, counts)``: the left edge of every bin in
+            bp and its count
+        """
+        stop = self.genome_length if stop is None else stop
+        for level in self.levels:
+            n = len(level)
+            first = start * n // self.genome_length
+            last = min(-(-stop * n // self.genome_length), n)
+            if last - first <= max_points or level is self.levels[-1]:
+                edges = np.arange(first, last) * (self.genome_length / n)
+                return edges, level[first:last]
+
+    def save(self, path: str) -> None:
+        """Write every level to an ``.npz`` file (atomically)."""
+        meta = {'assembly': self.assembly, 'factor': self.factor}
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)),
+                 **{f'level_{i}': level for i, level in enumerate(self.levels)})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'CoveragePyramid':
+        """Read a pyramid written by ``save``."""
+        with np.load(path) as saved:
+            meta = json.loads(str(saved['meta']))
+            pyramid = cls.__new__(cls)
+            assembly = get_assembly(meta['assembly'])
+            pyramid.assembly = assembly.name
+            pyramid.genome_length = assembly.total_length
+            pyramid.factor = meta['factor']
+            count = sum(1 for name in saved.files if name.startswith('level_'))
+            pyramid.levels = [saved[f'level_{i}'] for i in range(count)]
+        return pyramid
@@ -0,0 +1,257 @@
+"""
+Cross-validation of the cancer classifier
+
+``AI_simple_NN_WRST.py`` holds out one fixed split (the first 30 samples of
+each group), so its accuracy comes without a variance estimate. This module
+evaluates the whole procedure over many splits:
+
+* ``stratified_folds``: repeated stratified k-fold splits
+* ``holdout_splits``: repeated random holdout of ``test_size`` samples per group
+
+For every split ``cross_validate`` reruns the feature selection on the
+training rows only, so held-out samples never leak into the rank-sum tests,
+then fits the classifier and scores the held-out rows. Splits run in
+parallel over a process pool; each worker opens the memory-mapped cohort
+store itself. Selections go through ``FeatureCache``, keyed on the content
+of each fold's training samples, so repeating a sweep (another classifier,
+more epochs, another ``k``) reuses every fold's rank-sum results.
+
+```bash
+python -m app.ml.epigenetic_analysis.cross_validation --cohort-dir /home/sam/cohort --folds 5 --repeats 2
+```
+"""
+
+import argparse
+import logging
+import os
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from typing import Callable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from .AI_simple_NN_WRST import CohortSplit, feature_matrices, train_model
+from .cohort import CohortStore
+from .feature_cache import FeatureCache
+from .qc import qc_outliers
+
+__all__ = [
+    'Fold',
+    'stratified_folds',
+    'holdout_splits',
+    'keras_fit_predict',
+    'cross_validate',
+    'summarize',
+]
+
+logger = logging.getLogger(__name__)
+
+GROUPS = ('control', 'cancer')
+
+
+class Fold(NamedTuple):
+    """One train/test split of a cross-validation sweep."""
+    repeat: int
+    fold: int
+    split: CohortSplit
+
+
+def _split(store: CohortStore, test_mask: dict) -> CohortSplit:
+    rows = {group: store.rows(group) for group in GROUPS}
+    return CohortSplit(
+        rows['control'][~test_mask['control']], rows['cancer'][~test_mask['cancer']],
+        rows['control'][test_mask['control']], rows['cancer'][test_mask['cancer']],
+    )
+
+
+def stratified_folds(store: CohortStore, k: int = 5, repeats: int = 1, seed: int = 0) -> List[Fold]:
+    """
+    Repeated stratified k-fold splits of a cohort's control and cancer rows.
+
+    Each repeat reshuffles both groups and deals them into ``k`` folds, so
+    every sample is held out exactly once per repeat and each fold keeps
+    the cohort's class balance.
+    """
+    rng = np.random.default_rng(seed)
+    folds = []
+    for repeat in range(repeats):
+        assignment = {group: rng.permutation(len(store.rows(group))) % k for group in GROUPS}
+        for fold in range(k):
+            folds.append(Fold(repeat, fold, _split(store, {group: assignment[group] == fold for group in GROUPS})))
+    return folds
+
+
+def holdout_splits(store: CohortStore, test_size: int = 30, repeats: int = 10, seed: int = 0) -> List[Fold]:
+    """Repeated random holdout of ``test_size`` samples from each group."""
+    rng = np.random.default_rng(seed)
+    folds = []
+    for repeat in range(repeats):
+        masks = {}
+        for group in GROUPS:
+            size = len(store.rows(group))
+            masks[group] = np.zeros(size, dtype=bool)
+            masks[group][rng.choice(size, min(test_size, size - 1), replace=False)] = True
+        folds.append(Fold(repeat, 0, _split(store, masks)))
+    return folds
+
+
+def keras_fit_predict(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray, epochs: int = 250,
+                      batch_size: int = 16) -> np.ndarray:
+    """Fit the script's network on one fold and return its probabilities for ``X_test``."""
+    import tensorflow as tf
+
+    # Derive TensorFlow's seed from the fold's NumPy seed, so reruns repeat
+    tf.keras.utils.set_random_seed(int(np.random.randint(2 ** 31 - 1)))
+    model, scaler, _ = train_model(X_train, y_train, epochs=epochs, batch_size=batch_size, verbose=0)
+    return np.asarray(model.predict(scaler.transform(X_test), verbose=0)).reshape(-1)
+
+
+def _auc(y: np.ndarray, scores: np.ndarray) -> float:
+    """Area under the ROC curve, as the Mann-Whitney U of the scores over positives and negatives."""
+    from scipy.stats import rankdata
+
+    positives = y == 1
+    n_pos, n_neg = int(positives.sum()), int((~positives).sum())
+    if not n_pos or not n_neg:
+        return float('nan')
+    u = rankdata(scores)[positives].sum() - n_pos * (n_pos + 1) / 2
+    return float(u / (n_pos * n_neg))
+
+
+def _run_fold(task) -> dict:
+    cohort_dir, fold, fit_predict, k, correction, alpha, exclude_outliers, ranksum_processes, seed = task
+    store = CohortStore(cohort_dir)
+    split = fold.split
+
+    if exclude_outliers is not None:
+        split = split._replace(training_con=split.training_con[~exclude_outliers[split.training_con]],
+                               training_can=split.training_can[~exclude_outliers[split.training_can]])
+
+    # Select bins on the training rows of this fold only; cached per fold
+    feature_cache = FeatureCache(os.path.join(store.path, 'feature_cache'))
+    selection = feature_cache.selection(store, split.training_con, split.training_can, k=k,
+                                        correction=correction, alpha=alpha, processes=ranksum_processes)
+    X_train, y_train, X_test, y_test = feature_matrices(store, split, selection.bins)
+
+    if seed is not None:
+        np.random.seed(seed)
+    scores = np.asarray(fit_predict(X_train, y_train, X_test), dtype=np.float64).reshape(-1)
+    predicted = scores >= 0.5
+    truth = y_test == 1
+    result = {
+        'repeat': fold.repeat,
+        'fold': fold.fold,
+        'train_samples': len(y_train),
+        'test_samples': len(y_test),
+        'num_significant': selection.num_significant,
+        'num_features': len(selection),
+        'accuracy': float(np.mean(predicted == truth)),
+        'sensitivity': float(np.mean(predicted[truth])) if truth.any() else float('nan'),
+        'specificity': float(np.mean(~predicted[~truth])) if (~truth).any() else float('nan'),
+        'auc': _auc(y_test, scores),
+    }
+    logger.info("Repeat %d fold %d: accuracy %.3f, AUC %.3f", fold.repeat, fold.fold,
+                result['accuracy'], result['auc'])
+    return result
+
+
+def cross_validate(
+    cohort_dir: str,
+    folds: List[Fold],
+    fit_predict: Optional[Callable] = None,
+    k: int = 10000,
+    correction: str = 'bh',
+    alpha: float = 0.05,
+    exclude_qc_outliers: bool = True,
+    processes: Optional[int] = None,
+    seed: Optional[int] = 0,
+) -> pd.DataFrame:
+    """
+    Evaluate feature selection plus classifier over every split in ``folds``.
+
+    Args:
+        cohort_dir: Cohort store directory
+        folds: Splits from ``stratified_folds`` or ``holdout_splits``
+        fit_predict: Picklable ``f(X_train, y_train, X_test)`` returning the
+            probability of cancer per test sample; defaults to
+            ``keras_fit_predict``
+        k: Bins selected per fold
+        correction: Multiple-testing adjustment of the selection
+        alpha: Significance level of the selection
+        exclude_qc_outliers: Leave samples flagged by ``qc_outliers`` out of
+            training (they are still tested)
+        processes: Folds run at once (default: all cores, at most one per fold)
+        seed: Base seed; fold ``i`` seeds NumPy with ``seed + i``
+
+    Returns:
+        pd.DataFrame: One row of metrics per fold (accuracy, sensitivity,
+        specificity, AUC and the selection size)
+    """
+    store = CohortStore(cohort_dir)
+    if fit_predict is None:
+        fit_predict = keras_fit_predict
+
+    flagged = None
+    qc_table = store.qc() if exclude_qc_outliers else None
+    if qc_table is not None:
+        flagged = qc_outliers(qc_table).to_numpy()
+        logger.info("QC outliers left out of training: %s", list(qc_table.index[flagged]))
+
+    processes = min(processes or cpu_count(), len(folds)) or 1
+    # Share the cores between concurrent folds for the rank-sum tests
+    ranksum_processes = max(1, cpu_count() // processes)
+    tasks = [
+        (cohort_dir, fold, fit_predict, k, correction, alpha, flagged, ranksum_processes,
+         None if seed is None else seed + i)
+        for i, fold in enumerate(folds)
+    ]
+
+    if processes == 1:
+        results = [_run_fold(task) for task in tasks]
+    else:
+        # One task per worker process, so each fold starts from a fresh
+        # TensorFlow state
+        with Pool(processes, maxtasksperchild=1) as pool:
+            results = pool.map(_run_fold, tasks, chunksize=1)
+    return pd.DataFrame(results)
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Mean and standard deviation of each metric over the folds."""
+    metrics = ['accuracy', 'sensitivity', 'specificity', 'auc']
+    return results[metrics].agg(['mean', 'std']).T
+
+
+def main(argv=None):
+    """Command line entry point: ``python -m app.ml.epigenetic_analysis.cross_validation ...``."""
+    parser = argparse.ArgumentParser(description="Cross-validate bin selection and the cancer classifier")
+    parser.add_argument('--cohort-dir', required=True, help="Cohort store directory")
+    parser.add_argument('--folds', type=int, default=5, help="Folds per repeat (0: repeated holdout)")
+    parser.add_argument('--repeats', type=int, default=1, help="Repeats of the fold assignment")
+    parser.add_argument('--test-size', type=int, default=30, help="Held-out samples per group for --folds 0")
+    parser.add_argument('--top-k', type=int, default=10000, help="Bins selected per fold")
+    parser.add_argument('--correction', default='bh', help="Multiple-testing adjustment (bh, bonferroni)")
+    parser.add_argument('--epochs', type=int, default=250, help="Training epochs per fold")
+    parser.add_argument('--processes', type=int, default=None, help="Folds run at once (default: all cores)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the splits and the training")
+    parser.add_argument('--output', default=None, help="Write the per-fold metrics to this CSV file")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    store = CohortStore(args.cohort_dir)
+    if args.folds:
+        folds = stratified_folds(store, args.folds, args.repeats, args.seed)
+    else:
+        folds = holdout_splits(store, args.test_size, args.repeats, args.seed)
+    results = cross_validate(args.cohort_dir, folds, partial(keras_fit_predict, epochs=args.epochs),
+                             k=args.top_k, correction=args.correction, processes=args.processes, seed=args.seed)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
+    print(summarize(results).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+TensorFlow-free inference for the dense cancer classifier
+
+The serving model is a small stack of Dense, Dropout and
+BatchNormalization layers (64-32-16-1). Scoring it does not need
+TensorFlow, which costs API workers seconds of startup and hundreds of MB
+of memory. ``export_model`` freezes a trained Keras model into one
+``.npz`` archive:
+
+* Dense layers: kernel, bias and activation
+* BatchNormalization layers: gamma, beta, moving mean and variance, epsilon
+* Dropout: skipped (the identity at inference)
+
+``DenseModel`` runs the same forward pass with NumPy matmuls. A
+BatchNormalization followed by a Dense layer is an affine map into a linear
+one, so on loading it is folded into that layer's kernel and bias and costs
+nothing per sample. ``ModelServer.load`` prefers ``model.npz`` when it is
+present and only falls back to Keras otherwise.
+
+```bash
+python -m app.ml.epigenetic_analysis.dense_model export --model-dir /home/sam/cohort/model
+```
+"""
+
+import argparse
+import json
+import logging
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+__all__ = [
+    'DenseModel',
+    'export_model',
+]
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT_VERSION = 1
+
+# Keras layers that are the identity at inference
+_PASS_THROUGH = ('InputLayer', 'Dropout', 'Flatten')
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    # Evaluated on -|x| so exp never overflows
+    z = np.exp(-np.abs(x))
+    return np.where(x >= 0, 1 / (1 + z), z / (1 + z))
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    z = np.exp(x - x.max(axis=1, keepdims=True))
+    return z / z.sum(axis=1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+    'softmax': _softmax,
+}
+
+
+def export_model(model, path: str) -> None:
+    """
+    Freeze the weights of a trained Keras ``Sequential`` model into ``path``.
+
+    Raises:
+        ValueError: If the model holds a layer other than Dense,
+            BatchNormalization, Dropout, Flatten or InputLayer, or an
+            unsupported activation
+    """
+    layers, arrays = [], {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        if kind in _PASS_THROUGH:
+            continue
+        index = len(layers)
+        if kind == 'Dense':
+            if config['activation'] not in ACTIVATIONS:
+                raise ValueError(f"layer {layer.name}: unsupported activation {config['activation']!r}")
+            weights = layer.get_weights()
+            arrays[f'{index}_kernel'] = weights[0]
+            arrays[f'{index}_bias'] = weights[1] if config.get('use_bias', True) else np.zeros(weights[0].shape[1])
+            layers.append({'type': 'dense', 'name': layer.name, 'activation': config['activation']})
+        elif kind == 'BatchNormalization':
+            weights = list(layer.get_weights())
+            size = weights[-1].shape[0]
+            arrays[f'{index}_gamma'] = weights.pop(0) if config.get('scale', True) else np.ones(size)
+            arrays[f'{index}_beta'] = weights.pop(0) if config.get('center', True) else np.zeros(size)
+            arrays[f'{index}_mean'], arrays[f'{index}_variance'] = weights
+            layers.append({'type': 'batch_norm', 'name': layer.name, 'epsilon': float(config['epsilon'])})
+        else:
+            raise ValueError(f"layer {layer.name}: cannot export {kind} layers")
+
+    meta = {'format_version': ARCHIVE_FORMAT_VERSION, 'layers': layers}
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, path)
+    logger.info("Exported %d layers to %s", len(layers), path)
+
+
+class DenseModel:
+    """
+    NumPy forward pass of an exported dense stack.
+
+    ``steps`` is a list of ``(kernel, bias, activation)`` triples; a
+    ``kernel`` of ``None`` marks an elementwise affine step (``bias`` is
+    then a ``(scale, shift)`` pair), left where a BatchNormalization had no
+    Dense layer after it to be folded into.
+    """
+
+    def __init__(self, steps: List[Tuple], dtype=np.float32):
+        self.steps = steps
+        self.dtype = np.dtype(dtype)
+
+    def __repr__(self) -> str:
+        sizes = [kernel.shape[1] for kernel, _, _ in self.steps if kernel is not None]
+        return f"DenseModel({'-'.join(map(str, sizes))})"
+
+    @property
+    def input_dim(self) -> int:
+        return next(kernel.shape[0] for kernel, _, _ in self.steps if kernel is not None)
+
+    @classmethod
+    def load(cls, path: str, dtype=np.float32) -> 'DenseModel':
+        """Read an archive written by ``export_model``, folding BatchNormalization into Dense layers."""
+        with np.load(path) as archive:
+            meta = json.loads(str(archive['meta']))
+            if meta['format_version'] > ARCHIVE_FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported format version {meta['format_version']}")
+            arrays = {key: archive[key].astype(np.float64) for key in archive.files if key != 'meta'}
+
+        steps = []
+        # Affine map (scale, shift) of a BatchNormalization awaiting the next Dense layer
+        pending = None
+        for index, layer in enumerate(meta['layers']):
+            if layer['type'] == 'batch_norm':
+                scale = arrays[f'{index}_gamma'] / np.sqrt(arrays[f'{index}_variance'] + layer['epsilon'])
+                shift = arrays[f'{index}_beta'] - arrays[f'{index}_mean'] * scale
+                if pending is not None:
+                    scale, shift = pending[0] * scale, pending[1] * scale + shift
+                pending = (scale, shift)
+                continue
+
+            kernel, bias = arrays[f'{index}_kernel'], arrays[f'{index}_bias']
+            if pending is not None:
+                # (x * scale + shift) @ kernel + bias == x @ (scale[:, None] * kernel) + (shift @ kernel + bias)
+                kernel, bias = pending[0][:, None] * kernel, pending[1] @ kernel + bias
+                pending = None
+            steps.append((kernel.astype(dtype), bias.astype(dtype), layer['activation']))
+        if pending is not None:
+            steps.append((None, (pending[0].astype(dtype), pending[1].astype(dtype)), 'linear'))
+        return cls(steps, dtype)
+
+    def predict_on_batch(self, x: np.ndarray) -> np.ndarray:
+        """Return the model outputs for the ``(samples, features)`` array ``x``."""
+        x = np.asarray(x, dtype=self.dtype)
+        for kernel, bias, activation in self.steps:
+            if kernel is None:
+                x = x * bias[0] + bias[1]
+            else:
+                x = ACTIVATIONS[activation](x @ kernel + bias)
+        return x
+
+    def predict(self, x: np.ndarray, batch_size: int = 1024) -> np.ndarray:
+        """Like ``predict_on_batch``, in chunks of ``batch_size`` samples."""
+        x = np.atleast_2d(x)
+        if not len(x):
+            return np.empty((0, 1), dtype=self.dtype)
+        return np.concatenate([self.predict_on_batch(x[start:start + batch_size])
+                               for start in range(0, len(x), batch_size)])
+
+
+def main(argv=None):
+    """Command line entry point: ``python -m app.ml.epigenetic_analysis.dense_model export ...``."""
+    from .serving import MODEL_FILE, NUMPY_MODEL_FILE
+
+    parser = argparse.ArgumentParser(description="Export the cancer classifier for TensorFlow-free serving")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help="Write model.npz next to model.keras")
+    export.add_argument('--model-dir', required=True, help="Serving artifact directory written by save_model")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'export':
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(os.path.join(args.model_dir, MODEL_FILE), compile=False)
+        export_model(model, os.path.join(args.model_dir, NUMPY_MODEL_FILE))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Content-addressed cache of per-bin test results and bin selections
+
+Rerunning the classifier with new hyperparameters should not rerun two
+million rank-sum tests. Each cache entry is keyed by a SHA-256 hash of
+everything its result depends on:
+
+* the content digest of every sample in each group (``CohortStore.digests``),
+  which pins both the sample set and the train/test split,
+* the bin layout (number of bins, bin size, assembly),
+* the test and its options.
+
+Because keys are derived from content, an entry is never stale: changing a
+sample changes the key of exactly those entries whose groups contain it,
+while entries for other splits or folds keep hitting. Per-bin arrays are
+stored as ``.npy`` files and opened memory mapped, so a hit costs a few
+milliseconds regardless of the number of bins.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .cohort import CohortStore, for_column_access
+from .feature_selection import BinSelection, TopKSelector
+from .ranksum import RankSumBlock, RankSumResult, ranksums_matrix
+
+__all__ = [
+    'FeatureCache',
+]
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the meaning of cached results changes
+CACHE_VERSION = 1
+
+_RESULT_FIELDS = ('u', 'statistic', 'pvalue')
+
+
+def _hash(payload: dict) -> str:
+    """Hash a JSON-serializable payload independently of key order."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class FeatureCache:
+    """
+    On-disk cache of rank-sum results and bin selections.
+
+    Layout: ``<directory>/<key>/`` holds ``u.npy``, ``statistic.npy``,
+    ``pvalue.npy`` and ``key.json`` (the hashed payload, for inspection);
+    selections derived from that entry are stored beside them as
+    ``selection-<key>.npz``.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def ranksum_key(self, store: CohortStore, x_rows: Sequence[int], y_rows: Sequence[int],
+                    tie_correction: bool = False) -> dict:
+        """
+        Describe a rank-sum run by the content it depends on.
+
+        Groups are recorded as sorted ``(sample, digest)`` pairs: the rank-sum
+        test does not depend on row order within a group, so reordering rows
+        does not invalidate an entry, but swapping the groups does.
+        """
+        def group(rows):
+            rows = list(rows)
+            return sorted(zip([store.samples[row] for row in rows], store.digests(rows)))
+
+        return {
+            'version': CACHE_VERSION,
+            'test': {'name': 'ranksums', 'tie_correction': bool(tie_correction)},
+            'layout': {
+                'num_bins': store.num_bins,
+                'bin_size': store.bin_size,
+                'assembly': store.assembly,
+            },
+            'x': group(x_rows),
+            'y': group(y_rows),
+        }
+
+    def _entry(self, key: dict) -> str:
+        return os.path.join(self.directory, _hash(key))
+
+    def ranksums(self, store: CohortStore, x_rows: Sequence[int], y_rows: Sequence[int],
+                 tie_correction: bool = False, processes: Optional[int] = None) -> RankSumResult:
+        """
+        Rank-sum statistics of every bin between two row groups of ``store``.
+
+        Loaded memory mapped from the cache when present, otherwise computed
+        with ``ranksums_matrix`` and stored.
+        """
+        key = self.ranksum_key(store, x_rows, y_rows, tie_correction)
+        entry = self._entry(key)
+        if os.path.exists(os.path.join(entry, 'key.json')):
+            logger.info("Rank-sum cache hit: %s", os.path.basename(entry))
+            return RankSumResult(*[
+                np.load(os.path.join(entry, f'{field}.npy'), mmap_mode='r') for field in _RESULT_FIELDS
+            ])
+
+        logger.info("Rank-sum cache miss: %s", os.path.basename(entry))
+        result = ranksums_matrix(
+            for_column_access(store.row_block(x_rows)),
+            for_column_access(store.row_block(y_rows)),
+            processes=processes,
+            tie_correction=tie_correction,
+        )
+
+        # Write into a scratch directory and rename it into place, so a
+        # concurrent reader never sees a partial entry
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            for field, values in zip(_RESULT_FIELDS, result):
+                np.save(os.path.join(tmp, f'{field}.npy'), values)
+            with open(os.path.join(tmp, 'key.json'), 'w') as f:
+                json.dump(key, f, indent=2)
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.exists(entry):
+                raise
+        return result
+
+    def selection(self, store: CohortStore, x_rows: Sequence[int], y_rows: Sequence[int],
+                  k: int = 10000, correction: str = 'bonferroni', alpha: float = 0.05,
+                  significant_only: bool = True, tie_correction: bool = False,
+                  processes: Optional[int] = None) -> BinSelection:
+        """
+        Select the ``k`` most significant bins between two row groups of ``store``.
+
+        Selections are cached under the rank-sum entry they derive from, so
+        trying another ``k`` or correction reuses the cached p-values.
+        """
+        key = self.ranksum_key(store, x_rows, y_rows, tie_correction)
+        params = {'k': k, 'correction': correction, 'alpha': alpha, 'significant_only': significant_only}
+        path = os.path.join(self._entry(key), f'selection-{_hash(params)[:16]}.npz')
+        if os.path.exists(path):
+            return BinSelection.load(path)
+
+        result = self.ranksums(store, x_rows, y_rows, tie_correction, processes)
+        selector = TopKSelector(k, store.num_bins, correction, alpha, significant_only)
+        selector.update(RankSumBlock(0, store.num_bins, *result))
+        selection = selector.result()
+        selection.save(path)
+        return selection
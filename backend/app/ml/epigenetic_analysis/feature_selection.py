@@ -0,0 +1,285 @@
+"""
+Significant-bin selection for the cfDNA classifier
+
+Rank-sum blocks from ``ranksum.iter_ranksum_blocks`` are reduced as they
+arrive: a bounded candidate set holds the ``k`` smallest p-values seen so
+far (merged with ``np.argpartition``), so selecting features never needs a
+full ``argsort`` of the per-bin p-values. Multiple-testing adjustment is
+either Bonferroni, which needs only the number of tests, or
+Benjamini-Hochberg, which sorts the collected p-values exactly once.
+
+The selection is saved as a small ``.npz`` artifact (bin indices and their
+statistics) that training, evaluation and serving load instead of
+recomputing the tests.
+"""
+
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .ranksum import RankSumBlock
+
+__all__ = [
+    'CORRECTIONS',
+    'BinSelection',
+    'TopKSelector',
+    'adjust_pvalues',
+    'select_top_bins',
+]
+
+logger = logging.getLogger(__name__)
+
+# Supported multiple-testing adjustments
+CORRECTIONS = ('none', 'bonferroni', 'bh')
+
+# Number of bins kept by the original notebook
+DEFAULT_TOP_K = 10000
+
+
+def _smallest(pvalues: np.ndarray, bins: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return positions of the ``k`` smallest p-values, ties broken by bin index.
+
+    ``np.argpartition`` is linear in the input size; resolving ties at the
+    boundary by bin index makes the result independent of block order.
+    """
+    if len(pvalues) <= k:
+        return np.arange(len(pvalues))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+
+    candidates = np.argpartition(pvalues, k - 1)[:k]
+    kth = pvalues[candidates].max()
+    below = np.flatnonzero(pvalues < kth)
+    ties = np.flatnonzero(pvalues == kth)
+    ties = ties[np.argsort(bins[ties], kind='stable')[:k - len(below)]]
+    return np.concatenate([below, ties])
+
+
+def adjust_pvalues(pvalues: np.ndarray, correction: str = 'bh', num_tests: Optional[int] = None) -> np.ndarray:
+    """
+    Adjust a full vector of p-values for multiple comparisons.
+
+    Args:
+        pvalues: One p-value per test
+        correction: One of ``CORRECTIONS``
+        num_tests: Number of tests; defaults to ``len(pvalues)``
+
+    Returns:
+        np.ndarray: Adjusted p-values in the input order
+    """
+    if correction not in CORRECTIONS:
+        raise ValueError(f"Unknown correction {correction!r}; expected one of {CORRECTIONS}")
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    m = len(pvalues) if num_tests is None else num_tests
+    if correction == 'none':
+        return pvalues.copy()
+    if correction == 'bonferroni':
+        return np.minimum(pvalues * m, 1.0)
+
+    # Benjamini-Hochberg step-up: q_(i) = min over j >= i of p_(j) * m / j
+    order = np.argsort(pvalues, kind='stable')
+    scaled = pvalues[order] * m / np.arange(1, len(pvalues) + 1)
+    adjusted = np.empty_like(pvalues)
+    adjusted[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return adjusted
+
+
+class BinSelection:
+    """
+    Selected bins, ordered by ascending p-value, with their test statistics.
+
+    Attributes:
+        bins: Bin indices into the cohort count matrix
+        pvalue: Raw two-sided p-values
+        adjusted: p-values adjusted with ``correction``
+        statistic: Rank-sum z statistics
+        u: Mann-Whitney U statistics
+        num_tests: Number of bins tested
+        correction: Multiple-testing adjustment applied
+        alpha: Significance level of the selection
+    """
+
+    def __init__(self, bins, pvalue, adjusted, statistic, u, num_tests: int,
+                 correction: str, alpha: float, num_significant: Optional[int] = None):
+        self.bins = np.asarray(bins, dtype=np.int64)
+        self.pvalue = np.asarray(pvalue, dtype=np.float64)
+        self.adjusted = np.asarray(adjusted, dtype=np.float64)
+        self.statistic = np.asarray(statistic, dtype=np.float64)
+        self.u = np.asarray(u, dtype=np.float64)
+        self.num_tests = int(num_tests)
+        self.correction = correction
+        self.alpha = float(alpha)
+        # Significant bins among all tests, which may exceed len(bins)
+        self.num_significant = num_significant
+
+    def __len__(self) -> int:
+        return len(self.bins)
+
+    def __repr__(self) -> str:
+        return (f"BinSelection({len(self)} bins of {self.num_tests}, "
+                f"correction={self.correction!r}, alpha={self.alpha})")
+
+    @property
+    def significant(self) -> np.ndarray:
+        """Mask of selected bins whose adjusted p-value is at most ``alpha``."""
+        return self.adjusted <= self.alpha
+
+    def top(self, k: int) -> 'BinSelection':
+        """Return the ``k`` most significant bins of this selection."""
+        return BinSelection(
+            self.bins[:k], self.pvalue[:k], self.adjusted[:k], self.statistic[:k], self.u[:k],
+            self.num_tests, self.correction, self.alpha, self.num_significant,
+        )
+
+    def save(self, path: str) -> None:
+        """Write the selection to an ``.npz`` artifact (atomically)."""
+        meta = {
+            'num_tests': self.num_tests,
+            'correction': self.correction,
+            'alpha': self.alpha,
+            'num_significant': self.num_significant,
+        }
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            bins=self.bins,
+            pvalue=self.pvalue,
+            adjusted=self.adjusted,
+            statistic=self.statistic,
+            u=self.u,
+            meta=np.array(json.dumps(meta)),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BinSelection':
+        """Read a selection written by ``save``."""
+        with np.load(path) as artifact:
+            meta = json.loads(str(artifact['meta']))
+            return cls(
+                artifact['bins'], artifact['pvalue'], artifact['adjusted'],
+                artifact['statistic'], artifact['u'], **meta,
+            )
+
+
+class TopKSelector:
+    """
+    Streaming reducer that keeps the ``k`` most significant bins.
+
+    Feed it ``RankSumBlock`` objects with ``update`` in any order, then call
+    ``result``. Candidates are compacted with ``np.argpartition`` whenever
+    the buffer grows past twice ``k``, so memory stays ``O(k)`` for
+    Bonferroni. Benjamini-Hochberg needs the whole p-value distribution, so
+    the selector then also fills a ``num_bins`` p-value vector, as it does
+    when ``keep_pvalues`` is requested.
+    """
+
+    def __init__(self, k: int = DEFAULT_TOP_K, num_bins: Optional[int] = None,
+                 correction: str = 'bonferroni', alpha: float = 0.05,
+                 significant_only: bool = True, keep_pvalues: bool = False):
+        if correction not in CORRECTIONS:
+            raise ValueError(f"Unknown correction {correction!r}; expected one of {CORRECTIONS}")
+        if (keep_pvalues or correction == 'bh') and num_bins is None:
+            raise ValueError("num_bins is required to keep p-values")
+
+        self.k = k
+        self.correction = correction
+        self.alpha = alpha
+        self.significant_only = significant_only
+        self.num_tests = 0
+
+        self.pvalues = np.full(num_bins, np.nan) if (keep_pvalues or correction == 'bh') else None
+        self._columns = {
+            'bins': [np.empty(0, dtype=np.int64)],
+            'pvalue': [np.empty(0)],
+            'statistic': [np.empty(0)],
+            'u': [np.empty(0)],
+        }
+        self._buffered = 0
+
+    def update(self, block: RankSumBlock) -> None:
+        """Merge one block of rank-sum statistics into the candidate set."""
+        pvalue = np.nan_to_num(block.pvalue, nan=1.0)
+        self.num_tests += len(pvalue)
+        if self.pvalues is not None:
+            self.pvalues[block.start:block.stop] = pvalue
+
+        self._columns['bins'].append(np.arange(block.start, block.stop))
+        self._columns['pvalue'].append(pvalue)
+        self._columns['statistic'].append(block.statistic)
+        self._columns['u'].append(block.u)
+        self._buffered += len(pvalue)
+        if self._buffered > 2 * self.k:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Reduce the buffered candidates to the ``k`` smallest p-values."""
+        columns = {name: np.concatenate(parts) for name, parts in self._columns.items()}
+        keep = _smallest(columns['pvalue'], columns['bins'], self.k)
+        self._columns = {name: [values[keep]] for name, values in columns.items()}
+        self._buffered = len(keep)
+
+    def result(self) -> BinSelection:
+        """Return the selected bins, ordered by ascending p-value."""
+        self._compact()
+        columns = {name: parts[0] for name, parts in self._columns.items()}
+        order = np.lexsort((columns['bins'], columns['pvalue']))
+        columns = {name: values[order] for name, values in columns.items()}
+        m = self.num_tests
+
+        if self.correction == 'bh':
+            # The candidates are the k smallest p-values, i.e. ranks 1..k of
+            # the single sort below
+            sorted_p = np.sort(self.pvalues[~np.isnan(self.pvalues)])
+            scaled = sorted_p * m / np.arange(1, len(sorted_p) + 1)
+            q = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+            adjusted = q[:len(order)]
+            num_significant = int(np.count_nonzero(q <= self.alpha))
+        else:
+            adjusted = adjust_pvalues(columns['pvalue'], self.correction, m)
+            num_significant = None
+            if self.pvalues is not None:
+                num_significant = int(np.count_nonzero(
+                    adjust_pvalues(self.pvalues, self.correction, m) <= self.alpha
+                ))
+
+        selection = BinSelection(
+            columns['bins'], columns['pvalue'], adjusted, columns['statistic'], columns['u'],
+            m, self.correction, self.alpha, num_significant,
+        )
+        if self.significant_only:
+            mask = selection.significant
+            selection = BinSelection(
+                selection.bins[mask], selection.pvalue[mask], selection.adjusted[mask],
+                selection.statistic[mask], selection.u[mask],
+                m, self.correction, self.alpha, num_significant,
+            )
+        logger.info("Selected %d of %d bins (%s, alpha=%g)", len(selection), m, self.correction, self.alpha)
+        return selection
+
+
+def select_top_bins(blocks: Iterable[RankSumBlock], k: int = DEFAULT_TOP_K, num_bins: Optional[int] = None,
+                    correction: str = 'bonferroni', alpha: float = 0.05,
+                    significant_only: bool = True) -> BinSelection:
+    """
+    Select the ``k`` most significant bins from streamed rank-sum blocks.
+
+    Args:
+        blocks: Iterable of ``RankSumBlock`` (e.g. ``iter_ranksum_blocks(x, y)``)
+        k: Maximum number of bins to keep
+        num_bins: Total number of bins; required for ``correction='bh'``
+        correction: Multiple-testing adjustment, one of ``CORRECTIONS``
+        alpha: Significance level applied to the adjusted p-values
+        significant_only: Drop selected bins that are not significant
+
+    Returns:
+        BinSelection: Up to ``k`` bins ordered by ascending p-value
+    """
+    selector = TopKSelector(k, num_bins, correction, alpha, significant_only)
+    for block in blocks:
+        selector.update(block)
+    return selector.result()
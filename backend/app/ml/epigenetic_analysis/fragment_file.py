@@ -0,0 +1,388 @@
+"""
+Binary columnar fragment files
+
+Every analysis of a sample used to start by parsing its ``bed.gz`` text with
+pandas. A fragment file stores the sample's deduplicated, linearized
+fragments once, as the same fragments ``bed_histogram`` counts, in a
+directory of plain ``.npy`` columns that are opened memory mapped:
+
+* ``starts.npy``: linear-genome start positions (int64), sorted ascending
+* ``lengths.npy``: fragment lengths in bp (uint16)
+* ``strands.npy``: strand bits packed eight per byte (1 = minus strand)
+* ``header.json``: assembly, fragment count, a content digest of the
+  columns, a per-chromosome row index and the ingestion QC metrics
+
+Re-binning at any resolution is then a ``bincount`` over the mapped
+columns, and region or chromosome queries are ``searchsorted`` lookups on the
+sorted starts. At 1M read pairs a sample takes ~11 MB instead of re-parsing
+~40 MB of gzipped text.
+
+``FragmentCohort`` builds cohort matrices at any bin count or bin width
+from the fragment files of a cohort and caches one cohort store per
+resolution, so resolution sweeps never touch the BED files.
+
+Contigs outside the assembly (chrM, chrEBV, ...) keep their raw coordinates,
+as in ``linearize_fragments``, and are therefore not covered by the
+chromosome index.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+from multiprocessing import Pool, cpu_count
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cohort import CohortStore, build_cohort
+from .fragments import DEFAULT_CHUNK_SIZE, MAX_FRAGMENT_LENGTH, fragment_keys, iter_unique_fragment_frames
+from .genome import get_assembly
+from .qc import SampleQC
+
+__all__ = [
+    'FragmentFile',
+    'FragmentCohort',
+    'FRAGMENT_SUFFIX',
+    'write_fragment_file',
+    'collect_fragments',
+    'convert_bed',
+    'convert_beds',
+]
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_SUFFIX = '.frag'
+HEADER_FILE = 'header.json'
+
+# Bumped whenever the on-disk layout changes
+FORMAT_VERSION = 1
+
+# Fragments binned at a time, bounding the temporary arrays of ``histogram``
+_BIN_CHUNK = 4000000
+
+# Part of every ``FragmentCohort`` cache key; bumped when rebinned stores
+# change (2: rows named after the samples rather than the fragment files)
+_CACHE_VERSION = 2
+
+
+def _sort_order(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Order fragments by start, then length, with one argsort of packed keys.
+
+    Chunks from ``iter_unique_fragment_frames`` are already sorted, so the
+    stable sort only merges runs.
+    """
+    return np.argsort(fragment_keys(starts, starts + lengths.astype(np.int64)), kind='stable')
+
+
+def _column_digest(starts: np.ndarray, lengths: np.ndarray, strand_bits: np.ndarray) -> str:
+    """Content digest of the sorted fragment columns."""
+    digest = hashlib.blake2b(digest_size=16)
+    for column in (starts, lengths, strand_bits):
+        digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()
+
+
+def write_fragment_file(path: str, starts: np.ndarray, lengths: np.ndarray, strands: np.ndarray,
+                        assembly='hg38', sample: Optional[str] = None, qc: Optional[dict] = None) -> 'FragmentFile':
+    """
+    Write fragments to a fragment file directory, sorting them by position.
+
+    The directory is assembled under a temporary name and renamed into
+    place, so an interrupted write never leaves a partial file behind.
+
+    Args:
+        path: Output directory (conventionally ``<sample>.frag``)
+        starts: Linear-genome start positions
+        lengths: Fragment lengths in bp (at most ``MAX_FRAGMENT_LENGTH``)
+        strands: Boolean array, ``True`` for minus-strand fragments
+        assembly: Reference assembly name or ``GenomeAssembly``
+        sample: Optional sample name recorded in the header
+        qc: Optional ingestion QC metrics (``SampleQC.metrics()``) recorded
+            in the header
+
+    Returns:
+        FragmentFile: The written file, opened
+    """
+    assembly = get_assembly(assembly)
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths)
+    if len(lengths) and (lengths.min() < 0 or lengths.max() > MAX_FRAGMENT_LENGTH):
+        raise ValueError(f"Fragment lengths must lie in [0, {MAX_FRAGMENT_LENGTH}]")
+
+    order = _sort_order(starts, lengths)
+    starts = starts[order]
+    lengths = lengths[order].astype(np.uint16)
+    strands = np.packbits(np.asarray(strands, dtype=bool)[order], bitorder='little')
+
+    # First row of every chromosome, plus the end of the last one
+    index = np.searchsorted(starts, np.r_[assembly.offsets, assembly.total_length]).tolist()
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'starts.npy'), starts)
+    np.save(os.path.join(tmp_path, 'lengths.npy'), lengths)
+    np.save(os.path.join(tmp_path, 'strands.npy'), strands)
+    with open(os.path.join(tmp_path, HEADER_FILE), 'w') as f:
+        json.dump({
+            'format_version': FORMAT_VERSION,
+            'sample': sample,
+            'assembly': assembly.name,
+            'genome_length': assembly.total_length,
+            'num_fragments': len(starts),
+            'digest': _column_digest(starts, lengths, strands),
+            'chromosomes': list(assembly.chromosomes),
+            'index': index,
+            'qc': qc,
+        }, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return FragmentFile(path)
+
+
+class FragmentFile:
+    """
+    Memory-mapped columns of one sample's fragments, sorted by start.
+
+    Attributes:
+        starts: Linear-genome start positions (int64)
+        lengths: Fragment lengths (uint16)
+        header: Assembly, fragment count and chromosome index
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.header = json.load(f)
+        self.assembly = get_assembly(self.header['assembly'])
+        self.starts = np.load(os.path.join(path, 'starts.npy'), mmap_mode='r')
+        self.lengths = np.load(os.path.join(path, 'lengths.npy'), mmap_mode='r')
+        self._strand_bits = np.load(os.path.join(path, 'strands.npy'), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return self.header['num_fragments']
+
+    def __repr__(self) -> str:
+        return f"FragmentFile({self.path!r}, {len(self)} fragments)"
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """Check whether ``path`` holds a complete fragment file."""
+        return os.path.exists(os.path.join(path, HEADER_FILE))
+
+    @property
+    def ends(self) -> np.ndarray:
+        """Linear-genome end positions (read into memory)."""
+        return self.starts + self.lengths
+
+    @property
+    def digest(self) -> str:
+        """Content digest of the fragments, from the header (hashed here for files written without one)."""
+        if 'digest' not in self.header:
+            self.header['digest'] = _column_digest(self.starts, self.lengths, self._strand_bits)
+        return self.header['digest']
+
+    def strands(self, rows=slice(None)) -> np.ndarray:
+        """Boolean minus-strand flags of ``rows`` (all fragments by default)."""
+        flags = np.unpackbits(self._strand_bits, count=len(self), bitorder='little').view(bool)
+        return flags[rows]
+
+    def chromosome(self, name: str) -> slice:
+        """Rows of the fragments starting on chromosome ``name``."""
+        code = self.header['chromosomes'].index(name)
+        return slice(self.header['index'][code], self.header['index'][code + 1])
+
+    def region(self, start: int, stop: int) -> slice:
+        """Rows of the fragments starting in ``[start, stop)`` on the linear genome."""
+        return slice(*np.searchsorted(self.starts, [start, stop]).tolist())
+
+    def histogram(self, num_bins: int, rows=slice(None)) -> np.ndarray:
+        """
+        Count fragment starts and ends in ``num_bins`` equal-width bins.
+
+        Equals ``bed_histogram`` of the source BED (up to 2M bins, see
+        ``GenomeAssembly.bin_index``) without parsing any text.
+        """
+        starts, lengths = self.starts[rows], self.lengths[rows]
+        hist = np.zeros(num_bins, dtype=np.int64)
+        for offset in range(0, len(starts), _BIN_CHUNK):
+            chunk = np.asarray(starts[offset:offset + _BIN_CHUNK])
+            hist += self.assembly.histogram(chunk, num_bins)
+            hist += self.assembly.histogram(chunk + lengths[offset:offset + _BIN_CHUNK], num_bins)
+        return hist
+
+
+def fragment_name(sample: str) -> str:
+    """Fragment file name of a BED file name (``cancer_SRR1.bed.gz`` -> ``cancer_SRR1.frag``)."""
+    return sample.split('.')[0] + FRAGMENT_SUFFIX
+
+
+def collect_fragments(frames: Iterable[pd.DataFrame]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Concatenate the start, length and strand columns of fragment chunks."""
+    starts: List[np.ndarray] = [np.empty(0, dtype=np.int64)]
+    lengths: List[np.ndarray] = [np.empty(0, dtype=np.int64)]
+    strands: List[np.ndarray] = [np.empty(0, dtype=bool)]
+    for fragments in frames:
+        starts.append(fragments['read_start'].to_numpy(dtype=np.int64))
+        lengths.append(fragments['frag_length'].to_numpy(dtype=np.int64))
+        strands.append(fragments['strand'].to_numpy() == '-')
+    return np.concatenate(starts), np.concatenate(lengths), np.concatenate(strands)
+
+
+def convert_bed(bed_path: str, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                assembly='hg38') -> FragmentFile:
+    """Parse one BED file (or binary BED stream) once and write its fragment file."""
+    qc = SampleQC()
+    starts, lengths, strands = collect_fragments(iter_unique_fragment_frames(bed_path, chunk_size, assembly, qc))
+    sample = os.path.basename(bed_path) if isinstance(bed_path, str) else None
+    return write_fragment_file(path, starts, lengths, strands, assembly, sample, qc.metrics())
+
+
+def _convert_sample(task) -> str:
+    """Pool worker: convert one BED file."""
+    bed_path, path, chunk_size, assembly = task
+    convert_bed(bed_path, path, chunk_size, assembly)
+    return path
+
+
+def convert_beds(
+    directory: str,
+    samples: Sequence[str],
+    output_dir: str,
+    processes: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    assembly='hg38',
+) -> List[str]:
+    """
+    Convert existing BED files of a cohort to fragment files.
+
+    Samples whose fragment file already exists are skipped, so an
+    interrupted conversion resumes where it stopped.
+
+    Args:
+        directory: Directory holding the per-sample ``.bed.gz`` files
+        samples: BED file names
+        output_dir: Directory receiving ``<sample>.frag`` per BED file
+        processes: Worker processes (defaults to ``cpu_count()``)
+        chunk_size: BED records parsed at a time by each worker
+        assembly: Reference assembly name or ``GenomeAssembly``
+
+    Returns:
+        List[str]: Fragment file paths, in the order of ``samples``
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, fragment_name(sample)) for sample in samples]
+    tasks = [
+        (os.path.join(directory, sample), path, chunk_size, assembly)
+        for sample, path in zip(samples, paths)
+        if not FragmentFile.exists(path)
+    ]
+    logger.info("Converting %d of %d BED files to fragment files", len(tasks), len(paths))
+    with Pool(processes or cpu_count()) as pool:
+        for path in pool.imap_unordered(_convert_sample, tasks):
+            logger.info("Wrote %s", path)
+    return paths
+
+
+class FragmentCohort:
+    """
+    Cohort matrices at any resolution, binned from stored fragment files.
+
+    Each requested resolution is built once with ``build_cohort`` (one
+    ``bincount`` per sample over the mapped fragment columns) into
+    ``<cache_dir>/bins-<num_bins>-<layout>-<key>`` and reopened from there
+    afterwards. The key covers the sample list, labels and the content
+    digest of every fragment file, so a changed cohort never reuses a
+    stale matrix. It is computed once per instance: create a new
+    ``FragmentCohort`` after fragment files change. Rows of the rebinned stores carry the sample names
+    given here, not the fragment file names, so they can be looked up like
+    the rows of the source cohort.
+
+    Args:
+        fragment_dir: Directory holding ``<sample>.frag`` fragment files
+        samples: Sample (BED file) names in row order, e.g. ``store.samples``
+        labels: Group label per sample, e.g. ``store.labels``
+        cache_dir: Directory receiving the per-resolution stores
+            (defaults to ``<fragment_dir>/rebinned``)
+    """
+
+    def __init__(self, fragment_dir: str, samples: Sequence[str], labels: Optional[Sequence[str]] = None,
+                 cache_dir: Optional[str] = None):
+        self.fragment_dir = fragment_dir
+        self.samples = list(samples)
+        self.labels = list(labels) if labels is not None else None
+        self.cache_dir = cache_dir or os.path.join(fragment_dir, 'rebinned')
+        self.files = [fragment_name(sample) for sample in self.samples]
+        self._stores = {}
+        self._cache_key: Optional[str] = None
+        self._assembly = None
+
+    def __repr__(self) -> str:
+        return f"FragmentCohort({self.fragment_dir!r}, {len(self.samples)} samples)"
+
+    @classmethod
+    def from_store(cls, store: CohortStore, fragment_dir: str, cache_dir: Optional[str] = None) -> 'FragmentCohort':
+        """Rebin the samples of an existing cohort store, keeping its sample names, row order and labels."""
+        return cls(fragment_dir, store.samples, store.labels, cache_dir)
+
+    @property
+    def assembly(self):
+        """Reference assembly of the fragment files."""
+        if self._assembly is None:
+            self._key()
+        return self._assembly
+
+    def num_bins_for(self, bin_width: float) -> int:
+        """Smallest bin count whose bins are at most ``bin_width`` bp wide."""
+        return math.ceil(self.assembly.total_length / bin_width)
+
+    def _key(self) -> str:
+        """Cache key of the cohort, opening every fragment file on first use only."""
+        if self._cache_key is None:
+            fragment_files = [FragmentFile(os.path.join(self.fragment_dir, name)) for name in self.files]
+            assemblies = {fragments.assembly.name for fragments in fragment_files}
+            if len(assemblies) > 1:
+                raise ValueError(f"Fragment files in {self.fragment_dir} mix assemblies: {sorted(assemblies)}")
+            payload = json.dumps([_CACHE_VERSION, self.samples, self.labels,
+                                  [fragments.digest for fragments in fragment_files]])
+            self._cache_key = hashlib.sha256(payload.encode()).hexdigest()[:12]
+            self._assembly = fragment_files[0].assembly
+        return self._cache_key
+
+    def matrix(self, num_bins: Optional[int] = None, bin_width: Optional[float] = None,
+               layout: str = 'dense', processes: Optional[int] = None) -> CohortStore:
+        """
+        Return the (samples x bins) cohort store at one resolution.
+
+        Args:
+            num_bins: Bins over the linear genome
+            bin_width: Alternatively, the largest bin width in bp
+            layout: ``'dense'`` or ``'csr'``
+            processes: Worker processes for a first build
+
+        Returns:
+            CohortStore: The cached or newly built store
+        """
+        if (num_bins is None) == (bin_width is None):
+            raise ValueError("Pass exactly one of num_bins and bin_width")
+        if num_bins is None:
+            num_bins = self.num_bins_for(bin_width)
+
+        path = os.path.join(self.cache_dir, f'bins-{num_bins}-{layout}-{self._key()}')
+        if path not in self._stores:
+            # build_cohort reopens a complete store without rebinning anything
+            self._stores[path] = build_cohort(self.fragment_dir, self.files, path, labels=self.labels,
+                                              num_bins=num_bins, processes=processes, assembly=self.assembly,
+                                              layout=layout, names=self.samples)
+        return self._stores[path]
+
+    def sweep(self, resolutions: Iterable[int], **kwargs):
+        """Yield ``(num_bins, store)`` for each bin count in ``resolutions``."""
+        for num_bins in resolutions:
+            yield num_bins, self.matrix(num_bins, **kwargs)
@@ -0,0 +1,252 @@
+"""
+Fragment-size profiles per genome bin
+
+cfDNA fragment lengths carry signal of their own: tumour-derived fragments
+are shorter, and the nucleosomal peaks (~167, ~334, ~500 bp) shift with
+tissue of origin. ``FragmentSizeProfile`` counts fragments per genome bin
+and size class with a single ``np.bincount`` over the combined index
+``bin * n_classes + class``, instead of one weighted ``bincount`` per class.
+
+Size classes are configurable and may overlap (the default ``nucleosomal``
+class overlaps ``short`` and ``long``): lengths are first mapped through a
+lookup table onto the disjoint intervals induced by all class boundaries,
+counted once, and the classes are then summed from those intervals.
+
+``build_fragment_profiles`` runs the extractor over every sample of a cohort
+and stores a (samples x bins x classes) count array from which ratio and
+short/long features are derived for the classifier.
+"""
+
+import json
+import logging
+import os
+from multiprocessing import Pool, cpu_count
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cohort import narrowest_dtype
+from .fragments import DEFAULT_CHUNK_SIZE, MAX_FRAGMENT_LENGTH, iter_unique_fragments
+from .genome import get_assembly
+
+__all__ = [
+    'DEFAULT_SIZE_CLASSES',
+    'DEFAULT_RATIOS',
+    'FragmentSizeProfile',
+    'FragmentProfiles',
+    'build_fragment_profiles',
+    'size_ratio',
+    'write_profiles_header',
+]
+
+logger = logging.getLogger(__name__)
+
+# Size classes as inclusive (low, high) bp intervals, from the original
+# fragment-length analysis
+DEFAULT_SIZE_CLASSES: Dict[str, List[Tuple[int, int]]] = {
+    'nucleosomal': [(100, 220), (300, 400), (470, 590)],
+    'short': [(0, 160)],
+    'long': [(161, MAX_FRAGMENT_LENGTH)],
+}
+
+# Derived features as (numerator class, denominator class)
+DEFAULT_RATIOS: Dict[str, Tuple[str, str]] = {
+    'ratio': ('nucleosomal', 'long'),
+    'short_long': ('short', 'long'),
+}
+
+# Default bin count of the fragment-ratio table
+DEFAULT_PROFILE_BINS = 20000
+
+PROFILES_FILE = 'fragment_profiles.npy'
+PROFILES_HEADER = 'fragment_profiles.json'
+
+
+def size_ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """
+    Ratio of two class counts, with the original table's conventions.
+
+    Bins without numerator fragments get 0 and bins with numerator but no
+    denominator fragments get 1.
+    """
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(numerator == 0, 0.0, np.where(denominator == 0, 1.0, numerator / denominator))
+
+
+class FragmentSizeProfile:
+    """
+    Counts fragments per (genome bin, size class) in one ``bincount``.
+
+    Args:
+        num_bins: Equal-width bins over the linear genome
+        classes: Mapping of class name to inclusive ``(low, high)`` intervals
+        assembly: Reference assembly name or ``GenomeAssembly``
+        max_length: Longest fragment length considered
+    """
+
+    def __init__(self, num_bins: int = DEFAULT_PROFILE_BINS,
+                 classes: Dict[str, Sequence[Tuple[int, int]]] = None,
+                 assembly='hg38', max_length: int = MAX_FRAGMENT_LENGTH):
+        classes = DEFAULT_SIZE_CLASSES if classes is None else classes
+        self.num_bins = num_bins
+        self.assembly = get_assembly(assembly)
+        self.names = list(classes)
+        self.max_length = max_length
+
+        # Class membership of every length 0..max_length
+        lengths = np.arange(max_length + 1)
+        member = np.zeros((max_length + 1, len(self.names)), dtype=bool)
+        for column, name in enumerate(self.names):
+            for low, high in classes[name]:
+                member[:, column] |= (lengths >= low) & (lengths <= high)
+
+        # Lengths with the same membership form one disjoint interval class;
+        # lengths in no class map to -1 and are not counted
+        signatures, self._lookup = np.unique(member, axis=0, return_inverse=True)
+        self._lookup = self._lookup.ravel().astype(np.int64)
+        counted = signatures.any(axis=1)
+        self._lookup[~counted[self._lookup]] = -1
+        remap = np.cumsum(counted) - 1
+        self._lookup[self._lookup >= 0] = remap[self._lookup[self._lookup >= 0]]
+        self._membership = signatures[counted].astype(np.int64)
+
+    def __repr__(self) -> str:
+        return f"FragmentSizeProfile({self.num_bins} bins, classes={self.names})"
+
+    def counts(self, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Count fragments per bin (by start position) and size class.
+
+        Args:
+            starts: Linear-genome fragment start positions
+            lengths: Fragment lengths in bp
+
+        Returns:
+            np.ndarray: (num_bins x classes) fragment counts
+        """
+        bins = self.assembly.bin_index(starts, self.num_bins)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        in_range = (lengths >= 0) & (lengths <= self.max_length)
+        fine = np.full(len(lengths), -1, dtype=np.int64)
+        fine[in_range] = self._lookup[lengths[in_range]]
+
+        keep = (bins >= 0) & (fine >= 0)
+        n_fine = len(self._membership)
+        combined = np.bincount(bins[keep] * n_fine + fine[keep], minlength=self.num_bins * n_fine)
+        return combined.reshape(self.num_bins, n_fine) @ self._membership
+
+    def from_bed(self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+        """Count the deduplicated fragments of one BED file, as ``bed_histogram`` filters them."""
+        total = np.zeros((self.num_bins, len(self.names)), dtype=np.int64)
+        for starts, ends in iter_unique_fragments(path, chunk_size, self.assembly):
+            total += self.counts(starts, ends - starts)
+        return total
+
+    def class_counts(self, counts: np.ndarray, name: str) -> np.ndarray:
+        """Select one class from a ``counts`` array (classes on the last axis)."""
+        return counts[..., self.names.index(name)]
+
+    def features(self, counts: np.ndarray, ratios: Dict[str, Tuple[str, str]] = None) -> Dict[str, np.ndarray]:
+        """Derive the ratio features of a ``counts`` array, one array per ratio."""
+        ratios = DEFAULT_RATIOS if ratios is None else ratios
+        return {
+            name: size_ratio(self.class_counts(counts, numerator), self.class_counts(counts, denominator))
+            for name, (numerator, denominator) in ratios.items()
+        }
+
+
+class FragmentProfiles:
+    """
+    Memory-mapped (samples x bins x classes) size-class counts of a cohort.
+
+    Stored next to a cohort store as ``fragment_profiles.npy`` plus a JSON
+    header with the sample names, classes and bin count.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, PROFILES_HEADER)) as f:
+            self.header = json.load(f)
+        self.samples: List[str] = self.header['samples']
+        self.profile = FragmentSizeProfile(
+            self.header['num_bins'], self.header['classes'], self.header['assembly']
+        )
+        self.counts = np.load(os.path.join(path, PROFILES_FILE), mmap_mode='r')
+
+    def __repr__(self) -> str:
+        return f"FragmentProfiles({self.path!r}, {self.counts.shape})"
+
+    def class_counts(self, name: str) -> np.ndarray:
+        """(samples x bins) counts of one size class."""
+        return self.profile.class_counts(self.counts, name)
+
+    def features(self, ratios: Dict[str, Tuple[str, str]] = None) -> Dict[str, np.ndarray]:
+        """(samples x bins) ratio features for every sample, e.g. ``ratio`` and ``short_long``."""
+        return self.profile.features(self.counts, ratios)
+
+    def feature_matrix(self, ratios: Dict[str, Tuple[str, str]] = None) -> np.ndarray:
+        """All ratio features side by side: (samples x bins * len(ratios)), ready for a model."""
+        return np.hstack(list(self.features(ratios).values()))
+
+
+def write_profiles_header(output_dir: str, samples: Sequence[str], num_bins: int,
+                          classes: Dict[str, Sequence[Tuple[int, int]]] = None, assembly='hg38') -> None:
+    """Write the JSON header describing a ``fragment_profiles.npy`` array."""
+    with open(os.path.join(output_dir, PROFILES_HEADER), 'w') as f:
+        json.dump({
+            'samples': list(samples),
+            'num_bins': num_bins,
+            'classes': {name: [list(interval) for interval in intervals]
+                        for name, intervals in (classes or DEFAULT_SIZE_CLASSES).items()},
+            'assembly': get_assembly(assembly).name,
+        }, f, indent=2)
+
+
+def _profile_sample(task) -> Tuple[int, np.ndarray]:
+    """Pool worker: size-class counts of one sample."""
+    row, path, profile, chunk_size = task
+    return row, profile.from_bed(path, chunk_size)
+
+
+def build_fragment_profiles(
+    directory: str,
+    samples: Sequence[str],
+    output_dir: str,
+    num_bins: int = DEFAULT_PROFILE_BINS,
+    classes: Dict[str, Sequence[Tuple[int, int]]] = None,
+    processes: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    assembly='hg38',
+) -> FragmentProfiles:
+    """
+    Extract size-class counts for every sample of a cohort.
+
+    Args:
+        directory: Directory holding the per-sample ``.bed.gz`` files
+        samples: BED file names, one per row (e.g. a cohort store's samples)
+        output_dir: Directory receiving the profiles (may be the cohort store)
+        num_bins: Bins over the linear genome
+        classes: Size classes; defaults to ``DEFAULT_SIZE_CLASSES``
+        processes: Worker processes (defaults to ``cpu_count()``)
+        chunk_size: BED records parsed at a time by each worker
+        assembly: Reference assembly name or ``GenomeAssembly``
+
+    Returns:
+        FragmentProfiles: The stored profiles
+    """
+    samples = list(samples)
+    profile = FragmentSizeProfile(num_bins, classes, assembly)
+    counts = np.zeros((len(samples), num_bins, len(profile.names)), dtype=np.int64)
+
+    tasks = [(row, os.path.join(directory, sample), profile, chunk_size) for row, sample in enumerate(samples)]
+    with Pool(processes or cpu_count()) as pool:
+        for row, sample_counts in pool.imap_unordered(_profile_sample, tasks):
+            counts[row] = sample_counts
+            logger.info("Profiled %s", samples[row])
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, PROFILES_FILE), counts.astype(narrowest_dtype(int(counts.max(initial=0)))))
+    write_profiles_header(output_dir, samples, num_bins, classes, profile.assembly)
+    return FragmentProfiles(output_dir)
@@ -0,0 +1,338 @@
+"""
+Streaming BED ingestion for the epigenetic analysis pipeline
+
+This module reads the paired-end ``bedtools bamtobed`` output written by
+``SRA_script.py`` in fixed-size chunks straight from the gzip stream, pairs
+mates into fragments and fills the fragment-end histogram as it goes, so
+peak memory is governed by the chunk size rather than by sequencing depth.
+
+The one exception is deduplication: a fragment must be compared with every
+fragment kept before it, so the set of seen fragments grows with depth, at
+8 bytes per unique fragment (up to twice that while its buffer has
+headroom), about 8-16 MB per million read pairs.
+
+Files are read without a header line, as ``bamtobed`` writes them; the
+first record of a file is a read like any other.
+"""
+
+import logging
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .genome import UNPLACED_CHROM, get_assembly
+
+__all__ = [
+    'iter_bed_chunks',
+    'iter_fragments',
+    'read_name_keys',
+    'fragment_keys',
+    'pair_mates',
+    'linearize_fragments',
+    'iter_unique_fragment_frames',
+    'iter_unique_fragments',
+    'bed_histogram',
+]
+
+logger = logging.getLogger(__name__)
+
+# Column layout of bamtobed output (no header line)
+BED_COLUMNS = ['chrom', 'read_start', 'read_end', 'name', 'score', 'strand']
+BED_DTYPES = {'chrom': 'category', 'read_start': np.int64, 'read_end': np.int64}
+
+# Number of BED records parsed per chunk
+DEFAULT_CHUNK_SIZE = 1000000
+
+# Default number of histogram bins used by the cfDNA model
+NUM_BINS = 2000000
+
+# Fragments longer than this are treated as discordant pairs and dropped
+MAX_FRAGMENT_LENGTH = 1000
+
+# Bit width reserved for the fragment length in packed dedup keys
+_LENGTH_BITS = 10
+
+
+def iter_bed_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yield a (optionally gzipped) BED file as DataFrames of ``chunk_size`` rows.
+
+    The file is decompressed and parsed incrementally; at no point is the
+    whole file held in memory. ``path`` may also be an open binary stream of
+    plain BED text, such as the stdout pipe of ``bedtools bamtobed``. An
+    empty file or stream (no read aligned) yields nothing.
+    """
+    try:
+        with pd.read_csv(
+            path,
+            sep='\t',
+            header=None,
+            names=BED_COLUMNS,
+            usecols=['chrom', 'read_start', 'read_end', 'name', 'strand'],
+            dtype=BED_DTYPES,
+            chunksize=chunk_size,
+            compression='infer',
+        ) as reader:
+            for chunk in reader:
+                yield chunk
+    except pd.errors.EmptyDataError:
+        return
+
+
+def read_name_keys(names: pd.Series) -> np.ndarray:
+    """
+    Hash read names to 64-bit integers shared by both mates of a pair.
+
+    The trailing mate suffix is stripped exactly like the original
+    ``str.rstrip('12')`` pairing, then names are hashed in C with
+    ``pd.util.hash_array``. Collisions among a million reads are
+    vanishingly unlikely (~1e-8).
+    """
+    stripped = names.str.rstrip('12').to_numpy(dtype=object)
+    return pd.util.hash_array(stripped, categorize=False)
+
+
+def pair_mates(keys: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+    """
+    Group reads by integer key and reduce each group to one fragment.
+
+    Works for coordinate-sorted and name-adjacent input alike: a stable
+    argsort brings mates together while preserving file order within each
+    group, and fragment bounds come from ``np.minimum.reduceat`` /
+    ``np.maximum.reduceat``.
+
+    Returns:
+        Tuple of ``(first_rows, frag_starts, frag_ends, pending_rows)`` where
+        ``first_rows`` indexes the first read of every completed pair (for its
+        chromosome and strand) and ``pending_rows`` indexes reads whose mate
+        has not been seen.
+    """
+    if not len(keys):
+        empty = np.empty(0, dtype=np.intp)
+        return empty, starts[:0], ends[:0], empty
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    bounds = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    sizes = np.diff(np.r_[bounds, len(keys)])
+
+    frag_starts = np.minimum.reduceat(starts[order], bounds)
+    frag_ends = np.maximum.reduceat(ends[order], bounds)
+
+    paired = sizes >= 2
+    first_rows = order[bounds[paired]]
+    pending_rows = np.sort(order[bounds[~paired]])
+    return first_rows, frag_starts[paired], frag_ends[paired], pending_rows
+
+
+def _collapse_mates(reads: pd.DataFrame):
+    """
+    Collapse reads sharing a read name into fragments.
+
+    Returns the completed fragments and the reads whose mate has not been
+    seen yet.
+    """
+    first_rows, frag_starts, frag_ends, pending_rows = pair_mates(
+        reads['key'].to_numpy(),
+        reads['read_start'].to_numpy(),
+        reads['read_end'].to_numpy(),
+    )
+
+    fragments = pd.DataFrame({
+        'chrom': reads['chrom'].to_numpy()[first_rows],
+        'read_start': frag_starts,
+        'read_end': frag_ends,
+        'strand': reads['strand'].to_numpy()[first_rows],
+    })
+    return fragments, reads.iloc[pending_rows]
+
+
+def _single_read_fragments(reads: pd.DataFrame) -> pd.DataFrame:
+    """Treat reads whose mate never appeared as fragments on their own."""
+    return reads[['chrom', 'read_start', 'read_end', 'strand']].reset_index(drop=True)
+
+
+def iter_fragments(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, assembly='hg38') -> Iterator[pd.DataFrame]:
+    """
+    Yield paired-end fragments from a BED file one chunk at a time.
+
+    The ``chrom`` column of the yielded frames holds integer chromosome
+    codes of ``assembly`` (see ``GenomeAssembly.chrom_codes``).
+
+    Mates are matched on a 64-bit hash of their read name. A read whose mate
+    has not yet been seen is carried over into the next chunk; reads still
+    unpaired at the end of the file are emitted as single-read fragments,
+    like the whole-file ``groupby`` this replaces. Only those unpaired reads
+    persist between chunks.
+    """
+    assembly = get_assembly(assembly)
+    pending = None
+    for chunk in iter_bed_chunks(path, chunk_size):
+        chunk['chrom'] = assembly.chrom_codes(chunk['chrom'])
+        chunk['key'] = read_name_keys(chunk.pop('name'))
+        reads = chunk if pending is None else pd.concat([pending, chunk], ignore_index=True)
+        fragments, pending = _collapse_mates(reads)
+        if len(fragments):
+            yield fragments
+
+    if pending is not None and len(pending):
+        yield _single_read_fragments(pending)
+
+
+def linearize_fragments(fragments: pd.DataFrame, assembly='hg38') -> pd.DataFrame:
+    """
+    Filter fragments and shift them onto a single genome-wide axis.
+
+    ``chrUn`` contigs and fragments longer than ``MAX_FRAGMENT_LENGTH`` are
+    dropped, and positions are offset by their chromosome's start on the
+    linear ``assembly`` axis in one vectorized lookup.
+    """
+    assembly = get_assembly(assembly)
+    codes = fragments['chrom'].to_numpy()
+    frag_length = fragments['read_end'].to_numpy() - fragments['read_start'].to_numpy()
+    keep = (codes != UNPLACED_CHROM) & (frag_length <= MAX_FRAGMENT_LENGTH)
+
+    fragments = fragments[keep].copy()
+    offsets = assembly.offsets_for(fragments['chrom'].to_numpy())
+    fragments['read_start'] += offsets
+    fragments['read_end'] += offsets
+    fragments['frag_length'] = frag_length[keep]
+    return fragments
+
+
+def fragment_keys(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Pack fragments into int64 keys ``start << 10 | length``.
+
+    Keys order fragments by start, then length, and are equal exactly when
+    both ends are, so one integer sort serves deduplication and any
+    position-ordered pass after it.
+    """
+    return (starts << _LENGTH_BITS) | (ends - starts)
+
+
+class _SeenFragments:
+    """
+    Sorted set of packed (start, length) keys used to drop duplicate fragments.
+
+    The keys live in a buffer grown geometrically, so it is reallocated only
+    a logarithmic number of times; each chunk's new keys are merged in place.
+    """
+
+    def __init__(self):
+        self._buffer = np.empty(0, dtype=np.int64)
+        self.size = 0
+
+    @property
+    def keys(self) -> np.ndarray:
+        return self._buffer[:self.size]
+
+    def _insert(self, new: np.ndarray, ranks: np.ndarray) -> None:
+        """
+        Merge the sorted keys ``new``, none of them in the set yet, into the
+        buffer; ``ranks`` counts the keys of the set below each of them.
+        """
+        size = self.size + len(new)
+        if size > len(self._buffer):
+            grown = np.empty(max(size, 2 * len(self._buffer)), dtype=np.int64)
+            grown[:self.size] = self.keys
+            self._buffer = grown
+        if not len(new):
+            return
+
+        # Final slot of every new key: the old keys below it plus the new keys before it
+        slots = ranks + np.arange(len(new))
+        first = int(slots[0])
+        # Old keys from the first slot on move up into the slots left free
+        free = np.ones(size - first, dtype=bool)
+        free[slots - first] = False
+        tail = self._buffer[first:self.size].copy()
+        self._buffer[first:size][free] = tail
+        self._buffer[slots] = new
+        self.size = size
+
+    def new_rows(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        Return the rows of first occurrences not seen in earlier chunks,
+        ordered by position.
+
+        One stable argsort of the packed keys finds the duplicates within the
+        chunk (keeping the first in file order); a binary search against the
+        sorted keys of earlier chunks drops the rest, and the new keys are
+        merged into the set without sorting it again.
+        """
+        keys = fragment_keys(starts, ends)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+
+        ranks = np.searchsorted(self.keys, sorted_keys)
+        if self.size:
+            first &= self.keys[np.minimum(ranks, self.size - 1)] != sorted_keys
+
+        self._insert(sorted_keys[first], ranks[first])
+        return order[first]
+
+
+def iter_unique_fragment_frames(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                assembly='hg38', qc=None) -> Iterator[pd.DataFrame]:
+    """
+    Yield linearized, deduplicated fragments one chunk at a time.
+
+    Fragments are filtered by ``linearize_fragments`` and a fragment sharing
+    both ends with one already yielded is dropped. Each chunk comes out
+    sorted by start (then length), as a by-product of deduplication. Every
+    per-sample feature (histogram, size profile, fragment file) is computed
+    from this single pass; a ``qc.SampleQC`` passed as ``qc`` counts what
+    is filtered and deduplicated along the way.
+    """
+    assembly = get_assembly(assembly)
+    seen = _SeenFragments()
+    for fragments in iter_fragments(path, chunk_size, assembly):
+        if qc is not None:
+            qc.observe_fragments(fragments['chrom'].to_numpy(),
+                                 (fragments['read_end'] - fragments['read_start']).to_numpy())
+        fragments = linearize_fragments(fragments, assembly)
+        starts = fragments['read_start'].to_numpy(dtype=np.int64)
+        ends = fragments['read_end'].to_numpy(dtype=np.int64)
+
+        # Drop fragments sharing both ends with one already counted
+        rows = seen.new_rows(starts, ends)
+        if qc is not None:
+            qc.observe_unique(len(fragments), (ends - starts)[rows])
+        yield fragments.iloc[rows]
+
+
+def iter_unique_fragments(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          assembly='hg38', qc=None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yield the linear-genome ``(starts, ends)`` of ``iter_unique_fragment_frames``."""
+    for fragments in iter_unique_fragment_frames(path, chunk_size, assembly, qc):
+        yield fragments['read_start'].to_numpy(dtype=np.int64), fragments['read_end'].to_numpy(dtype=np.int64)
+
+
+def bed_histogram(path: str, num_bins: int = NUM_BINS, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  assembly='hg38', qc=None) -> np.ndarray:
+    """
+    Bin the fragment start and end positions of one BED file.
+
+    Args:
+        path: Path to a ``.bed`` or ``.bed.gz`` file from ``bamtobed``, or
+            a binary stream of BED text
+        num_bins: Number of equal-width bins over the linear genome
+        chunk_size: Number of BED records parsed at a time
+        assembly: Reference assembly name or ``GenomeAssembly``
+        qc: Optional ``qc.SampleQC`` collecting metrics in the same pass
+
+    Returns:
+        np.ndarray: ``num_bins`` counts of deduplicated fragment ends
+    """
+    assembly = get_assembly(assembly)
+    hist = np.zeros(num_bins, dtype=np.int64)
+    for starts, ends in iter_unique_fragments(path, chunk_size, assembly, qc):
+        # Integer bin arithmetic and one bincount, no sort (see GenomeAssembly.bin_index)
+        hist += assembly.histogram(np.concatenate([starts, ends]), num_bins)
+
+    logger.debug("Binned %d fragment ends from %s", hist.sum(), path)
+    return hist
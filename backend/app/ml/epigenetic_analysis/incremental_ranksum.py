@@ -0,0 +1,223 @@
+"""
+Incremental rank-sum statistics for a growing cohort
+
+A rank-sum test of one bin depends only on the multiset of counts in each
+group. ``RankSumState`` keeps that multiset as a per-bin frequency table of
+small counts (values below ``width``) plus a sorted list of the rare larger
+counts, together with the current U statistic and tie term of every bin.
+
+Adding a sample then changes each bin's U by the number of opposite-group
+values below (and half of those equal to) the new count, and its tie term
+by ``3t(t + 1)`` for a tie group growing from ``t`` members. That costs
+``O(bins x width)`` and never touches the existing samples' counts,
+instead of re-ranking the ``bins x samples`` matrix.
+"""
+
+import logging
+
+import numpy as np
+import scipy.sparse
+
+from .feature_selection import BinSelection, TopKSelector
+from .ranksum import (
+    DEFAULT_BLOCK_SIZE,
+    RankSumBlock,
+    RankSumResult,
+    normal_approximation,
+    rank_sums,
+)
+
+__all__ = [
+    'RankSumState',
+]
+
+logger = logging.getLogger(__name__)
+
+# Counts below this value are tracked in the dense frequency table; the
+# table takes 4 * width bytes per bin (256 MB for 2M bins at the default)
+DEFAULT_WIDTH = 32
+
+# Large counts are keyed as bin << _VALUE_BITS | value in the sorted overflow list
+_VALUE_BITS = 32
+
+
+def _dense_rows(matrix, start: int, stop: int) -> np.ndarray:
+    """Read the bins ``start:stop`` of a (samples x bins) matrix as a dense array."""
+    block = matrix[:, start:stop]
+    if scipy.sparse.issparse(block):
+        return block.toarray()
+    return np.asarray(block)
+
+
+class RankSumState:
+    """
+    Sufficient statistics of per-bin rank-sum tests between two groups.
+
+    Group 0 is the first (``x``) group and U refers to it, as in
+    ``ranksum.ranksums_matrix``.
+
+    Attributes:
+        n: Number of samples in each group
+        u: Mann-Whitney U of the first group, per bin
+        ties: Sum of ``t^3 - t`` over tie groups, per bin
+        freq: (2 x bins x width) counts of each small value per group
+        overflow: Per-group sorted keys of values ``>= width``
+    """
+
+    def __init__(self, num_bins: int, width: int = DEFAULT_WIDTH):
+        self.num_bins = num_bins
+        self.width = width
+        self.n = [0, 0]
+        self.u = np.zeros(num_bins)
+        self.ties = np.zeros(num_bins)
+        self.freq = np.zeros((2, num_bins, width), dtype=np.uint16)
+        self.overflow = [np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)]
+
+    def __repr__(self) -> str:
+        return f"RankSumState({self.n[0]} vs {self.n[1]} samples, {self.num_bins} bins)"
+
+    @classmethod
+    def from_matrices(cls, x, y, width: int = DEFAULT_WIDTH, block_size: int = DEFAULT_BLOCK_SIZE) -> 'RankSumState':
+        """
+        Build the state of two (samples x bins) count matrices in one pass.
+
+        ``x`` and ``y`` may be NumPy arrays, memory maps or scipy sparse
+        matrices; they are read one block of bins at a time.
+        """
+        n1, n2 = x.shape[0], y.shape[0]
+        state = cls(x.shape[1], width)
+        state.n = [n1, n2]
+        overflow = [[], []]
+
+        for start in range(0, state.num_bins, block_size):
+            stop = min(start + block_size, state.num_bins)
+            blocks = [_dense_rows(x, start, stop), _dense_rows(y, start, stop)]
+
+            data = np.ascontiguousarray(np.concatenate(blocks, axis=0).T)
+            s, state.ties[start:stop] = rank_sums(data, n1)
+            state.u[start:stop] = s - n1 * (n1 + 1) / 2.0
+
+            bins = np.arange(start, stop)
+            for group, block in enumerate(blocks):
+                values = block.astype(np.int64)
+                small = values < width
+                index = (bins - start) * width + values
+                state.freq[group, start:stop] = np.bincount(
+                    index[small], minlength=(stop - start) * width
+                ).reshape(stop - start, width)
+                rows, cols = np.nonzero(~small)
+                overflow[group].append((bins[cols] << _VALUE_BITS) | values[rows, cols])
+
+        for group in (0, 1):
+            if overflow[group]:
+                state.overflow[group] = np.sort(np.concatenate(overflow[group]))
+        return state
+
+    def _overflow_counts(self, group: int, bins: np.ndarray, values: np.ndarray):
+        """Count overflow values of ``group`` below and equal to ``values`` in ``bins``."""
+        keys = self.overflow[group]
+        base = np.searchsorted(keys, bins << _VALUE_BITS)
+        left = np.searchsorted(keys, (bins << _VALUE_BITS) | values)
+        right = np.searchsorted(keys, (bins << _VALUE_BITS) | values, side='right')
+        return left - base, right - left
+
+    def _compare(self, group: int, values: np.ndarray, block_size: int):
+        """
+        For every bin, count values of ``group`` below and equal to ``values``.
+
+        Returns:
+            Tuple of ``(below, equal)`` arrays with one entry per bin
+        """
+        below = np.empty(self.num_bins, dtype=np.int64)
+        equal = np.empty(self.num_bins, dtype=np.int64)
+        small = values < self.width
+        clipped = np.minimum(values, self.width - 1)
+        columns = np.arange(self.width)
+
+        for start in range(0, self.num_bins, block_size):
+            stop = min(start + block_size, self.num_bins)
+            freq = self.freq[group, start:stop]
+            v = clipped[start:stop, None]
+            below[start:stop] = np.where(columns < v, freq, 0).sum(axis=1)
+            equal[start:stop] = np.take_along_axis(freq, v, axis=1)[:, 0]
+
+        # Large values rank above every small one; compare them among the
+        # overflow list only
+        wide = np.flatnonzero(~small)
+        if len(wide):
+            dense_total = self.freq[group, wide].sum(axis=1, dtype=np.int64)
+            overflow_below, overflow_equal = self._overflow_counts(group, wide, values[wide])
+            below[wide] = dense_total + overflow_below
+            equal[wide] = overflow_equal
+        return below, equal
+
+    def add(self, hist: np.ndarray, group: int, block_size: int = DEFAULT_BLOCK_SIZE) -> None:
+        """
+        Add one sample's per-bin counts to ``group`` (0 for ``x``, 1 for ``y``).
+
+        Updates U, the tie terms and the frequency tables of every bin
+        without reading any previously added sample.
+        """
+        values = np.asarray(hist, dtype=np.int64)
+        if values.shape != (self.num_bins,):
+            raise ValueError(f"Expected {self.num_bins} bin counts, got shape {values.shape}")
+        if group not in (0, 1):
+            raise ValueError("group must be 0 (x) or 1 (y)")
+        other = 1 - group
+
+        below, equal = self._compare(other, values, block_size)
+        if group == 0:
+            self.u += below + 0.5 * equal
+        else:
+            above = self.n[0] - below - equal
+            self.u += above + 0.5 * equal
+
+        # The tie group of the new value grows from t to t + 1 members
+        _, same = self._compare(group, values, block_size)
+        t = (equal + same).astype(np.float64)
+        self.ties += 3.0 * t * (t + 1.0)
+
+        bins = np.arange(self.num_bins)
+        small = values < self.width
+        self.freq[group, bins[small], values[small]] += 1
+        if not small.all():
+            keys = (bins[~small] << _VALUE_BITS) | values[~small]
+            self.overflow[group] = np.sort(np.concatenate([self.overflow[group], keys]))
+        self.n[group] += 1
+
+    def statistics(self, tie_correction: bool = False) -> RankSumResult:
+        """Return U, z and the two-sided p-value of every bin."""
+        z, pvalue = normal_approximation(self.u, self.ties, self.n[0], self.n[1], tie_correction)
+        return RankSumResult(self.u.copy(), z, pvalue)
+
+    def select(self, k: int = 10000, correction: str = 'bonferroni', alpha: float = 0.05,
+               significant_only: bool = True, tie_correction: bool = False) -> BinSelection:
+        """Refresh the top-``k`` bin selection from the current statistics."""
+        selector = TopKSelector(k, self.num_bins, correction, alpha, significant_only)
+        selector.update(RankSumBlock(0, self.num_bins, *self.statistics(tie_correction)))
+        return selector.result()
+
+    def save(self, path: str) -> None:
+        """Write the state to an uncompressed ``.npz`` file."""
+        np.savez(
+            path,
+            n=np.asarray(self.n),
+            u=self.u,
+            ties=self.ties,
+            freq=self.freq,
+            overflow_x=self.overflow[0],
+            overflow_y=self.overflow[1],
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'RankSumState':
+        """Read a state written by ``save``."""
+        with np.load(path) as saved:
+            freq = saved['freq']
+            state = cls(freq.shape[1], freq.shape[2])
+            state.n = [int(n) for n in saved['n']]
+            state.u = saved['u']
+            state.ties = saved['ties']
+            state.freq = freq
+            state.overflow = [saved['overflow_x'], saved['overflow_y']]
+        return state
@@ -2,23 +2,38 @@ import pandas as pd
 import math
 import numpy as np
 
-# Read the input data from a CSV file, modify the file location to accommodate your environment 
-df = pd.read_csv(r'/Desktop/SraRunTable.txt')
+__all__ = ['split_run_table']
 
-# Select specific columns from the DataFrame
-df = df[['Run', 'Age', 'disease', 'AvgSpotLen', 'Bases', 'sex', 'disease_stage', 'Library Name']]
 
-# Filter rows based on Library Name ending with 'PC'
-df = df[df['Library Name'].str.endswith('PC')]
+def split_run_table(path, library_suffix='PC'):
+    # Read the input data from a CSV file, modify the file location to accommodate your environment
+    df = pd.read_csv(path)
 
-# Calculate the estimated number of reads
-df['reads'] = ((df['Bases'] / (df['AvgSpotLen'] * 2))).apply(np.floor).astype(int)
+    # Select specific columns from the DataFrame
+    df = df[['Run', 'Age', 'disease', 'AvgSpotLen', 'Bases', 'sex', 'disease_stage', 'Library Name']]
 
-# Separate data into cancer and control groups and save to separate files
-df_cancer = df[df['disease'] == 'COLORECTAL CANCER']
-df_cancer.to_csv(r'c:\users\jeremie\desktop\df_cancer.txt', index=None)
-print(df_cancer.head())
+    # Filter rows based on Library Name ending with 'PC'
+    df = df[df['Library Name'].str.endswith(library_suffix)].copy()
 
-df_control = df[df['disease'] == 'CONTROL']
-df_control.to_csv(r'c:\users\jeremie\desktop\df_control.txt', index=None)
-print(df_control.head())
+    # Calculate the estimated number of reads
+    df['reads'] = ((df['Bases'] / (df['AvgSpotLen'] * 2))).apply(np.floor).astype(int)
+
+    # Separate data into cancer and control groups
+    df_cancer = df[df['disease'] == 'COLORECTAL CANCER']
+    df_control = df[df['disease'] == 'CONTROL']
+    return df_cancer, df_control
+
+
+def main():
+    df_cancer, df_control = split_run_table(r'/Desktop/SraRunTable.txt')
+
+    # Save the cancer and control groups to separate files
+    df_cancer.to_csv(r'c:\users\jeremie\desktop\df_cancer.txt', index=None)
+    print(df_cancer.head())
+
+    df_control.to_csv(r'c:\users\jeremie\desktop\df_control.txt', index=None)
+    print(df_control.head())
+
+
+if __name__ == '__main__':
+    main()
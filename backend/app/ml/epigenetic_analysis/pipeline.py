@@ -0,0 +1,769 @@
+"""
+Concurrent SRA-to-BED pipeline runner
+
+In the default (batch) mode each SRA run passes through three stages:
+
+* ``fetch``: download a window of paired reads with ``fastq-dump`` (I/O bound)
+* ``align``: ``bowtie2 | samtools view`` into an unsorted BAM (CPU bound)
+* ``convert``: ``samtools sort`` / ``index`` and ``bedtools bamtobed | gzip``
+
+Every stage has its own bounded worker pool, connected by bounded queues:
+while one sample aligns, the next ones download and earlier ones convert.
+When alignment falls behind, the queue in front of it fills and the fetch
+workers block, so downloaded FASTQs never pile up on scratch disk
+(back-pressure).
+
+``ToolCommands.streaming()`` instead chains ``fastq-dump | bowtie2 |
+samtools view | bedtools bamtobed`` through OS pipes in a single ``stream``
+stage: no FASTQ or BAM touches the scratch disk. bowtie2 writes both mates of
+a pair together, so the BED stream arrives grouped by read name and is
+consumed in-process by a sink, e.g. ``HistogramSink``, which bins it while it
+is being aligned.
+
+Progress is recorded in one JSON state file per sample. A rerun skips
+finished samples and resumes the others after their last completed stage
+whose outputs still exist.
+
+External tools are described by ``ToolCommands`` argv templates, so they can
+be swapped out; ``ToolCommands.stub()`` replaces them with small local
+Python commands that produce synthetic outputs, for testing the scheduler
+offline.
+"""
+
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import cpu_count
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .cohort import (MANIFEST_FILE, QC_FILE, CohortStore, count_digest, load_manifest, load_qc, merge_staged_rows,
+                     write_json_atomic)
+from .fragmentomics import PROFILES_FILE, FragmentSizeProfile, write_profiles_header
+from .fragment_file import FRAGMENT_SUFFIX, FragmentFile, collect_fragments, write_fragment_file
+from .fragments import DEFAULT_CHUNK_SIZE, NUM_BINS, bed_histogram, iter_unique_fragment_frames
+from .genome import get_assembly
+from .qc import SampleQC
+
+__all__ = [
+    'STAGES',
+    'SINK',
+    'SraSample',
+    'StageError',
+    'ToolCommands',
+    'BedSink',
+    'HistogramSink',
+    'CohortSink',
+    'PipelineRunner',
+]
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('fetch', 'align', 'convert')
+
+# ``stdout`` of a step whose BED output is handed to the runner's sink
+SINK = '<sink>'
+
+# Number of read pairs downloaded per run by the original script
+DEFAULT_NUM_READS = 1000000
+
+# Lines of a failed command's stderr kept in the state file
+_ERROR_TAIL = 20
+
+# Sentinel telling a stage worker to exit
+_DONE = object()
+
+
+class SraSample(NamedTuple):
+    """One SRA run to process."""
+    run: str
+    reads: int
+    label: str = 'cancer'
+
+
+class StageError(RuntimeError):
+    """Raised when an external command of a stage exits with a non-zero status."""
+
+
+# A step is a list of commands piped into each other; its stdout optionally
+# goes to a file (or to the sink). A stage is a list of steps run in order.
+Step = Dict[str, object]
+
+
+def _literal(script: str) -> str:
+    """Escape a ``-c`` script so template formatting leaves it unchanged."""
+    return script.replace('{', '{{').replace('}', '}}')
+
+
+def _step(*commands: List[str], stdout: Optional[str] = None) -> Step:
+    return {'commands': list(commands), 'stdout': stdout}
+
+
+_BATCH_STAGES = {
+    'fetch': [
+        _step(['fastq-dump', '--gzip', '--split-files', '-N', '{start}', '-X', '{end}',
+               '{run}', '--outdir', '{fastq_dir}']),
+    ],
+    'align': [
+        _step(['bowtie2', '-p', '{threads}', '-x', '{genome_index}', '-1', '{fastq_1}', '-2', '{fastq_2}'],
+              ['samtools', 'view', '-bS', '-'], stdout='{bam}'),
+    ],
+    'convert': [
+        _step(['samtools', 'sort', '-@', '{threads}', '-o', '{sorted_bam}', '{bam}']),
+        _step(['samtools', 'index', '{sorted_bam}']),
+        _step(['bedtools', 'bamtobed', '-i', '{sorted_bam}'], ['gzip'], stdout='{bed}'),
+    ],
+}
+
+# Files each batch stage leaves for the next one, and scratch files it frees
+_BATCH_OUTPUTS = {
+    'fetch': ['{fastq_1}', '{fastq_2}'],
+    'align': ['{bam}'],
+    'convert': ['{bed}'],
+}
+_BATCH_SCRATCH = {
+    'fetch': [],
+    'align': ['{fastq_1}', '{fastq_2}'],
+    'convert': ['{bam}', '{sorted_bam}', '{sorted_bam}.bai'],
+}
+
+# Interleaved reads from fastq-dump, aligned from stdin, converted to
+# uncompressed BAM (nothing is written, so compressing it is wasted CPU)
+_STREAM_STAGES = {
+    'stream': [
+        _step(['fastq-dump', '--split-spot', '--stdout', '-N', '{start}', '-X', '{end}', '{run}'],
+              ['bowtie2', '-p', '{threads}', '-x', '{genome_index}', '--interleaved', '-'],
+              ['samtools', 'view', '-u', '-'],
+              ['bedtools', 'bamtobed', '-i', 'stdin'], stdout=SINK),
+    ],
+}
+
+
+class ToolCommands:
+    """
+    Argv templates of the external tools, formatted per sample.
+
+    Templates may use ``{run}``, ``{label}``, ``{start}``, ``{end}``,
+    ``{threads}``, ``{genome_index}``, ``{fastq_dir}``, ``{fastq_1}``,
+    ``{fastq_2}``, ``{bam}``, ``{sorted_bam}`` and ``{bed}``.
+
+    Args:
+        genome_index: bowtie2 index prefix
+        stages: Ordered mapping of stage name to steps (defaults to the
+            batch fetch/align/convert stages)
+        outputs: Files each stage leaves for the next one; a stage is only
+            considered complete on resume while they exist
+        scratch: Files deleted once a stage has completed
+    """
+
+    def __init__(self, genome_index: str = 'human_ge', stages: Dict[str, Sequence[Step]] = None,
+                 outputs: Dict[str, Sequence[str]] = None, scratch: Dict[str, Sequence[str]] = None):
+        self.genome_index = genome_index
+        self.stages = dict(stages if stages is not None else _BATCH_STAGES)
+        self.outputs = dict(outputs if outputs is not None else _BATCH_OUTPUTS)
+        self.scratch = dict(scratch if scratch is not None else _BATCH_SCRATCH)
+
+    @property
+    def names(self) -> tuple:
+        """Stage names in execution order."""
+        return tuple(self.stages)
+
+    @classmethod
+    def streaming(cls, genome_index: str = 'human_ge') -> 'ToolCommands':
+        """
+        Single-stage commands piping every tool into the next.
+
+        The BED output of ``bedtools bamtobed`` goes to the runner's sink
+        instead of a file; nothing is written to scratch disk.
+        """
+        return cls(genome_index, _STREAM_STAGES, outputs={'stream': []}, scratch={'stream': []})
+
+    @classmethod
+    def stub(cls, delay: float = 0.0, num_pairs: int = 1000, streaming: bool = False) -> 'ToolCommands':
+        """
+        Local stand-ins for every tool, for testing without network or aligner.
+
+        Each stub sleeps ``delay`` seconds and writes a placeholder output;
+        the ``bamtobed`` stub emits ``num_pairs`` synthetic read pairs, so
+        downstream BED consumers receive parseable input. With ``streaming``
+        the stubs are piped like ``ToolCommands.streaming()``.
+        """
+        python = sys.executable
+        bamtobed = [python, '-c', _literal(_STUB_BED), '{run}', str(num_pairs)]
+        if streaming:
+            return cls('stub', {
+                'stream': [_step([python, '-c', _literal(_STUB_ECHO), 'aligned {run}', str(delay)],
+                                 [python, '-c', _literal(_STUB_CAT)],
+                                 bamtobed, stdout=SINK)],
+            }, outputs={'stream': []}, scratch={'stream': []})
+        return cls('stub', {
+            'fetch': [_step([python, '-c', _literal(_STUB_FETCH), '{fastq_dir}', '{run}', str(delay)])],
+            'align': [_step([python, '-c', _literal(_STUB_ECHO), 'aligned {run}', str(delay)],
+                            [python, '-c', _literal(_STUB_CAT)], stdout='{bam}')],
+            'convert': [
+                _step([python, '-c', _literal(_STUB_COPY), '{bam}', '{sorted_bam}', str(delay)]),
+                _step([python, '-c', _literal(_STUB_COPY), '{sorted_bam}', '{sorted_bam}.bai', '0']),
+                _step(bamtobed, [python, '-c', _literal(_STUB_GZIP)], stdout='{bed}'),
+            ],
+        })
+
+    def format(self, stage: str, fields: Dict[str, object]) -> List[Step]:
+        """Fill the templates of one stage with a sample's fields."""
+        return [
+            {
+                'commands': [[arg.format(**fields) for arg in command] for command in step['commands']],
+                'stdout': step['stdout'] if step['stdout'] in (None, SINK) else step['stdout'].format(**fields),
+            }
+            for step in self.stages[stage]
+        ]
+
+    def sinks(self, stage: str) -> bool:
+        """Whether a stage hands its output to the runner's sink."""
+        return any(step['stdout'] == SINK for step in self.stages[stage])
+
+
+_STUB_FETCH = '''import gzip, os, sys, time
+outdir, run, delay = sys.argv[1], sys.argv[2], float(sys.argv[3])
+time.sleep(delay)
+for mate in (1, 2):
+    with gzip.open(os.path.join(outdir, f"{run}_{mate}.fastq.gz"), "wt") as f:
+        f.write(f"@{run}.1/{mate}\\nACGT\\n+\\nIIII\\n")
+'''
+
+_STUB_ECHO = '''import sys, time
+time.sleep(float(sys.argv[2]))
+print(sys.argv[1])
+'''
+
+_STUB_CAT = '''import shutil, sys
+shutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)
+'''
+
+_STUB_COPY = '''import shutil, sys, time
+time.sleep(float(sys.argv[3]))
+if sys.argv[1] != sys.argv[2]:
+    shutil.copyfile(sys.argv[1], sys.argv[2])
+'''
+
+_STUB_BED = '''import random, sys
+sys.stdin.buffer.read()
+run, pairs = sys.argv[1], int(sys.argv[2])
+rng = random.Random(run)
+out = sys.stdout
+for i in range(pairs):
+    chrom = f"chr{rng.randint(1, 22)}"
+    start = rng.randint(10000, 40000000)
+    length = rng.randint(120, 400)
+    out.write(f"{chrom}\\t{start}\\t{start + 50}\\t{run}.{i}/1\\t42\\t+\\n")
+    out.write(f"{chrom}\\t{start + length - 50}\\t{start + length}\\t{run}.{i}/2\\t42\\t-\\n")
+'''
+
+_STUB_GZIP = '''import gzip, shutil, sys
+with gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb") as f:
+    shutil.copyfileobj(sys.stdin.buffer, f)
+'''
+
+
+class _TeeStream(io.RawIOBase):
+    """Readable stream copying everything read from ``source`` into ``copy``."""
+
+    def __init__(self, source, copy):
+        self.source = source
+        self.copy = copy
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.source.read1(len(buffer))
+        buffer[:len(data)] = data
+        self.copy.write(data)
+        return len(data)
+
+
+class BedSink:
+    """
+    Consumer of the BED stream of a streaming stage.
+
+    The base sink gzips the stream to ``{bed}``, giving the same file as the
+    batch mode. Subclasses consume the stream differently; ``complete``
+    tells the runner on resume whether a sample's output is in place, and
+    ``finish`` runs once all samples of a ``run`` are through.
+    """
+
+    keep_bed = True
+
+    def outputs(self, fields: Dict[str, object]) -> List[str]:
+        """Files whose existence marks a sample as done."""
+        return [fields['bed']] if self.keep_bed else []
+
+    def complete(self, fields: Dict[str, object]) -> bool:
+        return all(os.path.exists(path) for path in self.outputs(fields))
+
+    def finish(self) -> None:
+        pass
+
+    @contextmanager
+    def _reading(self, stream, fields: Dict[str, object]):
+        """Yield ``stream``, gzipping what is read from it to ``{bed}`` when ``keep_bed`` is set."""
+        if not self.keep_bed:
+            yield stream
+            return
+        with gzip.open(fields['bed'], 'wb') as bed:
+            yield io.BufferedReader(_TeeStream(stream, bed))
+
+    def __call__(self, sample: SraSample, stream, fields: Dict[str, object]) -> None:
+        with gzip.open(fields['bed'], 'wb') as f:
+            shutil.copyfileobj(stream, f)
+
+
+class HistogramSink(BedSink):
+    """
+    Bin the BED stream as it is produced, like ``bed_histogram`` does a file.
+
+    Writes ``<label>_<run>.hist.npy`` next to the BED files. With
+    ``keep_bed`` the stream is also gzipped to ``{bed}`` on the way through.
+    """
+
+    def __init__(self, num_bins: int = NUM_BINS, keep_bed: bool = False,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, assembly='hg38'):
+        self.num_bins = num_bins
+        self.keep_bed = keep_bed
+        self.chunk_size = chunk_size
+        self.assembly = assembly
+
+    def outputs(self, fields: Dict[str, object]) -> List[str]:
+        return [fields['hist']] + super().outputs(fields)
+
+    def __call__(self, sample: SraSample, stream, fields: Dict[str, object]) -> None:
+        with self._reading(stream, fields) as bed:
+            hist = bed_histogram(bed, self.num_bins, self.chunk_size, self.assembly)
+        np.save(fields['hist'], hist)
+
+
+class CohortSink(BedSink):
+    """
+    Bin every BED stream straight into its row of a cohort store.
+
+    The store holds one row per sample, named ``<label>_<run>.bed.gz`` and
+    labelled like ``build_cohort`` would from the BED files, and records
+    completed rows and their digests in its build manifest and the QC
+    metrics of every sample in ``qc.json``, so a run can be resumed and the
+    store used exactly like one built from BED files. A run whose stream is
+    empty (nothing aligned) gets an all-zero row and the ``empty`` QC flag.
+
+    Args:
+        path: Cohort store directory (created on first use)
+        samples: Every sample of the cohort, in row order
+        num_bins: Histogram bins per sample
+        layout: ``'dense'`` or ``'csr'``
+        keep_bed: Also gzip the BED stream to ``<label>_<run>.bed.gz``
+        profile_bins: If set, also store ``FragmentSizeProfile`` counts at
+            this resolution in the store, readable with ``FragmentProfiles``
+        classes: Size classes of the profile (defaults to ``DEFAULT_SIZE_CLASSES``)
+        fragment_dir: If set, also write a ``FragmentFile`` per sample here
+            (``<label>_<run>.frag``), from which other resolutions can be
+            binned later without any BED
+        chunk_size: BED records parsed at a time
+        assembly: Reference assembly name or ``GenomeAssembly``
+    """
+
+    def __init__(self, path: str, samples: Sequence[SraSample], num_bins: int = NUM_BINS,
+                 layout: str = 'dense', keep_bed: bool = False, profile_bins: Optional[int] = None,
+                 classes=None, fragment_dir: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 assembly='hg38'):
+        self.path = path
+        self.num_bins = num_bins
+        self.keep_bed = keep_bed
+        self.fragment_dir = fragment_dir
+        self.chunk_size = chunk_size
+        self.assembly = get_assembly(assembly)
+
+        names = [f'{sample.label}_{sample.run}.bed.gz' for sample in samples]
+        if CohortStore.exists(path):
+            store = CohortStore(path)
+            self.manifest = load_manifest(store, names, num_bins, self.assembly.name, layout)
+        else:
+            store = CohortStore.create(path, names, [sample.label for sample in samples],
+                                       num_bins, self.assembly, 'auto', layout)
+            self.manifest = {'completed': [], 'digests': {}, 'overflow': {}}
+        self._manifest_path = os.path.join(path, MANIFEST_FILE)
+        write_json_atomic(self._manifest_path, self.manifest)
+        self.qc = load_qc(path)
+        self._rows = {name: row for row, name in enumerate(names)}
+        self._lock = threading.Lock()
+
+        self.profile = None
+        if profile_bins:
+            self.profile = FragmentSizeProfile(profile_bins, classes, self.assembly)
+            if not os.path.exists(os.path.join(path, PROFILES_FILE)):
+                profiles = np.lib.format.open_memmap(os.path.join(path, PROFILES_FILE), mode='w+', dtype=np.uint32,
+                                                     shape=(len(names), profile_bins, len(self.profile.names)))
+                del profiles
+                write_profiles_header(path, names, profile_bins, classes, self.assembly)
+        if fragment_dir:
+            os.makedirs(fragment_dir, exist_ok=True)
+
+    def _fragment_path(self, fields: Dict[str, object]) -> str:
+        return os.path.join(self.fragment_dir, f"{fields['name']}{FRAGMENT_SUFFIX}")
+
+    def complete(self, fields: Dict[str, object]) -> bool:
+        if self.fragment_dir and not FragmentFile.exists(self._fragment_path(fields)):
+            return False
+        return f"{fields['name']}.bed.gz" in self.manifest['completed'] and super().complete(fields)
+
+    def __call__(self, sample: SraSample, stream, fields: Dict[str, object]) -> None:
+        name = f"{fields['name']}.bed.gz"
+        row = self._rows[name]
+        hist = np.zeros(self.num_bins, dtype=np.int64)
+        profile = np.zeros((self.profile.num_bins, len(self.profile.names)), dtype=np.int64) if self.profile else None
+
+        chunks = [] if self.fragment_dir else None
+        qc = SampleQC()
+
+        # One parse of the stream feeds the histogram, the size profile, the
+        # fragment file and the QC metrics
+        with self._reading(stream, fields) as bed:
+            for fragments in iter_unique_fragment_frames(bed, self.chunk_size, self.assembly, qc):
+                starts = fragments['read_start'].to_numpy(dtype=np.int64)
+                ends = fragments['read_end'].to_numpy(dtype=np.int64)
+                hist += self.assembly.histogram(np.concatenate([starts, ends]), self.num_bins)
+                if profile is not None:
+                    profile += self.profile.counts(starts, ends - starts)
+                if chunks is not None:
+                    chunks.append(fragments)
+
+        if chunks is not None:
+            write_fragment_file(self._fragment_path(fields), *collect_fragments(chunks), self.assembly, name, qc.metrics())
+
+        if profile is not None:
+            profiles = np.load(os.path.join(self.path, PROFILES_FILE), mmap_mode='r+')
+            profiles[row] = profile
+            profiles.flush()
+            del profiles
+        written = CohortStore(self.path).write_row(row, hist)
+
+        if not qc.fragments:
+            logger.warning("%s: empty BED stream, recorded as a sample without fragments", sample.run)
+
+        with self._lock:
+            self.qc[name] = qc.metrics(hist)
+            write_json_atomic(os.path.join(self.path, QC_FILE), self.qc)
+            self.manifest['digests'][name] = count_digest(hist)
+            if not written:
+                self.manifest['overflow'][name] = int(hist.max())
+            self.manifest['completed'].append(name)
+            write_json_atomic(self._manifest_path, self.manifest)
+        logger.info("%s: binned %d fragment ends into row %d of %s", sample.run, hist.sum(), row, self.path)
+
+    def finish(self) -> None:
+        """Merge rows that overflowed the store's dtype; finalize a csr store once every row is in."""
+        store = CohortStore(self.path)
+        merge_staged_rows(store, self.manifest, self._manifest_path)
+        if len(self.manifest['completed']) == len(store):
+            store.finalize()
+        elif store.layout == 'csr':
+            logger.info("Cohort %s: %d of %d rows done, not finalized yet",
+                        self.path, len(self.manifest['completed']), len(store))
+
+
+def _run_step(step: Step, log, consume=None) -> None:
+    """
+    Run one step: its commands piped into each other, the last one's stdout
+    optionally redirected to a file or read by ``consume``. No shell is
+    involved.
+
+    Raises:
+        StageError: If any command in the pipe exits non-zero
+    """
+    to_sink = step['stdout'] == SINK
+    if to_sink:
+        stdout_file = subprocess.PIPE
+    else:
+        stdout_file = open(step['stdout'], 'wb') if step['stdout'] else subprocess.DEVNULL
+    processes = []
+    try:
+        previous = None
+        commands = step['commands']
+        for i, command in enumerate(commands):
+            last = i == len(commands) - 1
+            process = subprocess.Popen(
+                command,
+                stdin=previous.stdout if previous else subprocess.DEVNULL,
+                stdout=stdout_file if last else subprocess.PIPE,
+                stderr=log,
+            )
+            if previous:
+                # Let the upstream command receive SIGPIPE if this one exits
+                previous.stdout.close()
+            processes.append(process)
+            previous = process
+        if to_sink:
+            with processes[-1].stdout as stream:
+                consume(stream)
+        codes = [process.wait() for process in processes]
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        if step['stdout'] and not to_sink:
+            stdout_file.close()
+
+    if any(codes):
+        names = ' | '.join(os.path.basename(command[0]) for command in step['commands'])
+        raise StageError(f"{names} exited with status {codes}")
+
+
+class _Job:
+    """Mutable per-sample state shared by the stages, persisted as JSON."""
+
+    def __init__(self, sample: SraSample, state_path: str, state: dict):
+        self.sample = sample
+        self.state_path = state_path
+        self.state = state
+
+    @property
+    def completed(self) -> List[str]:
+        return self.state['completed']
+
+    def save(self, **fields) -> None:
+        self.state.update(fields, updated=time.time())
+        write_json_atomic(self.state_path, self.state)
+
+
+class PipelineRunner:
+    """
+    Run SRA samples through the stages of ``commands`` concurrently.
+
+    Args:
+        commands: Tool templates (``ToolCommands()``, ``ToolCommands.streaming()``
+            or ``ToolCommands.stub()``)
+        work_dir: Scratch directory for FASTQ and BAM files
+        output_dir: Directory receiving ``<label>_<run>.bed.gz`` (or the
+            sink's outputs)
+        state_dir: Directory for per-sample state and log files
+            (defaults to ``<output_dir>/.pipeline``)
+        fetch_workers: Concurrent downloads
+        align_threads: Threads given to each aligner process
+        cpu_budget: Total aligner threads; ``cpu_budget // align_threads``
+            alignments (or streams) run at once (defaults to ``cpu_count()``)
+        convert_workers: Concurrent sort/convert jobs
+        queue_size: Samples allowed to wait in front of each stage
+            (defaults to that stage's worker count)
+        num_reads: Read pairs downloaded per run
+        retries: Extra attempts per stage before a sample is marked failed
+        seed: Seed of the random read windows (chosen once per sample and
+            kept in its state file)
+        sink: Consumer of the BED stream of streaming stages (defaults to
+            ``BedSink()``, which writes ``<label>_<run>.bed.gz``; see also
+            ``HistogramSink`` and ``CohortSink``)
+    """
+
+    def __init__(
+        self,
+        commands: ToolCommands,
+        work_dir: str,
+        output_dir: str,
+        state_dir: Optional[str] = None,
+        fetch_workers: int = 4,
+        align_threads: int = 8,
+        cpu_budget: Optional[int] = None,
+        convert_workers: int = 2,
+        queue_size: Optional[int] = None,
+        num_reads: int = DEFAULT_NUM_READS,
+        retries: int = 1,
+        seed: Optional[int] = None,
+        sink: Optional[BedSink] = None,
+    ):
+        self.commands = commands
+        self.stages = commands.names
+        self.sink = sink or BedSink()
+        self.work_dir = work_dir
+        self.output_dir = output_dir
+        self.state_dir = state_dir or os.path.join(output_dir, '.pipeline')
+        self.align_threads = align_threads
+        align_workers = max(1, (cpu_budget or cpu_count()) // align_threads)
+        self.workers = {
+            'fetch': fetch_workers,
+            'align': align_workers,
+            'convert': convert_workers,
+            'stream': align_workers,
+        }
+        self.queue_size = queue_size
+        self.num_reads = num_reads
+        self.retries = retries
+        self._random = random.Random(seed)
+
+    def _fields(self, job: _Job) -> Dict[str, object]:
+        sample = job.sample
+        bam = os.path.join(self.work_dir, f'{sample.run}.bam')
+        name = f'{sample.label}_{sample.run}'
+        return {
+            'run': sample.run,
+            'label': sample.label,
+            'name': name,
+            'start': job.state['start'],
+            'end': job.state['end'],
+            'threads': self.align_threads,
+            'genome_index': self.commands.genome_index,
+            'fastq_dir': self.work_dir,
+            'fastq_1': os.path.join(self.work_dir, f'{sample.run}_1.fastq.gz'),
+            'fastq_2': os.path.join(self.work_dir, f'{sample.run}_2.fastq.gz'),
+            'bam': bam,
+            'sorted_bam': bam.replace('.bam', '.sorted.bam'),
+            'bed': os.path.join(self.output_dir, f'{name}.bed.gz'),
+            'hist': os.path.join(self.output_dir, f'{name}.hist.npy'),
+        }
+
+    def _stage_complete(self, stage: str, fields: Dict[str, object]) -> bool:
+        """Whether the files a completed stage leaves behind for the next one are in place."""
+        if self.commands.sinks(stage) and not self.sink.complete(fields):
+            return False
+        return all(os.path.exists(path.format(**fields)) for path in self.commands.outputs[stage])
+
+    def _intermediates(self, stage: str, fields: Dict[str, object]) -> List[str]:
+        """Scratch files no longer needed once ``stage`` has completed."""
+        return [path.format(**fields) for path in self.commands.scratch[stage]]
+
+    def _load_job(self, sample: SraSample) -> _Job:
+        """Load or create the state of one sample, picking its read window once."""
+        path = os.path.join(self.state_dir, f'{sample.run}.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                job = _Job(sample, path, json.load(f))
+        else:
+            start = self._random.randint(0, max(sample.reads - self.num_reads, 0))
+            job = _Job(sample, path, {
+                'run': sample.run,
+                'label': sample.label,
+                'start': start,
+                'end': start + self.num_reads - 1,
+                'completed': [],
+                'status': 'pending',
+                'attempts': {},
+            })
+            job.save()
+
+        # Resume after the last completed stage whose outputs still exist;
+        # stages of another mode (batch vs. streaming) do not count
+        fields = self._fields(job)
+        job.state['completed'] = [stage for stage in job.completed if stage in self.stages]
+        while job.completed and not self._stage_complete(job.completed[-1], fields):
+            job.completed.pop()
+        if job.state['status'] == 'failed':
+            job.state['status'] = 'pending'
+        return job
+
+    def _next_stage(self, job: _Job) -> Optional[str]:
+        for stage in self.stages:
+            if stage not in job.completed:
+                return stage
+        return None
+
+    def _run_stage(self, stage: str, job: _Job) -> bool:
+        """Run one stage of one sample with retries; returns whether it succeeded."""
+        fields = self._fields(job)
+        log_path = os.path.join(self.state_dir, f'{job.sample.run}.log')
+        consume = lambda stream: self.sink(job.sample, stream, fields)
+        for attempt in range(self.retries + 1):
+            job.state['attempts'][stage] = job.state['attempts'].get(stage, 0) + 1
+            job.save(status=f'running:{stage}')
+            started = time.time()
+            try:
+                with open(log_path, 'ab') as log:
+                    for step in self.commands.format(stage, fields):
+                        _run_step(step, log, consume)
+            except (OSError, ValueError, StageError) as error:
+                logger.warning("%s: %s failed (attempt %d): %s", job.sample.run, stage, attempt + 1, error)
+                job.save(status='failed', error=f"{stage}: {error}\n{_log_tail(log_path)}")
+                continue
+
+            for path in self._intermediates(stage, fields):
+                if os.path.exists(path):
+                    os.remove(path)
+            job.completed.append(stage)
+            job.save(status='done' if self._next_stage(job) is None else 'pending', error=None)
+            logger.info("%s: %s finished in %.1fs", job.sample.run, stage, time.time() - started)
+            return True
+        return False
+
+    def _worker(self, stage: str, inbox: queue.Queue, outbox: Optional[queue.Queue]) -> None:
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                return
+            try:
+                succeeded = self._run_stage(stage, job)
+            except Exception as error:
+                # A dead worker would stall the stages feeding it, so any
+                # unexpected error only fails this sample
+                logger.exception("%s: %s crashed", job.sample.run, stage)
+                job.save(status='failed', error=f"{stage}: {error!r}")
+                succeeded = False
+            if succeeded and outbox is not None:
+                # Blocks while the next stage is saturated (back-pressure)
+                outbox.put(job)
+
+    def run(self, samples: Iterable[SraSample]) -> Dict[str, str]:
+        """
+        Process ``samples`` and return the final status of each run.
+
+        Statuses are ``'done'`` or ``'failed'``; details of failures are in
+        the per-sample state and log files.
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.state_dir, exist_ok=True)
+        jobs = [self._load_job(sample) for sample in samples]
+
+        stages = self.stages
+        workers = {stage: self.workers.get(stage, 1) for stage in stages}
+        # The first queue holds the whole backlog; the others are bounded
+        queues = {stage: queue.Queue(maxsize=self.queue_size or workers[stage]) for stage in stages[1:]}
+        queues[stages[0]] = queue.Queue()
+        threads = {}
+        for i, stage in enumerate(stages):
+            outbox = queues[stages[i + 1]] if i + 1 < len(stages) else None
+            threads[stage] = [
+                threading.Thread(target=self._worker, args=(stage, queues[stage], outbox),
+                                 name=f'{stage}-{n}', daemon=True)
+                for n in range(workers[stage])
+            ]
+            for thread in threads[stage]:
+                thread.start()
+
+        pending = [job for job in jobs if self._next_stage(job) is not None]
+        logger.info("Pipeline: %d of %d samples to process (%s workers)", len(pending), len(jobs), workers)
+        for job in pending:
+            queues[self._next_stage(job)].put(job)
+
+        # Stop each stage once the one before it has drained
+        for stage in stages:
+            for _ in threads[stage]:
+                queues[stage].put(_DONE)
+            for thread in threads[stage]:
+                thread.join()
+        self.sink.finish()
+
+        return {job.sample.run: 'done' if self._next_stage(job) is None else 'failed' for job in jobs}
+
+
+def _log_tail(path: str) -> str:
+    """Return the last lines of a sample's log file."""
+    try:
+        with open(path, 'rb') as f:
+            return b''.join(f.readlines()[-_ERROR_TAIL:]).decode(errors='replace')
+    except OSError:
+        return ''
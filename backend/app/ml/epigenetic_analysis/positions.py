@@ -0,0 +1,214 @@
+"""
+Compact sets of genome positions
+
+The fragment-endpoint analysis only needs to know which linear-genome
+positions carry a read start or end. Marking them in a byte array with one
+entry per base (``np.zeros(3088358329, dtype='uint8')``) costs 3 GB per
+sample. Two compact representations with the same query interface are
+provided here:
+
+* ``PositionSet``: the sorted unique positions as ``uint32`` (every hg38 and
+  hg19 position fits), 4 bytes per distinct position; queries are binary
+  searches. Best for typical cfDNA depth.
+* ``PositionBitmap``: one bit per base (~386 MB for hg38), independent of
+  depth. Smaller than ``PositionSet`` once more than 1 in 32 bases is set.
+
+Both support membership, range counts and equal-width histograms over the
+linear genome (binned like ``GenomeAssembly.bin_positions``).
+"""
+
+import logging
+from typing import Iterator, Union
+
+import numpy as np
+
+__all__ = [
+    'PositionSet',
+    'PositionBitmap',
+]
+
+logger = logging.getLogger(__name__)
+
+# Bitmap bytes covered by one precomputed prefix count
+_RANK_BLOCK = 4096
+
+# Bitmap bytes processed at a time when scanning the whole bitmap
+_SCAN_BYTES = _RANK_BLOCK * 256
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def _sorted_unique(positions: np.ndarray) -> np.ndarray:
+    """Sort and deduplicate positions (a plain sort beats ``np.unique`` here)."""
+    positions = np.sort(positions)
+    keep = np.ones(len(positions), dtype=bool)
+    keep[1:] = positions[1:] != positions[:-1]
+    return positions[keep]
+
+
+def _bin_counts(positions: np.ndarray, num_bins: int, genome_length: int) -> np.ndarray:
+    """Histogram sorted positions into ``num_bins`` equal-width bins of the genome."""
+    positions = positions.astype(np.int64)
+    bins = np.minimum(positions * num_bins // genome_length, num_bins - 1)
+    return np.bincount(bins, minlength=num_bins)
+
+
+class PositionSet:
+    """
+    Sorted unique positions on a linear genome of ``genome_length`` bp.
+
+    Attributes:
+        positions: Sorted, unique ``uint32`` positions
+        genome_length: Length of the position axis
+    """
+
+    def __init__(self, positions: np.ndarray, genome_length: int):
+        self.positions = positions
+        self.genome_length = int(genome_length)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __repr__(self) -> str:
+        return f"PositionSet({len(self)} positions, {self.nbytes / 1e6:.1f} MB)"
+
+    def __contains__(self, position: int) -> bool:
+        return bool(self.contains(np.asarray([position]))[0])
+
+    @property
+    def nbytes(self) -> int:
+        return self.positions.nbytes
+
+    @classmethod
+    def from_positions(cls, *arrays, genome_length: int) -> 'PositionSet':
+        """
+        Collect one or more position arrays into a set.
+
+        Raises:
+            ValueError: If a position falls outside ``[0, genome_length)``
+        """
+        if genome_length > np.iinfo(np.uint32).max + 1:
+            raise ValueError("genome_length exceeds the uint32 position range")
+        positions = np.concatenate([np.asarray(a, dtype=np.int64) for a in arrays]) if arrays else np.empty(0, np.int64)
+        if len(positions) and (positions.min() < 0 or positions.max() >= genome_length):
+            raise ValueError(f"Positions must lie in [0, {genome_length})")
+        return cls(_sorted_unique(positions.astype(np.uint32)), genome_length)
+
+    def contains(self, positions) -> np.ndarray:
+        """Return a boolean mask telling which of ``positions`` are in the set."""
+        positions = np.asarray(positions, dtype=np.int64)
+        index = np.searchsorted(self.positions, positions)
+        found = np.zeros(len(positions), dtype=bool)
+        valid = index < len(self.positions)
+        found[valid] = self.positions[index[valid]] == positions[valid]
+        return found
+
+    def count(self, start, stop) -> Union[int, np.ndarray]:
+        """Number of positions in ``[start, stop)``; accepts scalars or arrays of ranges."""
+        result = (np.searchsorted(self.positions, np.asarray(stop, dtype=np.int64))
+                  - np.searchsorted(self.positions, np.asarray(start, dtype=np.int64)))
+        return int(result) if np.ndim(result) == 0 else result
+
+    def histogram(self, num_bins: int) -> np.ndarray:
+        """Count positions in ``num_bins`` equal-width bins over the genome."""
+        return _bin_counts(self.positions, num_bins, self.genome_length)
+
+    def union(self, other: 'PositionSet') -> 'PositionSet':
+        """Return the positions in either set."""
+        return PositionSet(_sorted_unique(np.concatenate([self.positions, other.positions])), self.genome_length)
+
+    def to_bitmap(self) -> 'PositionBitmap':
+        """Convert to the fixed-size bitmap representation."""
+        return PositionBitmap.from_positions(self.positions, genome_length=self.genome_length)
+
+
+class PositionBitmap:
+    """
+    Packed bitset with one bit per genome position (little-endian bit order).
+
+    A prefix count of set bits every ``_RANK_BLOCK`` bytes makes range counts
+    cost at most one block of popcounts.
+    """
+
+    def __init__(self, bits: np.ndarray, genome_length: int):
+        self.bits = bits
+        self.genome_length = int(genome_length)
+        block_counts = [np.empty(0, dtype=np.int64)]
+        for offset in range(0, len(bits), _SCAN_BYTES):
+            chunk = _POPCOUNT[bits[offset:offset + _SCAN_BYTES]]
+            block_counts.append(np.add.reduceat(chunk, np.arange(0, len(chunk), _RANK_BLOCK), dtype=np.int64))
+        self._rank = np.concatenate([[0], np.cumsum(np.concatenate(block_counts))])
+
+    def __len__(self) -> int:
+        return int(self._rank[-1])
+
+    def __repr__(self) -> str:
+        return f"PositionBitmap({len(self)} positions, {self.nbytes / 1e6:.1f} MB)"
+
+    def __contains__(self, position: int) -> bool:
+        return bool(self.contains(np.asarray([position]))[0])
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes + self._rank.nbytes
+
+    @classmethod
+    def from_positions(cls, *arrays, genome_length: int) -> 'PositionBitmap':
+        """Set the bits of one or more position arrays."""
+        positions = _sorted_unique(np.concatenate([np.asarray(a, dtype=np.int64) for a in arrays]))
+        if len(positions) and (positions[0] < 0 or positions[-1] >= genome_length):
+            raise ValueError(f"Positions must lie in [0, {genome_length})")
+
+        bits = np.zeros((genome_length + 7) // 8, dtype=np.uint8)
+        if len(positions):
+            # Positions are sorted, so bits of the same byte are adjacent
+            byte = positions >> 3
+            masks = (1 << (positions & 7)).astype(np.uint8)
+            starts = np.flatnonzero(np.r_[True, byte[1:] != byte[:-1]])
+            bits[byte[starts]] = np.bitwise_or.reduceat(masks, starts)
+        return cls(bits, genome_length)
+
+    def contains(self, positions) -> np.ndarray:
+        """Return a boolean mask telling which of ``positions`` are set."""
+        positions = np.asarray(positions, dtype=np.int64)
+        found = np.zeros(len(positions), dtype=bool)
+        valid = (positions >= 0) & (positions < self.genome_length)
+        p = positions[valid]
+        found[valid] = (self.bits[p >> 3] >> (p & 7)) & 1 == 1
+        return found
+
+    def _rank_of(self, position: int) -> int:
+        """Number of set bits before ``position``."""
+        position = min(max(int(position), 0), self.genome_length)
+        byte, bit = position >> 3, position & 7
+        block = byte // _RANK_BLOCK
+        count = int(self._rank[block])
+        count += int(_POPCOUNT[self.bits[block * _RANK_BLOCK:byte]].sum(dtype=np.int64))
+        if bit:
+            count += int(_POPCOUNT[self.bits[byte] & ((1 << bit) - 1)])
+        return count
+
+    def count(self, start, stop) -> Union[int, np.ndarray]:
+        """Number of set positions in ``[start, stop)``; accepts scalars or arrays of ranges."""
+        if np.ndim(start) == 0 and np.ndim(stop) == 0:
+            return self._rank_of(stop) - self._rank_of(start)
+        return np.array([self._rank_of(b) - self._rank_of(a) for a, b in zip(start, stop)])
+
+    def _iter_positions(self) -> Iterator[np.ndarray]:
+        """Yield the set positions in ascending order, one scan chunk at a time."""
+        for offset in range(0, len(self.bits), _SCAN_BYTES):
+            chunk = np.unpackbits(self.bits[offset:offset + _SCAN_BYTES], bitorder='little')
+            yield np.flatnonzero(chunk) + offset * 8
+
+    def to_positions(self) -> PositionSet:
+        """Convert to the sorted-array representation."""
+        positions = [p.astype(np.uint32) for p in self._iter_positions()]
+        return PositionSet(np.concatenate([np.empty(0, dtype=np.uint32)] + positions), self.genome_length)
+
+    def histogram(self, num_bins: int) -> np.ndarray:
+        """Count set positions in ``num_bins`` equal-width bins over the genome."""
+        counts = np.zeros(num_bins, dtype=np.int64)
+        for positions in self._iter_positions():
+            counts += _bin_counts(positions, num_bins, self.genome_length)
+        return counts
@@ -0,0 +1,172 @@
+"""
+Per-sample quality control metrics gathered during ingestion
+
+A ``SampleQC`` rides along the streaming pass that builds a sample's
+histogram (``bed_histogram(..., qc=...)``): it counts fragments as they are
+filtered and deduplicated and keeps a fragment-length histogram, so no raw
+data is read twice. Once the histogram is complete, coverage evenness is
+derived from it.
+
+Metrics per sample:
+
+* ``fragments``: paired fragments and unpaired reads before filtering
+* ``filtered_fraction``: share dropped as ``chrUn`` or longer than 1000 bp
+  (``unplaced`` and ``too_long`` hold the counts)
+* ``duplicate_rate``: share of the remaining fragments dropped as duplicates
+* ``unique_fragments``: fragments entering the histogram
+* ``length_mode`` / ``length_median``: fragment-length mode and median (bp)
+* ``coverage_cv``: coefficient of variation of the bin counts
+* ``zero_bin_fraction``: share of bins without any fragment end
+* ``empty``: no read at all (e.g. an empty BED stream)
+
+Cohort builders store the metrics next to the count matrix
+(``CohortStore.qc()``), and ``qc_outliers`` flags samples to leave out of
+training; empty samples are always flagged.
+"""
+
+import logging
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .fragments import MAX_FRAGMENT_LENGTH
+from .genome import UNPLACED_CHROM
+
+__all__ = [
+    'SampleQC',
+    'coverage_evenness',
+    'qc_outliers',
+    'DEFAULT_QC_COLUMNS',
+]
+
+logger = logging.getLogger(__name__)
+
+# Metrics screened by ``qc_outliers`` by default
+DEFAULT_QC_COLUMNS = ('filtered_fraction', 'duplicate_rate', 'coverage_cv', 'zero_bin_fraction')
+
+# Scale turning a median absolute deviation into a normal standard deviation
+_MAD_SCALE = 1.4826
+
+
+def coverage_evenness(hist: np.ndarray) -> Dict[str, float]:
+    """Coefficient of variation and zero-bin fraction of a sample's bin counts."""
+    hist = np.asarray(hist, dtype=np.float64)
+    mean = hist.mean() if len(hist) else 0.0
+    return {
+        'coverage_cv': float(hist.std() / mean) if mean > 0 else float('nan'),
+        'zero_bin_fraction': float(np.mean(hist == 0)) if len(hist) else float('nan'),
+    }
+
+
+class SampleQC:
+    """
+    Accumulates ingestion counts of one sample, chunk by chunk.
+
+    Pass an instance as ``qc`` to ``iter_unique_fragment_frames`` (or any of
+    the functions built on it) and call ``metrics`` with the finished
+    histogram.
+    """
+
+    def __init__(self):
+        self.fragments = 0
+        self.unplaced = 0
+        self.too_long = 0
+        self.duplicates = 0
+        self.lengths = np.zeros(MAX_FRAGMENT_LENGTH + 1, dtype=np.int64)
+
+    def __repr__(self) -> str:
+        return f"SampleQC({self.fragments} fragments, {self.unique_fragments} unique)"
+
+    @property
+    def unique_fragments(self) -> int:
+        return int(self.lengths.sum())
+
+    def observe_fragments(self, codes: np.ndarray, lengths: np.ndarray) -> None:
+        """Count a chunk of paired fragments before filtering."""
+        self.fragments += len(codes)
+        unplaced = codes == UNPLACED_CHROM
+        self.unplaced += int(unplaced.sum())
+        self.too_long += int(np.count_nonzero(~unplaced & (lengths > MAX_FRAGMENT_LENGTH)))
+
+    def observe_unique(self, kept: int, lengths: np.ndarray) -> None:
+        """Count the fragments of a filtered chunk and the ``lengths`` of those surviving deduplication."""
+        self.duplicates += kept - len(lengths)
+        self.lengths += np.bincount(lengths, minlength=len(self.lengths))
+
+    def merge(self, other: 'SampleQC') -> 'SampleQC':
+        """Add the counts of another accumulator (e.g. of another lane) to this one."""
+        self.fragments += other.fragments
+        self.unplaced += other.unplaced
+        self.too_long += other.too_long
+        self.duplicates += other.duplicates
+        self.lengths += other.lengths
+        return self
+
+    def metrics(self, hist: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """
+        Return the sample's metrics as a flat dictionary.
+
+        Args:
+            hist: The finished histogram; adds the coverage evenness metrics
+        """
+        filtered = self.unplaced + self.too_long
+        kept = self.fragments - filtered
+        unique = self.unique_fragments
+        cumulative = np.cumsum(self.lengths)
+        metrics = {
+            'fragments': self.fragments,
+            'unplaced': self.unplaced,
+            'too_long': self.too_long,
+            'filtered_fraction': filtered / self.fragments if self.fragments else float('nan'),
+            'duplicates': self.duplicates,
+            'duplicate_rate': self.duplicates / kept if kept else float('nan'),
+            'unique_fragments': unique,
+            'length_mode': int(self.lengths.argmax()) if unique else None,
+            'length_median': int(np.searchsorted(cumulative, (unique + 1) / 2)) if unique else None,
+            'empty': self.fragments == 0,
+        }
+        if hist is not None:
+            metrics['fragment_ends'] = int(np.sum(hist))
+            metrics.update(coverage_evenness(hist))
+        return metrics
+
+
+def qc_outliers(table: pd.DataFrame, columns: Sequence[str] = DEFAULT_QC_COLUMNS, threshold: float = 3.5,
+                min_fragments: Optional[int] = None) -> pd.Series:
+    """
+    Flag samples whose QC metrics are far from the rest of the cohort.
+
+    A sample is flagged when any metric in ``columns`` lies more than
+    ``threshold`` robust z-scores (median / MAD) above the cohort median,
+    or when it has fewer than ``min_fragments`` unique fragments. Only
+    upward deviations count: a low duplicate rate is never a problem.
+    Samples marked ``empty`` are always flagged.
+
+    Args:
+        table: Per-sample metrics, e.g. ``CohortStore.qc()``
+        columns: Metrics to screen
+        threshold: Robust z-score above which a sample is flagged
+        min_fragments: Optional lower bound on ``unique_fragments``
+
+    Returns:
+        pd.Series: Boolean flag per sample, indexed like ``table``
+    """
+    flagged = pd.Series(False, index=table.index)
+    for column in columns:
+        if column not in table:
+            continue
+        values = table[column].astype(float)
+        median = values.median()
+        mad = (values - median).abs().median() * _MAD_SCALE
+        if not mad > 0:
+            continue
+        outlying = (values - median) / mad > threshold
+        flagged |= outlying.fillna(False)
+        if outlying.any():
+            logger.info("QC: %d samples with outlying %s", int(outlying.sum()), column)
+    if 'empty' in table:
+        flagged |= table['empty'].fillna(False).astype(bool)
+    if min_fragments is not None and 'unique_fragments' in table:
+        flagged |= table['unique_fragments'].fillna(0) < min_fragments
+    return flagged
@@ -0,0 +1,268 @@
+"""
+Serving the trained cancer classifier
+
+``AI_simple_NN_WRST.py`` trains the classifier inside a script session.
+``save_model`` writes what scoring needs into one directory:
+
+* ``model.keras``: the trained Keras model
+* ``model.npz``: its weights for the NumPy forward pass (see ``dense_model``)
+* ``scaler.npz``: mean and scale of the fitted ``StandardScaler``
+* ``selected_bins.npz``: the ``BinSelection`` giving the model's input bins
+* ``model.json``: the bin layout the selection refers to
+
+``ModelServer.load`` reads it back once per worker (``get_model_server``
+caches it per directory), together with the cohort store the samples are
+scored from. ``predict`` scores a whole batch of samples in one forward
+pass. ``predict_rows`` gathers only the selected columns of the requested
+rows, sorted by bin so that a memory-mapped matrix is read in one forward
+sweep, so scoring a sample reads the ~10k selected counts rather than
+its 2M-bin row. ``get_model_batcher`` puts a ``MicroBatcher`` in front of
+the server, so concurrent API requests share forward passes.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from .batching import MicroBatcher
+from .cohort import CohortStore, select_bins
+from .dense_model import DenseModel, export_model
+from .feature_selection import BinSelection
+
+__all__ = [
+    'ModelServer',
+    'save_model',
+    'get_model_server',
+    'get_model_batcher',
+]
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = 'model.keras'
+NUMPY_MODEL_FILE = 'model.npz'
+SCALER_FILE = 'scaler.npz'
+SELECTION_FILE = 'selected_bins.npz'
+MODEL_HEADER_FILE = 'model.json'
+
+# Samples per forward pass; larger requests are scored in several passes
+DEFAULT_BATCH_SIZE = 256
+
+
+def save_model(directory: str, model, scaler, selection: BinSelection, num_bins: int,
+               assembly: str = 'hg38') -> None:
+    """
+    Write a trained classifier and its preprocessing as a serving artifact.
+
+    Args:
+        directory: Output directory, created if needed
+        model: Trained Keras model
+        scaler: Fitted ``StandardScaler`` (only ``mean_`` and ``scale_`` are kept)
+        selection: Bins the model was trained on, in column order
+        num_bins: Number of bins of the cohort the bins index into
+        assembly: Reference assembly of that cohort
+    """
+    os.makedirs(directory, exist_ok=True)
+    model.save(os.path.join(directory, MODEL_FILE))
+    export_model(model, os.path.join(directory, NUMPY_MODEL_FILE))
+
+    tmp = os.path.join(directory, f"{SCALER_FILE}.tmp.npz")
+    np.savez(tmp, mean=np.asarray(scaler.mean_, dtype=np.float64), scale=np.asarray(scaler.scale_, dtype=np.float64))
+    os.replace(tmp, os.path.join(directory, SCALER_FILE))
+
+    selection.save(os.path.join(directory, SELECTION_FILE))
+
+    header = {'num_bins': int(num_bins), 'assembly': assembly, 'num_features': len(selection)}
+    tmp = os.path.join(directory, f"{MODEL_HEADER_FILE}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp, os.path.join(directory, MODEL_HEADER_FILE))
+    logger.info("Saved classifier over %d bins to %s", len(selection), directory)
+
+
+class ModelServer:
+    """
+    A trained classifier ready to score samples.
+
+    ``model`` is anything with a Keras-style ``predict_on_batch`` taking a
+    float32 ``(samples, features)`` array and returning one probability of
+    cancer per sample.
+    """
+
+    def __init__(self, model, mean: np.ndarray, scale: np.ndarray, selection: BinSelection, num_bins: int,
+                 assembly: str = 'hg38', cohort: Optional[CohortStore] = None):
+        if not len(mean) == len(scale) == len(selection):
+            raise ValueError(f"scaler has {len(mean)} features but the selection {len(selection)} bins")
+        if cohort is not None and cohort.num_bins != num_bins:
+            raise ValueError(f"model expects {num_bins} bins, cohort {cohort.path} has {cohort.num_bins}")
+        self.model = model
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.selection = selection
+        self.bins = selection.bins
+        self.num_bins = num_bins
+        self.assembly = assembly
+        self.cohort = cohort
+        self._rows: Dict[str, int] = {name: row for row, name in enumerate(cohort.samples)} if cohort else {}
+
+        # Gathering in bin order reads a memory map front to back; _unsort
+        # restores the model's column order afterwards
+        self._sorted_bins = np.sort(self.bins)
+        self._unsort = np.searchsorted(self._sorted_bins, self.bins)
+
+    def __repr__(self) -> str:
+        return f"ModelServer({len(self.bins)} of {self.num_bins} bins, cohort={getattr(self.cohort, 'path', None)!r})"
+
+    @classmethod
+    def load(cls, directory: str, cohort_dir: Optional[str] = None) -> 'ModelServer':
+        """
+        Load a serving artifact written by ``save_model``.
+
+        The model runs on NumPy (``DenseModel``) when the artifact has a
+        ``model.npz``; TensorFlow is only imported for artifacts without one.
+
+        Args:
+            directory: Artifact directory
+            cohort_dir: Optional cohort store to score samples from by name
+        """
+        with open(os.path.join(directory, MODEL_HEADER_FILE)) as f:
+            header = json.load(f)
+        with np.load(os.path.join(directory, SCALER_FILE)) as scaler:
+            mean, scale = scaler['mean'], scaler['scale']
+        selection = BinSelection.load(os.path.join(directory, SELECTION_FILE))
+        if os.path.exists(os.path.join(directory, NUMPY_MODEL_FILE)):
+            model = DenseModel.load(os.path.join(directory, NUMPY_MODEL_FILE))
+        else:
+            import tensorflow as tf
+
+            model = tf.keras.models.load_model(os.path.join(directory, MODEL_FILE), compile=False)
+        cohort = CohortStore(cohort_dir) if cohort_dir else None
+        server = cls(model, mean, scale, selection, header['num_bins'], header.get('assembly', 'hg38'), cohort)
+        logger.info("Loaded %r from %s", server, directory)
+        return server
+
+    def predict(self, features: np.ndarray, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """
+        Score samples from the raw counts of their selected bins.
+
+        Args:
+            features: ``(samples, len(bins))`` counts, columns in ``bins`` order
+            batch_size: Maximum samples per forward pass
+
+        Returns:
+            np.ndarray: Probability of cancer per sample
+        """
+        features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        if features.shape[1] != len(self.bins):
+            raise ValueError(f"expected {len(self.bins)} features per sample, got {features.shape[1]}")
+        scores = np.empty(len(features), dtype=np.float32)
+        for start in range(0, len(features), batch_size):
+            batch = (features[start:start + batch_size] - self.mean) / self.scale
+            scores[start:start + batch_size] = np.asarray(self.model.predict_on_batch(batch)).reshape(-1)
+        return scores
+
+    def gather(self, matrix) -> np.ndarray:
+        """Gather the model's input columns of a dense, memory-mapped or sparse count matrix."""
+        return select_bins(matrix, self._sorted_bins)[:, self._unsort]
+
+    def predict_histograms(self, hists, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """Score samples from full ``(samples, num_bins)`` histograms."""
+        hists = np.atleast_2d(hists)
+        if hists.shape[1] != self.num_bins:
+            raise ValueError(f"expected histograms of {self.num_bins} bins, got {hists.shape[1]}")
+        return self.predict(self.gather(hists), batch_size)
+
+    def row_features(self, rows: Sequence[int]) -> np.ndarray:
+        """Gather the selected columns of rows of the attached cohort store."""
+        if self.cohort is None:
+            raise ValueError("no cohort store attached; load the server with cohort_dir")
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = self.cohort.counts
+        if isinstance(counts, np.ndarray):
+            return counts[rows[:, None], self._sorted_bins][:, self._unsort]
+        return self.gather(counts[rows])
+
+    def predict_rows(self, rows: Sequence[int], batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """Score rows of the attached cohort store, reading only the selected columns."""
+        return self.predict(self.row_features(rows), batch_size)
+
+    def check_samples(self, names: Sequence[str]) -> None:
+        """Raise ``KeyError`` unless every name is a sample of the attached cohort store."""
+        missing = [name for name in names if name not in self._rows]
+        if missing:
+            raise KeyError(f"samples not in cohort: {missing}")
+
+    def predict_samples(self, names: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """Score samples of the attached cohort store by name."""
+        self.check_samples(names)
+        return self.predict_rows([self._rows[name] for name in names], batch_size)
+
+    def predict_items(self, items: Sequence, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """
+        Score a mix of cohort sample names and full histograms in one forward pass.
+
+        This is the ``process`` function of the server's ``MicroBatcher``:
+        the named samples are gathered with one read of the cohort store and
+        the histograms with one gather, then all are scored together.
+        """
+        features = np.empty((len(items), len(self.bins)), dtype=np.float32)
+        named = [i for i, item in enumerate(items) if isinstance(item, str)]
+        if named:
+            self.check_samples([items[i] for i in named])
+            features[named] = self.row_features([self._rows[items[i]] for i in named])
+        other = [i for i, item in enumerate(items) if not isinstance(item, str)]
+        if other:
+            hists = np.stack([np.asarray(items[i]).ravel() for i in other])
+            if hists.shape[1] != self.num_bins:
+                raise ValueError(f"expected histograms of {self.num_bins} bins, got {hists.shape[1]}")
+            features[other] = self.gather(hists)
+        return self.predict(features, batch_size)
+
+
+_servers: Dict[tuple, ModelServer] = {}
+_batchers: Dict[tuple, MicroBatcher] = {}
+_servers_lock = threading.Lock()
+
+
+def _key(directory: str, cohort_dir: Optional[str]) -> tuple:
+    return os.path.abspath(directory), os.path.abspath(cohort_dir) if cohort_dir else None
+
+
+def get_model_server(directory: str, cohort_dir: Optional[str] = None) -> ModelServer:
+    """
+    Return the ``ModelServer`` of ``directory``, loading it on first use.
+
+    The server is kept for the life of the process, so each API worker loads
+    the model, scaler and bins once.
+    """
+    key = _key(directory, cohort_dir)
+    server = _servers.get(key)
+    if server is None:
+        with _servers_lock:
+            server = _servers.get(key)
+            if server is None:
+                server = _servers[key] = ModelServer.load(directory, cohort_dir)
+    return server
+
+
+def get_model_batcher(directory: str, cohort_dir: Optional[str] = None, max_batch_size: int = 64,
+                      max_delay: float = 0.005) -> MicroBatcher:
+    """
+    Return the ``MicroBatcher`` feeding the ``ModelServer`` of ``directory``.
+
+    Concurrent requests of one worker share it, so their samples are scored
+    together: ``await batcher.submit(name_or_histogram)`` returns one
+    probability. The batching parameters of the first call are kept.
+    """
+    key = _key(directory, cohort_dir)
+    batcher = _batchers.get(key)
+    if batcher is None:
+        server = get_model_server(directory, cohort_dir)
+        with _servers_lock:
+            batcher = _batchers.get(key)
+            if batcher is None:
+                batcher = _batchers[key] = MicroBatcher(server.predict_items, max_batch_size, max_delay)
+    return batcher
@@ -0,0 +1 @@
+# Makes the backend directory (and so the ``app`` package) importable for pytest
@@ -0,0 +1,61 @@
+"""
+Rebinning a cohort from its fragment files
+
+``FragmentCohort.from_store`` must give back the source cohort's rows under
+the same sample names, so stores at other resolutions can be used wherever
+the source store is (``ModelServer`` sample lookups, ``qc()`` joins).
+"""
+
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+from app.ml.epigenetic_analysis.cohort import build_cohort
+from app.ml.epigenetic_analysis.fragment_file import FragmentCohort, convert_beds
+
+NUM_BINS = 500
+
+
+def write_bed(path: str, seed: int) -> None:
+    """A small paired-end BED with both mates of every pair next to each other."""
+    rng = np.random.default_rng(seed)
+    with gzip.open(path, 'wt') as f:
+        for i in range(200):
+            chrom = str(rng.choice(['chr1', 'chr7', 'chrX']))
+            start = int(rng.integers(10000, 50000000))
+            length = int(rng.integers(120, 400))
+            f.write(f"{chrom}\t{start}\t{start + 50}\tR{seed}.{i}/1\t60\t+\n")
+            f.write(f"{chrom}\t{start + length - 50}\t{start + length}\tR{seed}.{i}/2\t60\t-\n")
+
+
+@pytest.fixture(scope='module')
+def cohort(tmp_path_factory):
+    root = tmp_path_factory.mktemp('cohort')
+    bed_dir = root / 'beds'
+    bed_dir.mkdir()
+    samples = ['cancer_SRR0.bed.gz', 'cancer_SRR1.bed.gz', 'control_SRR2.bed.gz']
+    for seed, sample in enumerate(samples):
+        write_bed(os.path.join(bed_dir, sample), seed)
+    store = build_cohort(str(bed_dir), samples, str(root / 'store'), labels=['cancer', 'cancer', 'control'],
+                         num_bins=NUM_BINS, processes=1)
+    convert_beds(str(bed_dir), samples, str(root / 'fragments'), processes=1)
+    return store, str(root / 'fragments')
+
+
+def test_rebinned_store_keeps_sample_names(cohort):
+    store, fragment_dir = cohort
+    rebinned = FragmentCohort.from_store(store, fragment_dir).matrix(store.num_bins, processes=1)
+
+    assert rebinned.samples == store.samples
+    assert rebinned.labels == store.labels
+    assert list(rebinned.qc().index) == store.samples
+    np.testing.assert_array_equal(np.asarray(rebinned.counts), np.asarray(store.counts))
+
+
+def test_rebinned_store_is_reused(cohort):
+    store, fragment_dir = cohort
+    fragments = FragmentCohort.from_store(store, fragment_dir)
+    first = fragments.matrix(100, processes=1)
+    assert FragmentCohort.from_store(store, fragment_dir).matrix(100).path == first.path
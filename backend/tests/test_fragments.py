@@ -0,0 +1,99 @@
+"""
+Streaming fragment ingestion against the original whole-file pandas pairing
+
+``iter_unique_fragment_frames`` replaced a ``groupby`` over the read names
+of the whole BED file (``histogram_creation.process_bed`` before it
+streamed). Both are run on one synthetic ``bed.gz`` and must keep the same
+fragments.
+"""
+
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.ml.epigenetic_analysis.fragments import bed_histogram, iter_unique_fragment_frames
+from app.ml.epigenetic_analysis.genome import get_assembly
+
+GENOME_LENGTH = 3088269832
+NUM_BINS = 1000
+
+
+def baseline_fragments(path: str) -> pd.DataFrame:
+    """The pairing, filtering and deduplication of the original ``process_bed``."""
+    df = pd.read_csv(path, delimiter='\t', header=None)
+    df.columns = ['chrom', 'read_start', 'read_end', 'name', 'score', 'strand']
+    df['name'] = df['name'].str.rstrip('12') + '1'
+    df['frag_length'] = (df.groupby('name')['read_end'].transform('max')
+                         - df.groupby('name')['read_start'].transform('min'))
+    df = df.groupby('name', as_index=False).agg({
+        'chrom': 'first', 'read_start': 'min', 'read_end': 'max', 'strand': 'first', 'frag_length': 'first',
+    })
+    df['chrom'] = df['chrom'].str.split('_').str.get(0)
+    df = df[~df['chrom'].str.startswith('chrUn')]
+    df = df[df.frag_length <= 1000].copy()
+    for chrom, offset in get_assembly('hg38').chrom_pos().items():
+        mask = df['chrom'] == chrom
+        df.loc[mask, 'read_start'] += offset
+        df.loc[mask, 'read_end'] += offset
+    df = df.sort_values('read_start')
+    return df.drop_duplicates(subset=['read_start', 'read_end'], keep='first')
+
+
+@pytest.fixture(scope='module')
+def bed_path(tmp_path_factory):
+    """
+    A shuffled paired-end BED: mates far apart in the file, duplicate
+    fragments under other read names, unpaired reads, a ``chrUn`` contig
+    and discordant pairs longer than 1000 bp.
+    """
+    rng = np.random.default_rng(7)
+    records = []
+    for i in range(300):
+        chrom = str(rng.choice(['chr1', 'chr2', 'chrX', 'chrUn_KI270302v1']))
+        start = int(rng.integers(10000, 200000))
+        length = int(rng.integers(100, 400)) if i % 25 else 5000
+        read = int(rng.integers(30, 60))
+        strand = str(rng.choice(['+', '-']))
+        mate = '-' if strand == '+' else '+'
+        # Read names ending in mate-like digits must still pair only by their /1 /2 suffix
+        name = f'SRR{i}.{i * 12 + 1}'
+        records.append((chrom, start, start + read, f'{name}/1', 60, strand))
+        if i % 40 == 3:
+            continue  # unpaired read
+        records.append((chrom, start + length - read, start + length, f'{name}/2', 60, mate))
+        if i % 10 == 0:
+            # The same fragment again, as a PCR duplicate
+            records.append((chrom, start, start + read, f'DUP{i}/1', 60, strand))
+            records.append((chrom, start + length - read, start + length, f'DUP{i}/2', 60, mate))
+
+    order = rng.permutation(len(records))
+    path = tmp_path_factory.mktemp('bed') / 'sample.bed.gz'
+    with gzip.open(path, 'wt') as f:
+        for row in order:
+            f.write('\t'.join(map(str, records[row])) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', [5, 64, 100000])
+def test_unique_fragments_match_baseline(bed_path, chunk_size):
+    expected = baseline_fragments(bed_path)
+    frames = list(iter_unique_fragment_frames(bed_path, chunk_size))
+    fragments = pd.concat(frames, ignore_index=True)
+
+    assert len(fragments) == len(expected)
+    pairs = np.sort(fragments['read_start'].to_numpy() * GENOME_LENGTH + fragments['read_end'].to_numpy())
+    expected_pairs = np.sort(expected['read_start'].to_numpy() * GENOME_LENGTH + expected['read_end'].to_numpy())
+    np.testing.assert_array_equal(pairs, expected_pairs)
+    np.testing.assert_array_equal(fragments['frag_length'], fragments['read_end'] - fragments['read_start'])
+    for frame in frames:
+        assert frame['read_start'].is_monotonic_increasing
+
+
+@pytest.mark.parametrize('chunk_size', [5, 100000])
+def test_histogram_matches_baseline(bed_path, chunk_size):
+    expected = baseline_fragments(bed_path)
+    edges = np.linspace(0, GENOME_LENGTH, NUM_BINS + 1)
+    expected_hist = np.histogram(np.concatenate([expected['read_start'], expected['read_end']]), bins=edges)[0]
+    np.testing.assert_array_equal(bed_histogram(bed_path, NUM_BINS, chunk_size), expected_hist)